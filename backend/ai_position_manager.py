@@ -1,149 +1,96 @@
 """
 AI-Powered Position Manager
-Überwacht ALLE offenen Positionen (manuell & automatisch) und schließt sie intelligent
+Regeln zum Schließen ALLER offenen Positionen (manuell & automatisch);
+angewendet werden sie im Position Sweep (position_sweep.py)
 """
 
 import logging
-from datetime import datetime, timezone
+from typing import Dict, Optional
 
 logger = logging.getLogger(__name__)
 
 
-async def manage_open_positions(db, current_prices: dict, settings):
+def evaluate_position(trade: dict, current_price: float, market_signal: Optional[dict]) -> Optional[str]:
     """
-    KI-gestützte Positionsverwaltung für ALLE offenen Trades
-    Schließt Positionen automatisch bei:
-    - Stop Loss erreicht
-    - Take Profit erreicht
-    - KI-Signal zum Schließen (Trendwende)
+    KI-Regeln für eine offene Position
+
+    Args:
+        trade: Offener Trade
+        current_price: Aktueller Preis der Commodity
+        market_signal: {'signal', 'trend'} der Commodity (None wenn unbekannt)
+
+    Returns:
+        Schließgrund oder None
     """
-    try:
-        if not settings or not settings.get('use_ai_analysis'):
-            return
-        
-        # Hole alle offenen Positionen
-        open_trades = await db.trades.find({"status": "OPEN"}).to_list(1000)
-        
-        if not open_trades:
-            return
-        
-        logger.info(f"AI Position Manager: Überwache {len(open_trades)} offene Positionen")
-        
-        closed_count = 0
-        
-        for trade in open_trades:
-            commodity = trade.get('commodity', 'WTI_CRUDE')
-            current_price = current_prices.get(commodity)
-            
-            if not current_price:
-                continue
-            
-            trade_type = trade.get('type')
-            entry_price = trade.get('entry_price')
-            stop_loss = trade.get('stop_loss')
-            take_profit = trade.get('take_profit')
-            quantity = trade.get('quantity', 1.0)
-            
-            should_close = False
-            close_reason = None
-            
-            # BUY Position Management
-            if trade_type == 'BUY':
-                # Gewinn berechnen
-                profit = (current_price - entry_price) * quantity
-                profit_percent = ((current_price - entry_price) / entry_price) * 100
-                
-                # Take Profit erreicht?
-                if take_profit and current_price >= take_profit:
-                    should_close = True
-                    close_reason = f"Take Profit erreicht (+{profit_percent:.2f}%)"
-                
-                # Stop Loss erreicht?
-                elif stop_loss and current_price <= stop_loss:
-                    should_close = True
-                    close_reason = f"Stop Loss getroffen ({profit_percent:.2f}%)"
-                
-                # KI-Signal: Markt dreht, raus mit Gewinn
-                elif profit_percent > 1.0:  # Mindestens 1% Gewinn
-                    # Hole aktuelles Market Signal
-                    market_data = await db.market_data.find_one(
-                        {"commodity": commodity},
-                        sort=[("timestamp", -1)]
-                    )
-                    
-                    if market_data:
-                        signal = market_data.get('signal')
-                        trend = market_data.get('trend')
-                        
-                        # Schließe bei SELL Signal oder Trendwende
-                        if signal == 'SELL' or trend == 'DOWN':
-                            should_close = True
-                            close_reason = f"KI-Signal: Trendwende erkannt (Gewinn sichern: +{profit_percent:.2f}%)"
-                
-                # Sicherung bei hohem Gewinn (Trailing-ähnlich)
-                elif profit_percent > 5.0:
-                    should_close = True
-                    close_reason = f"Gewinnmitnahme bei +{profit_percent:.2f}%"
-            
-            # SELL Position Management
-            elif trade_type == 'SELL':
-                # Gewinn berechnen (bei SELL profitiert man von fallendem Preis)
-                profit = (entry_price - current_price) * quantity
-                profit_percent = ((entry_price - current_price) / entry_price) * 100
-                
-                # Take Profit erreicht?
-                if take_profit and current_price <= take_profit:
-                    should_close = True
-                    close_reason = f"Take Profit erreicht (+{profit_percent:.2f}%)"
-                
-                # Stop Loss erreicht?
-                elif stop_loss and current_price >= stop_loss:
-                    should_close = True
-                    close_reason = f"Stop Loss getroffen ({profit_percent:.2f}%)"
-                
-                # KI-Signal: Markt dreht, raus mit Gewinn
-                elif profit_percent > 1.0:
-                    market_data = await db.market_data.find_one(
-                        {"commodity": commodity},
-                        sort=[("timestamp", -1)]
-                    )
-                    
-                    if market_data:
-                        signal = market_data.get('signal')
-                        trend = market_data.get('trend')
-                        
-                        # Schließe bei BUY Signal oder Trendwende
-                        if signal == 'BUY' or trend == 'UP':
-                            should_close = True
-                            close_reason = f"KI-Signal: Trendwende erkannt (Gewinn sichern: +{profit_percent:.2f}%)"
-                
-                # Sicherung bei hohem Gewinn
-                elif profit_percent > 5.0:
-                    should_close = True
-                    close_reason = f"Gewinnmitnahme bei +{profit_percent:.2f}%"
-            
-            # Position schließen?
-            if should_close:
-                profit_loss = (current_price - entry_price) * quantity if trade_type == 'BUY' else (entry_price - current_price) * quantity
-                
-                await db.trades.update_one(
-                    {"id": trade['id']},
-                    {
-                        "$set": {
-                            "status": "CLOSED",
-                            "exit_price": current_price,
-                            "profit_loss": profit_loss,
-                            "closed_at": datetime.now(timezone.utc),
-                            "strategy_signal": close_reason
-                        }
-                    }
-                )
-                
-                closed_count += 1
-                logger.info(f"✅ Position geschlossen: {commodity} {trade_type} - {close_reason} (P/L: {profit_loss:.2f})")
-        
-        if closed_count > 0:
-            logger.info(f"AI Position Manager: {closed_count} Positionen geschlossen")
-    
-    except Exception as e:
-        logger.error(f"Error in AI Position Manager: {e}")
+    trade_type = trade.get('type')
+    entry_price = trade.get('entry_price')
+    stop_loss = trade.get('stop_loss')
+    take_profit = trade.get('take_profit')
+
+    if not entry_price or trade_type not in ('BUY', 'SELL'):
+        return None
+
+    signal = (market_signal or {}).get('signal')
+    trend = (market_signal or {}).get('trend')
+
+    # BUY Position Management
+    if trade_type == 'BUY':
+        profit_percent = ((current_price - entry_price) / entry_price) * 100
+
+        # Take Profit erreicht?
+        if take_profit and current_price >= take_profit:
+            return f"Take Profit erreicht (+{profit_percent:.2f}%)"
+
+        # Stop Loss erreicht?
+        if stop_loss and current_price <= stop_loss:
+            return f"Stop Loss getroffen ({profit_percent:.2f}%)"
+
+        # KI-Signal: Markt dreht, raus mit Gewinn (mindestens 1% Gewinn)
+        if profit_percent > 1.0:
+            # Schließe bei SELL Signal oder Trendwende
+            if market_signal and (signal == 'SELL' or trend == 'DOWN'):
+                return f"KI-Signal: Trendwende erkannt (Gewinn sichern: +{profit_percent:.2f}%)"
+
+    # SELL Position Management (bei SELL profitiert man von fallendem Preis)
+    else:
+        profit_percent = ((entry_price - current_price) / entry_price) * 100
+
+        # Take Profit erreicht?
+        if take_profit and current_price <= take_profit:
+            return f"Take Profit erreicht (+{profit_percent:.2f}%)"
+
+        # Stop Loss erreicht?
+        if stop_loss and current_price >= stop_loss:
+            return f"Stop Loss getroffen ({profit_percent:.2f}%)"
+
+        # KI-Signal: Markt dreht, raus mit Gewinn
+        if profit_percent > 1.0:
+            # Schließe bei BUY Signal oder Trendwende
+            if market_signal and (signal == 'BUY' or trend == 'UP'):
+                return f"KI-Signal: Trendwende erkannt (Gewinn sichern: +{profit_percent:.2f}%)"
+
+    return None
+
+
+def position_profit_loss(trade: dict, current_price: float) -> float:
+    quantity = trade.get('quantity', 1.0)
+    if trade.get('type') == 'BUY':
+        return (current_price - trade['entry_price']) * quantity
+    return (trade['entry_price'] - current_price) * quantity
+
+
+async def load_market_signals(db, commodities) -> Dict[str, dict]:
+    """Latest signal/trend per commodity with a single `$in` query"""
+    docs = await db.market_data.find(
+        {"commodity": {"$in": list(commodities)}},
+        {"_id": 0, "commodity": 1, "signal": 1, "trend": 1, "timestamp": 1}
+    ).to_list(None)
+
+    signals = {}
+    for doc in docs:
+        current = signals.get(doc['commodity'])
+        # market_data holds one document per commodity - keep the newest if there are more
+        if current is None or (doc.get('timestamp') and current.get('timestamp') and doc['timestamp'] > current['timestamp']):
+            signals[doc['commodity']] = doc
+    return signals
+
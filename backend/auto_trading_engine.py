@@ -2,91 +2,43 @@
 Auto-Trading Engine - LIVE TICKER MODE
 Führt Trades automatisch basierend auf Live-Signalen aus
 """
-import asyncio
 import logging
 from datetime import datetime, timezone
 
+from trade_writes import insert_trade
+from trading_pipeline import get_trading_pipeline, fetch_live_tick
+from market_scheduler import get_market_scheduler
+
 logger = logging.getLogger(__name__)
 
 class AutoTradingEngine:
-    def __init__(self, db):
+    def __init__(self, db, market_state=None):
         self.db = db
         self.running = False
-        self.last_checked = {}  # Verhindert doppelte Trades
+        # Geteilter Marktdaten-Cache (server.latest_market_data)
+        self.market_state = market_state if market_state is not None else {}
+        self.pipeline = get_trading_pipeline(db, self.market_state, self._execute_auto_trade)
+        # Live-Ticks pro Commodity in adaptiven Intervallen -> Pipeline
+        self.scheduler = get_market_scheduler(db, self.pipeline.submit_tick, fetch_live_tick)
         
     async def start(self):
-        """Start auto-trading engine"""
+        """Start auto-trading engine (event-driven pipeline instead of a polling loop)"""
         self.running = True
-        logger.info("🚀 Auto-Trading Engine gestartet (LIVE TICKER MODE)")
-        
-        while self.running:
-            try:
-                # Prüfe ob Auto-Trading aktiviert ist
-                settings = await self.db.trading_settings.find_one({"id": "trading_settings"})
-                
-                if settings and settings.get('auto_trading'):
-                    await self.check_and_execute_trades(settings)
-                else:
-                    logger.debug("Auto-Trading ist deaktiviert")
-                
-                # Warte 10 Sekunden (Live-Ticker Mode)
-                await asyncio.sleep(10)
-                
-            except Exception as e:
-                logger.error(f"❌ Auto-Trading Engine Error: {e}")
-                await asyncio.sleep(10)
+        self.pipeline.start(validate=self._validate_trade_conditions)
+        self.scheduler.start()
+        logger.info("🚀 Auto-Trading Engine gestartet (LIVE TICKER MODE - Pipeline)")
     
-    def stop(self):
+    async def stop(self):
         """Stop auto-trading engine"""
         self.running = False
+        await self.scheduler.stop()
+        await self.pipeline.stop()
         logger.info("⏹️ Auto-Trading Engine gestoppt")
     
-    async def check_and_execute_trades(self, settings):
-        """Prüft alle Signale und führt Trades aus"""
-        try:
-            # Hole aktuelle Marktdaten
-            from server import latest_market_data
-            
-            if not latest_market_data:
-                return
-            
-            # Hole offene Trades für Risk-Management
-            open_trades = await self.db.trades.find({"status": "OPEN"}).to_list(100)
-            
-            # Prüfe jede Commodity
-            for commodity_id, market_data in latest_market_data.items():
-                signal = market_data.get('signal')
-                
-                # Nur bei klarem BUY/SELL Signal
-                if signal not in ['BUY', 'SELL']:
-                    continue
-                
-                # Prüfe ob wir bereits einen Trade für diese Commodity haben
-                has_open_trade = any(t.get('commodity') == commodity_id and t.get('status') == 'OPEN' for t in open_trades)
-                if has_open_trade:
-                    logger.debug(f"⏭️ {commodity_id}: Bereits offener Trade vorhanden")
-                    continue
-                
-                # Prüfe ob wir kürzlich geprüft haben (Cooldown 60 Sekunden)
-                last_check = self.last_checked.get(commodity_id)
-                if last_check:
-                    time_since_check = (datetime.now(timezone.utc) - last_check).total_seconds()
-                    if time_since_check < 60:
-                        continue
-                
-                # Prüfe zusätzliche AI-Bedingungen
-                if not self._validate_trade_conditions(market_data, signal, settings):
-                    logger.info(f"⚠️ {commodity_id}: Signal {signal}, aber Bedingungen nicht erfüllt")
-                    continue
-                
-                # Führe Trade aus!
-                await self._execute_auto_trade(commodity_id, signal, market_data, settings, open_trades)
-                
-                # Markiere als geprüft
-                self.last_checked[commodity_id] = datetime.now(timezone.utc)
-                
-        except Exception as e:
-            logger.error(f"Error in check_and_execute_trades: {e}")
+    @property
+    def last_checked(self):
+        """Letzter Order-Versuch pro Commodity (Cooldown)"""
+        return self.pipeline.last_checked
     
     def _validate_trade_conditions(self, market_data, signal, settings):
         """Validiert ob Trade-Bedingungen erfüllt sind"""
@@ -105,7 +57,7 @@ class AutoTradingEngine:
         
         return False
     
-    async def _execute_auto_trade(self, commodity_id, signal, market_data, settings, open_trades):
+    async def _execute_auto_trade(self, commodity_id, signal, market_data, settings):
         """Führt automatischen Trade aus"""
         try:
             from commodity_processor import COMMODITIES, calculate_position_size
@@ -197,6 +149,7 @@ class AutoTradingEngine:
                 logger.info(f"✅ AUTO-TRADE ERFOLGREICH: {commodity_id} {signal} Ticket #{ticket}")
                 
                 # Speichere in DB
+                now = datetime.now(timezone.utc)
                 trade_doc = {
                     "id": str(uuid.uuid4()),
                     "commodity": commodity_id,
@@ -209,13 +162,15 @@ class AutoTradingEngine:
                     "take_profit": take_profit,
                     "strategy_signal": f"AUTO-{signal} RSI:{market_data.get('rsi', 50):.1f}",
                     "status": "OPEN",
-                    "created_at": datetime.now(timezone.utc).isoformat(),
-                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                    "timestamp": now,  # Sortierschlüssel für /trades/list
+                    "created_at": now,
+                    "updated_at": now,
                     "closed_at": None,
-                    "mt5_ticket": ticket
+                    "mt5_ticket": ticket,
+                    "broker_stop_loss": stop_loss  # Mit der Order an den Broker gesendet
                 }
                 
-                await self.db.trades.insert_one(trade_doc)
+                await insert_trade(self.db, trade_doc)
                 logger.info(f"💾 Trade gespeichert in DB")
                 
             else:
@@ -228,9 +183,9 @@ class AutoTradingEngine:
 # Global instance
 _auto_trading_engine = None
 
-def get_auto_trading_engine(db):
+def get_auto_trading_engine(db, market_state=None):
     """Get or create auto-trading engine instance"""
     global _auto_trading_engine
     if _auto_trading_engine is None:
-        _auto_trading_engine = AutoTradingEngine(db)
+        _auto_trading_engine = AutoTradingEngine(db, market_state)
     return _auto_trading_engine
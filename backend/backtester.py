@@ -0,0 +1,443 @@
+"""
+Backtester - historische Kerzen durch die Live-Signalregeln spielen
+Signale und Ausstiege werden mit NumPy vektorisiert berechnet:
+- Indikatoren wie calculate_indicators (ta): RSI 14, EMA 20, MACD 12/26/9
+- Signalregel "rsi" (Standard): RSI-Schwellen aus den Settings wie in
+  build_market_data / der Trading Pipeline
+- Signalregel "macd": die Regeln von generate_signal
+- Einstieg zum Schlusskurs der Signalkerze, höchstens eine offene Position
+  pro Commodity (wie die Risiko-Prüfung der Pipeline)
+- Ausstieg über Stop Loss / Take Profit und optional Trailing Stop wie in
+  trailing_stop.py: der Stop wird nach jedem Schlusskurs nachgezogen und gilt
+  ab der nächsten Kerze. Ausgelöst wird über Hoch/Tief der Kerze, bei einer
+  Kurslücke zum Eröffnungskurs. Treffen SL und TP in derselben Kerze, zählt
+  der Stop Loss (wie StopIndex.triggered).
+
+Pro Trade wird nur das Fenster ab dem Einstieg durchsucht (in wachsenden
+Blöcken), die Laufzeit wächst also mit der Zahl der Trades, nicht mit
+Kerzen × Trades.
+
+CLI:
+    python backtester.py --commodities GOLD SILVER --timeframe 1h --period 2y --trailing
+"""
+
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Strategy parameters of TradingSettings that a backtest varies
+STRATEGY_PARAMS = {
+    "rsi_oversold_threshold": 30.0,
+    "rsi_overbought_threshold": 70.0,
+    "stop_loss_percent": 2.0,
+    "take_profit_percent": 4.0,
+    "trailing_stop_distance": 1.5,
+}
+
+SIGNAL_RULES = ("rsi", "macd")
+EXIT_REASONS = ("STOP_LOSS", "TAKE_PROFIT", "END")
+RSI_PERIOD = 14
+MAX_CANDLES = 50_000  # Per commodity; older candles are dropped
+_FIRST_WINDOW = 256
+
+
+def strategy_params(settings: Optional[Dict] = None, **overrides) -> Dict[str, float]:
+    """Strategy parameters from trading settings (defaults for missing keys) plus overrides"""
+    params = dict(STRATEGY_PARAMS)
+    for key in STRATEGY_PARAMS:
+        if settings and settings.get(key) is not None:
+            params[key] = float(settings[key])
+    params.update({k: float(v) for k, v in overrides.items() if k in STRATEGY_PARAMS and v is not None})
+    return params
+
+
+# ----------------------------------------------------------------------
+# Indicators and signals
+# ----------------------------------------------------------------------
+def _ewm(values: pd.Series, **kwargs) -> pd.Series:
+    return values.ewm(adjust=False, **kwargs).mean()
+
+
+def compute_indicators(close: np.ndarray) -> Dict[str, np.ndarray]:
+    """RSI 14, EMA 20 and MACD 12/26/9 - same definitions as the ta indicators in calculate_indicators"""
+    series = pd.Series(close, dtype=float)
+
+    diff = series.diff(1)
+    gain = diff.where(diff > 0, 0.0)
+    loss = -diff.where(diff < 0, 0.0)
+    avg_gain = _ewm(gain, alpha=1.0 / RSI_PERIOD, min_periods=RSI_PERIOD)
+    avg_loss = _ewm(loss, alpha=1.0 / RSI_PERIOD, min_periods=RSI_PERIOD)
+    rsi = (100 - 100 / (1 + avg_gain / avg_loss)).where(avg_loss != 0, 100.0).where(avg_gain.notna())
+
+    ema_fast = _ewm(series, span=12, min_periods=12)
+    ema_slow = _ewm(series, span=26, min_periods=26)
+    macd = ema_fast - ema_slow
+    macd_signal = _ewm(macd, span=9, min_periods=9)
+
+    return {
+        "rsi": rsi.to_numpy(),
+        "ema_20": _ewm(series, span=20, min_periods=20).to_numpy(),
+        "macd": macd.to_numpy(),
+        "macd_signal": macd_signal.to_numpy(),
+    }
+
+
+def generate_signals(close: np.ndarray, indicators: Dict[str, np.ndarray], params: Dict[str, float],
+                     rule: str = "rsi") -> np.ndarray:
+    """Signal per candle: 1 = BUY, -1 = SELL, 0 = HOLD"""
+    rsi = indicators["rsi"]
+    signals = np.zeros(len(close), dtype=np.int8)
+
+    with np.errstate(invalid='ignore'):
+        if rule == "rsi":
+            signals[rsi < params["rsi_oversold_threshold"]] = 1
+            signals[rsi > params["rsi_overbought_threshold"]] = -1
+        elif rule == "macd":
+            macd, macd_signal, ema = indicators["macd"], indicators["macd_signal"], indicators["ema_20"]
+            valid = ~(np.isnan(rsi) | np.isnan(macd) | np.isnan(macd_signal))
+            up = close > ema * 1.002
+            down = close < ema * 0.998
+            rising = macd > macd_signal
+            falling = macd < macd_signal
+            # Same precedence as the elif chain of generate_signal
+            conditions = [
+                (rsi < 35) & rising,
+                up & (rsi < 60) & rising,
+                (rsi > 65) & falling,
+                down & (rsi > 40) & falling,
+            ]
+            signals = np.select(conditions, [1, 1, -1, -1], default=0).astype(np.int8)
+            signals[~valid] = 0
+        else:
+            raise ValueError(f"Unknown signal rule: {rule}")
+
+    return signals
+
+
+# ----------------------------------------------------------------------
+# Fills
+# ----------------------------------------------------------------------
+def _find_exit(candles: Dict[str, np.ndarray], entry: int, side: int, params: Dict[str, float],
+               use_trailing: bool):
+    """(exit index, exit price, reason code) of the position opened at the close of `entry`"""
+    open_, high, low, close = candles["open"], candles["high"], candles["low"], candles["close"]
+    n = len(close)
+    entry_price = close[entry]
+    sl_pct = params["stop_loss_percent"] / 100
+    tp_pct = params["take_profit_percent"] / 100
+    distance = params["trailing_stop_distance"] / 100
+
+    if side > 0:
+        stop = entry_price * (1 - sl_pct)
+        take_profit = entry_price * (1 + tp_pct)
+    else:
+        stop = entry_price * (1 + sl_pct)
+        take_profit = entry_price * (1 - tp_pct)
+
+    # Trailing reference carried across windows: best close since the entry (entry close included)
+    extreme = entry_price
+    start = entry + 1
+    window = _FIRST_WINDOW
+    while start < n:
+        end = min(n, start + window)
+        if use_trailing:
+            # Stop in force during candle t = best close of entry..t-1, trailed, never loosened
+            closes = np.concatenate(([extreme], close[start:end - 1]))
+            if side > 0:
+                best = np.maximum.accumulate(closes)
+                stops = np.maximum(stop, best * (1 - distance))
+            else:
+                best = np.minimum.accumulate(closes)
+                stops = np.minimum(stop, best * (1 + distance))
+        else:
+            stops = np.full(end - start, stop)
+
+        if side > 0:
+            hit_sl = low[start:end] <= stops
+            hit_tp = high[start:end] >= take_profit
+        else:
+            hit_sl = high[start:end] >= stops
+            hit_tp = low[start:end] <= take_profit
+        hit = hit_sl | hit_tp
+
+        if hit.any():
+            offset = int(np.argmax(hit))
+            t = start + offset
+            if hit_sl[offset]:
+                level = stops[offset]
+                gapped = open_[t] <= level if side > 0 else open_[t] >= level
+                return t, (open_[t] if gapped else level), 0
+            gapped = open_[t] >= take_profit if side > 0 else open_[t] <= take_profit
+            return t, (open_[t] if gapped else take_profit), 1
+
+        if use_trailing:
+            extreme = best[-1]
+            last = close[end - 1]
+            extreme = max(extreme, last) if side > 0 else min(extreme, last)
+            stop = stops[-1]
+        start = end
+        window *= 2
+
+    # Still open at the end of the data: marked to the last close
+    return n - 1, close[n - 1], 2
+
+
+def simulate(candles: Dict[str, np.ndarray], signals: np.ndarray, params: Dict[str, float],
+             use_trailing: bool = False) -> Dict[str, np.ndarray]:
+    """Trades of one commodity: at most one open position, next entry on the first signal after the exit"""
+    signal_idx = np.flatnonzero(signals)
+    entries, exits, sides, entry_prices, exit_prices, reasons = [], [], [], [], [], []
+
+    next_free = 0
+    while True:
+        k = np.searchsorted(signal_idx, next_free)
+        if k >= len(signal_idx):
+            break
+        entry = int(signal_idx[k])
+        if entry >= len(signals) - 1:
+            break  # No candle left to hold the position
+        side = int(signals[entry])
+        exit_idx, exit_price, reason = _find_exit(candles, entry, side, params, use_trailing)
+
+        entries.append(entry)
+        exits.append(exit_idx)
+        sides.append(side)
+        entry_prices.append(candles["close"][entry])
+        exit_prices.append(exit_price)
+        reasons.append(reason)
+        if reason == 2:
+            break
+        next_free = exit_idx  # The exit candle's close may already open the next position
+
+    entry_prices = np.asarray(entry_prices, dtype=float)
+    exit_prices = np.asarray(exit_prices, dtype=float)
+    sides = np.asarray(sides, dtype=np.int8)
+    return {
+        "entry_idx": np.asarray(entries, dtype=np.int64),
+        "exit_idx": np.asarray(exits, dtype=np.int64),
+        "side": sides,
+        "entry_price": entry_prices,
+        "exit_price": exit_prices,
+        "reason": np.asarray(reasons, dtype=np.int8),
+        "return_pct": (exit_prices - entry_prices) / entry_prices * sides * 100 if len(sides) else np.empty(0),
+    }
+
+
+# ----------------------------------------------------------------------
+# Metrics
+# ----------------------------------------------------------------------
+def _round(value, digits: int = 4):
+    if value is None or not math.isfinite(value):
+        return None
+    return round(float(value), digits)
+
+
+def compute_metrics(returns_pct: np.ndarray, bars_in_market: int = 0, n_bars: int = 0) -> Dict:
+    """Trade statistics; returns compound per trade, drawdown on the compounded equity curve"""
+    returns_pct = np.asarray(returns_pct, dtype=float)
+    trades = len(returns_pct)
+    if trades == 0:
+        return {"trades": 0, "win_rate": None, "total_return_pct": 0.0, "avg_trade_pct": None,
+                "profit_factor": None, "max_drawdown_pct": 0.0, "sharpe": None,
+                "exposure_pct": 0.0 if n_bars else None}
+
+    equity = np.cumprod(1 + returns_pct / 100)
+    peak = np.maximum.accumulate(np.concatenate(([1.0], equity)))[1:]
+    drawdown = (peak - equity) / peak
+
+    gains = returns_pct[returns_pct > 0].sum()
+    losses = -returns_pct[returns_pct < 0].sum()
+    std = returns_pct.std(ddof=1) if trades > 1 else 0.0
+
+    return {
+        "trades": trades,
+        "win_rate": _round((returns_pct > 0).mean() * 100, 2),
+        "total_return_pct": _round((equity[-1] - 1) * 100),
+        "avg_trade_pct": _round(returns_pct.mean()),
+        "profit_factor": _round(gains / losses) if losses > 0 else None,
+        "max_drawdown_pct": _round(drawdown.max() * 100),
+        "sharpe": _round(returns_pct.mean() / std * math.sqrt(trades)) if std > 0 else None,  # Per-trade, not annualized
+        "exposure_pct": _round(bars_in_market / n_bars * 100, 2) if n_bars else None,
+    }
+
+
+METRICS = ("total_return_pct", "sharpe", "profit_factor", "win_rate", "avg_trade_pct", "max_drawdown_pct", "trades")
+
+
+# ----------------------------------------------------------------------
+# Backtests
+# ----------------------------------------------------------------------
+def candles_from_frame(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """OHLC arrays (and epoch seconds) from a commodity_processor OHLCV DataFrame"""
+    df = df.dropna(subset=["Close"])
+    close = df["Close"].to_numpy(dtype=float)
+    candles = {"close": close}
+    for key, column in (("open", "Open"), ("high", "High"), ("low", "Low")):
+        candles[key] = df[column].fillna(df["Close"]).to_numpy(dtype=float) if column in df.columns else close
+    candles["time"] = np.array([ts.timestamp() for ts in df.index], dtype=float)
+    return candles
+
+
+def backtest_candles(candles: Dict[str, np.ndarray], params: Dict[str, float], rule: str = "rsi",
+                     use_trailing: bool = False, indicators: Optional[Dict[str, np.ndarray]] = None,
+                     start: int = 0, end: Optional[int] = None, include_trades: bool = False) -> Dict:
+    """
+    Backtest one commodity
+
+    Args:
+        candles: open/high/low/close (+ time) arrays
+        params: Strategy parameters (see STRATEGY_PARAMS)
+        indicators: Precomputed compute_indicators(close) - independent of the parameters,
+                    so sweeps compute them once
+        start, end: Candle range to trade in (indicators still use the history before `start`)
+    """
+    close = candles["close"]
+    end = len(close) if end is None else end
+    if indicators is None:
+        indicators = compute_indicators(close[:end])
+
+    view = {key: values[start:end] for key, values in candles.items()}
+    signals = generate_signals(view["close"], {k: v[start:end] for k, v in indicators.items()}, params, rule)
+    trades = simulate(view, signals, params, use_trailing)
+
+    bars_in_market = int((trades["exit_idx"] - trades["entry_idx"]).sum())
+    result = {"candles": int(end - start), **compute_metrics(trades["return_pct"], bars_in_market, end - start)}
+
+    if include_trades:
+        times = view.get("time")
+        result["trades_list"] = [
+            {
+                "type": "BUY" if side > 0 else "SELL",
+                "entry_time": _iso(times, i) if times is not None else int(i),
+                "exit_time": _iso(times, j) if times is not None else int(j),
+                "entry_price": _round(entry_price),
+                "exit_price": _round(exit_price),
+                "return_pct": _round(ret),
+                "reason": EXIT_REASONS[reason],
+            }
+            for i, j, side, entry_price, exit_price, ret, reason in zip(
+                trades["entry_idx"], trades["exit_idx"], trades["side"], trades["entry_price"],
+                trades["exit_price"], trades["return_pct"], trades["reason"])
+        ]
+    result["_returns"] = trades["return_pct"]
+    result["_exit_times"] = view["time"][trades["exit_idx"]] if "time" in view else trades["exit_idx"].astype(float)
+    return result
+
+
+def _iso(times: np.ndarray, index: int) -> str:
+    return pd.Timestamp(times[index], unit="s", tz="UTC").isoformat()
+
+
+def aggregate_results(results: Dict[str, Dict]) -> Dict:
+    """Portfolio view: capital split equally over the commodities, trades compounded in exit order"""
+    returns = [r["_returns"] for r in results.values() if len(r["_returns"])]
+    if not returns:
+        return compute_metrics(np.empty(0))
+    exit_times = np.concatenate([r["_exit_times"] for r in results.values() if len(r["_returns"])])
+    order = np.argsort(exit_times, kind="stable")
+    scaled = np.concatenate(returns)[order] / max(len(results), 1)
+    metrics = compute_metrics(scaled)
+    metrics["trades"] = int(sum(len(r) for r in returns))
+    return metrics
+
+
+def public_result(result: Dict) -> Dict:
+    return {k: v for k, v in result.items() if not k.startswith("_")}
+
+
+async def load_candles(commodity_ids: List[str], timeframe: str = "1h", period: str = "2y",
+                       max_candles: int = MAX_CANDLES, concurrency: int = 4) -> Dict[str, Dict[str, np.ndarray]]:
+    """Historical candles per commodity from the OHLCV sources (MetaAPI → yfinance, cached)"""
+    from commodity_processor import fetch_historical_ohlcv_async
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(commodity_id):
+        async with semaphore:
+            return await fetch_historical_ohlcv_async(commodity_id, timeframe=timeframe, period=period)
+
+    frames = await asyncio.gather(*[fetch(commodity_id) for commodity_id in commodity_ids], return_exceptions=True)
+    candles = {}
+    for commodity_id, df in zip(commodity_ids, frames):
+        if isinstance(df, Exception) or df is None or df.empty or "Close" not in df.columns:
+            logger.warning(f"Backtest: no candles for {commodity_id}")
+            continue
+        # Frame conversion is CPU work as well - keep it off the event loop
+        candles[commodity_id] = await asyncio.to_thread(candles_from_frame, df.iloc[-max_candles:])
+    return candles
+
+
+async def run_backtest(commodity_ids: List[str], params: Dict[str, float], timeframe: str = "1h",
+                       period: str = "2y", rule: str = "rsi", use_trailing: bool = False,
+                       include_trades: bool = False) -> Dict:
+    """Load candles and backtest all commodities; returns per-commodity and portfolio metrics"""
+    candles = await load_candles(commodity_ids, timeframe, period)
+
+    def simulate_all():
+        return {
+            commodity_id: backtest_candles(data, params, rule, use_trailing, include_trades=include_trades)
+            for commodity_id, data in candles.items()
+        }
+
+    started = time.monotonic()
+    # Simulation off the event loop (API requests, lease heartbeats keep running)
+    results = await asyncio.to_thread(simulate_all)
+    duration_ms = round((time.monotonic() - started) * 1000, 1)
+    logger.info(f"Backtest: {len(results)} commodities, {sum(r['candles'] for r in results.values())} candles in {duration_ms}ms")
+
+    portfolio = await asyncio.to_thread(aggregate_results, results)
+    return {
+        "params": params,
+        "rule": rule,
+        "use_trailing_stop": use_trailing,
+        "timeframe": timeframe,
+        "period": period,
+        "duration_ms": duration_ms,
+        "portfolio": portfolio,
+        "commodities": {commodity_id: public_result(r) for commodity_id, r in results.items()},
+        "missing": sorted(set(commodity_ids) - set(candles)),
+    }
+
+
+async def _main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Strategie auf historischen Kerzen testen")
+    parser.add_argument("--commodities", nargs="+", default=["WTI_CRUDE"])
+    parser.add_argument("--timeframe", default="1h")
+    parser.add_argument("--period", default="2y")
+    parser.add_argument("--rule", choices=SIGNAL_RULES, default="rsi")
+    parser.add_argument("--trailing", action="store_true", help="Trailing Stop verwenden")
+    for key, default in STRATEGY_PARAMS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=float, default=default)
+    parser.add_argument("--trades", action="store_true", help="Einzelne Trades ausgeben")
+    args = parser.parse_args()
+
+    params = strategy_params(**{key: getattr(args, key) for key in STRATEGY_PARAMS})
+    result = await run_backtest(args.commodities, params, args.timeframe, args.period, args.rule,
+                                args.trailing, include_trades=args.trades)
+
+    print("=" * 80)
+    print(f"BACKTEST: {', '.join(args.commodities)} ({args.timeframe}, {args.period}, Regel {args.rule})")
+    print("=" * 80)
+    for commodity_id, metrics in result["commodities"].items():
+        print(f"  {commodity_id:12} {metrics['trades']:5} Trades  Return {metrics['total_return_pct']:>9}%  "
+              f"Win {metrics['win_rate']}%  MaxDD {metrics['max_drawdown_pct']}%")
+    portfolio = result["portfolio"]
+    print(f"  {'PORTFOLIO':12} {portfolio['trades']:5} Trades  Return {portfolio['total_return_pct']:>9}%  "
+          f"MaxDD {portfolio['max_drawdown_pct']}%  ({result['duration_ms']}ms)")
+    if args.trades:
+        print(json.dumps(result["commodities"], indent=2, default=str))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,136 @@
+"""
+Broker Stop Sync - Trailing Stops an MetaAPI übertragen
+Der Position Sweep ändert nur den stop_loss in MongoDB. Diese Stufe
+überträgt die Änderungen per POSITION_MODIFY an den Broker, ohne bei jeder
+kleinen Preisbewegung einen API-Call auszulösen:
+- Coalescing: pro Position zählt nur der zuletzt gewünschte Stop
+- Debounce: gesendet wird erst, wenn sich der Stop seit dem letzten
+  übertragenen Wert um mindestens `stop_sync_min_step_percent` bewegt hat
+  und seitdem `stop_sync_min_seconds` vergangen sind
+- Budget: höchstens `stop_sync_calls_per_minute` Modify-Calls insgesamt
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from settings_service import get_settings_service
+from position_book import get_position_book
+from trade_writes import update_trade
+from market_scheduler import TokenBucket
+from shard_coordinator import worker_share
+
+logger = logging.getLogger(__name__)
+
+MT5_PLATFORMS = ("MT5_LIBERTEX", "MT5_ICMARKETS")
+
+
+class BrokerStopSync:
+    """Coalescing, debounced push of trailing stop changes to the broker"""
+
+    def __init__(self, db, flush_interval: float = 5.0):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, float] = {}  # trade_id -> latest wanted stop
+        self._last_sent: Dict[str, float] = {}  # trade_id -> monotonic time of the last modify
+        self.bucket = TokenBucket(rate=0.5, capacity=5)
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"submitted": 0, "sent": 0, "failed": 0, "debounced": 0}
+
+    def submit(self, trade_id: str, stop_loss: float):
+        """Queue a stop change; later changes of the same position replace it"""
+        self._pending[trade_id] = stop_loss
+        self.stats["submitted"] += 1
+
+    async def flush(self):
+        """Send all pending stops that pass the debounce rules and fit in the budget"""
+        if not self._pending:
+            return
+
+        from multi_platform_connector import multi_platform
+
+        settings = await get_settings_service(self.db).get() or {}
+        if not settings.get('sync_stops_to_broker', True):
+            self._pending.clear()
+            return
+
+        min_step = settings.get('stop_sync_min_step_percent', 0.1) / 100
+        min_seconds = settings.get('stop_sync_min_seconds', 30.0)
+        self.bucket.rate = settings.get('stop_sync_calls_per_minute', 30) / 60.0 * worker_share()
+        self.bucket.capacity = max(1.0, self.bucket.rate * 10)
+
+        book = await get_position_book(self.db)
+        now = time.monotonic()
+
+        for trade_id, stop_loss in list(self._pending.items()):
+            trade = book.get(trade_id)
+            if trade is None or trade.get('mode') not in MT5_PLATFORMS or not trade.get('mt5_ticket'):
+                # Closed meanwhile or not a broker position
+                self._pending.pop(trade_id, None)
+                self._last_sent.pop(trade_id, None)
+                continue
+
+            broker_stop = trade.get('broker_stop_loss')
+            if broker_stop:
+                if abs(stop_loss - broker_stop) < broker_stop * min_step:
+                    self.stats["debounced"] += 1
+                    continue  # Stays pending - sent once the move is large enough
+                if now - self._last_sent.get(trade_id, 0.0) < min_seconds:
+                    self.stats["debounced"] += 1
+                    continue
+
+            # Check the connector first - a disconnected platform must not use up the budget
+            platform = multi_platform.platforms.get(trade['mode']) or {}
+            connector = platform.get('connector')
+            if connector is None or not hasattr(connector, 'modify_position'):
+                continue
+
+            if self.bucket.take(1) < 1:
+                break  # Budget exhausted - the rest waits for the next flush
+
+            self._pending.pop(trade_id, None)
+            self._last_sent[trade_id] = now
+            ok = await connector.modify_position(trade['mt5_ticket'], stop_loss=stop_loss, take_profit=trade.get('take_profit'))
+            if ok:
+                self.stats["sent"] += 1
+                await update_trade(self.db, trade_id, {"broker_stop_loss": stop_loss})
+            else:
+                self.stats["failed"] += 1
+                # Retry on a later flush unless a newer stop arrived meanwhile
+                self._pending.setdefault(trade_id, stop_loss)
+
+    async def run(self):
+        logger.info(f"Broker stop sync started (flush every {self.flush_interval}s)")
+        while True:
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error syncing stops to broker: {e}")
+            await asyncio.sleep(self.flush_interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global instance
+_broker_stop_sync = None
+
+def get_broker_stop_sync(db) -> BrokerStopSync:
+    """Get or create broker stop sync instance"""
+    global _broker_stop_sync
+    if _broker_stop_sync is None:
+        _broker_stop_sync = BrokerStopSync(db)
+    return _broker_stop_sync
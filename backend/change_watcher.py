@@ -0,0 +1,143 @@
+"""
+Change Watcher - MongoDB Change Streams für prozessübergreifende Cache-Kohärenz
+Beobachtet `trades`, `trading_settings` und `market_data` und leitet jede
+Änderung an registrierte Handler weiter (Settings Cache, Position Book,
+latest_market_data). Damit sehen alle uvicorn Worker auch Änderungen anderer
+Prozesse (z.B. cleanup_fake_trades.py, update_settings.py) sofort, und die
+Caches können lange Resync-Intervalle verwenden.
+
+Change Streams benötigen ein Replica Set. Lokal reicht ein Single-Node
+Replica Set:
+    mongod --replSet rs0 --dbpath ~/data/db
+    mongosh --eval 'rs.initiate()'
+    MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0
+Ohne Replica Set bleibt der Watcher inaktiv und die Caches pollen wie bisher.
+"""
+
+import asyncio
+import inspect
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Server error codes meaning "change streams are not available on this deployment"
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40415}
+
+
+class ChangeWatcher:
+    """Tails change streams and dispatches change events to in-process cache handlers"""
+
+    def __init__(self, db, retry_delay: float = 5.0):
+        """
+        Args:
+            db: Database connection
+            retry_delay: Seconds to wait before reopening a broken stream
+        """
+        self.db = db
+        self.retry_delay = retry_delay
+        self.active = False
+        self._handlers: Dict[str, List[Callable]] = defaultdict(list)
+        self._status_listeners: List[Callable] = []
+        self._resume_tokens: Dict[str, dict] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def register(self, collection: str, handler: Callable):
+        """Call handler(change) for every change event on the collection (sync or async)"""
+        self._handlers[collection].append(handler)
+
+    def on_status(self, listener: Callable):
+        """Call listener(active: bool) whenever the watcher becomes (in)active"""
+        self._status_listeners.append(listener)
+
+    async def start(self) -> bool:
+        """Start one watch task per registered collection; False if change streams are unsupported"""
+        if not self._handlers:
+            return False
+
+        # Probe once - a standalone mongod rejects $changeStream immediately
+        try:
+            async with self.db[next(iter(self._handlers))].watch(max_await_time_ms=1):
+                pass
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                logger.warning("Change streams not available (MongoDB is not a replica set) - caches keep polling")
+                return False
+            raise
+
+        for collection in self._handlers:
+            self._tasks.append(asyncio.create_task(self._watch(collection)))
+
+        self._set_active(True)
+        logger.info(f"👀 Change watcher started for: {', '.join(self._handlers)}")
+        return True
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._set_active(False)
+
+    async def _watch(self, collection: str):
+        while True:
+            try:
+                kwargs = {"full_document": "updateLookup"}
+                if collection in self._resume_tokens:
+                    # Continue exactly where the broken stream stopped
+                    kwargs["resume_after"] = self._resume_tokens[collection]
+
+                async with self.db[collection].watch(**kwargs) as stream:
+                    if not self.active:
+                        self._set_active(True)
+                    async for change in stream:
+                        self._resume_tokens[collection] = change["_id"]
+                        await self._dispatch(collection, change)
+
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code == 286:
+                    # ChangeStreamHistoryLost - the oplog moved on, start fresh
+                    self._resume_tokens.pop(collection, None)
+                logger.error(f"Change stream on {collection} interrupted: {e} - reconnecting in {self.retry_delay}s")
+                # Events may be missed until the stream is back - caches fall back to polling
+                self._set_active(False)
+                await asyncio.sleep(self.retry_delay)
+
+    async def _dispatch(self, collection: str, change: dict):
+        for handler in self._handlers[collection]:
+            try:
+                result = handler(change)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Change handler for {collection} failed: {e}")
+
+    def _set_active(self, active: bool):
+        if active == self.active:
+            return
+        self.active = active
+        for listener in self._status_listeners:
+            try:
+                listener(active)
+            except Exception as e:
+                logger.error(f"Change watcher status listener failed: {e}")
+
+
+# Global instance
+_change_watcher = None
+
+def get_change_watcher(db) -> ChangeWatcher:
+    """Get or create change watcher instance"""
+    global _change_watcher
+    if _change_watcher is None:
+        _change_watcher = ChangeWatcher(db)
+    return _change_watcher
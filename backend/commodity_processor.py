@@ -3,6 +3,7 @@ Commodity Data Processor for Multi-Commodity Trading
 """
 
 import logging
+import uuid
 import yfinance as yf
 import pandas as pd
 from ta.trend import SMAIndicator, EMAIndicator, MACD
@@ -24,6 +25,7 @@ def set_platform_connector(connector):
 # MT5 Libertex: Erweiterte Auswahl
 # MT5 ICMarkets: Nur Edelmetalle + WTI_F6, BRENT_F6
 # Bitpanda: Alle Rohstoffe verfügbar
+# "session": Handelszeiten-Kalender der Börse (siehe market_hours.py)
 COMMODITIES = {
     # Precious Metals (Spot prices)
     # Libertex: ✅ | ICMarkets: ✅ | Bitpanda: ✅
@@ -35,7 +37,8 @@ COMMODITIES = {
         "bitpanda_symbol": "GOLD",
         "category": "Edelmetalle", 
         "unit": "USD/oz", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "CME_GLOBEX"
     },
     "SILVER": {
         "name": "Silber", 
@@ -45,7 +48,8 @@ COMMODITIES = {
         "bitpanda_symbol": "SILVER",
         "category": "Edelmetalle", 
         "unit": "USD/oz", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "CME_GLOBEX"
     },
     "PLATINUM": {
         "name": "Platin", 
@@ -55,7 +59,8 @@ COMMODITIES = {
         "bitpanda_symbol": "PLATINUM",
         "category": "Edelmetalle", 
         "unit": "USD/oz", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "CME_GLOBEX"
     },
     "PALLADIUM": {
         "name": "Palladium", 
@@ -65,7 +70,8 @@ COMMODITIES = {
         "bitpanda_symbol": "PALLADIUM",
         "category": "Edelmetalle", 
         "unit": "USD/oz", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "CME_GLOBEX"
     },
     
     # Energy Commodities
@@ -78,7 +84,8 @@ COMMODITIES = {
         "bitpanda_symbol": "OIL_WTI",
         "category": "Energie", 
         "unit": "USD/Barrel", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "CME_GLOBEX"
     },
     "BRENT_CRUDE": {
         "name": "Brent Crude Oil", 
@@ -88,7 +95,8 @@ COMMODITIES = {
         "bitpanda_symbol": "OIL_BRENT",
         "category": "Energie", 
         "unit": "USD/Barrel", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "ICE_BRENT"
     },
     "NATURAL_GAS": {
         "name": "Natural Gas", 
@@ -98,7 +106,8 @@ COMMODITIES = {
         "bitpanda_symbol": "NATURAL_GAS",
         "category": "Energie", 
         "unit": "USD/MMBtu", 
-        "platforms": ["MT5_LIBERTEX", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "BITPANDA"],
+        "session": "CME_GLOBEX"
     },
     
     # Agricultural Commodities
@@ -111,7 +120,8 @@ COMMODITIES = {
         "bitpanda_symbol": "WHEAT",
         "category": "Agrar", 
         "unit": "USD/Bushel", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "CBOT_GRAINS"
     },
     "CORN": {
         "name": "Mais", 
@@ -121,7 +131,8 @@ COMMODITIES = {
         "bitpanda_symbol": "CORN",
         "category": "Agrar", 
         "unit": "USD/Bushel", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "CBOT_GRAINS"
     },
     "SOYBEANS": {
         "name": "Sojabohnen", 
@@ -131,7 +142,8 @@ COMMODITIES = {
         "bitpanda_symbol": "SOYBEANS",
         "category": "Agrar", 
         "unit": "USD/Bushel", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "CBOT_GRAINS"
     },
     "COFFEE": {
         "name": "Kaffee", 
@@ -141,7 +153,8 @@ COMMODITIES = {
         "bitpanda_symbol": "COFFEE",
         "category": "Agrar", 
         "unit": "USD/lb", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "ICE_COFFEE"
     },
     "SUGAR": {
         "name": "Zucker", 
@@ -151,7 +164,8 @@ COMMODITIES = {
         "bitpanda_symbol": "SUGAR",
         "category": "Agrar", 
         "unit": "USD/lb", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "ICE_SUGAR"
     },
     "COTTON": {
         "name": "Baumwolle", 
@@ -161,7 +175,8 @@ COMMODITIES = {
         "bitpanda_symbol": "COTTON",
         "category": "Agrar", 
         "unit": "USD/lb", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "ICE_COTTON"
     },
     "COCOA": {
         "name": "Kakao", 
@@ -171,7 +186,8 @@ COMMODITIES = {
         "bitpanda_symbol": "COCOA",
         "category": "Agrar", 
         "unit": "USD/ton", 
-        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"]
+        "platforms": ["MT5_LIBERTEX", "MT5_ICMARKETS", "BITPANDA"],
+        "session": "ICE_COCOA"
     }
 }
 
@@ -203,9 +219,55 @@ import time
 from datetime import datetime, timedelta
 
 # Cache for OHLCV data to avoid rate limiting
+# Per process; with a shared state backend (STATE_BACKEND=mongo) the other workers' fetches are reused
 _ohlcv_cache = {}
 _cache_expiry = {}
 
+
+def _frame_to_doc(df: pd.DataFrame) -> dict:
+    return {
+        "index": [ts.to_pydatetime() for ts in df.index],
+        "columns": [str(column) for column in df.columns],
+        "data": df.astype(float).values.tolist(),
+    }
+
+
+def _doc_to_frame(doc: dict) -> pd.DataFrame:
+    index = pd.DatetimeIndex(doc["index"])
+    if index.tz is None:
+        index = index.tz_localize(timezone.utc)
+    return pd.DataFrame(doc["data"], index=index, columns=doc["columns"])
+
+
+async def _cache_ohlcv(cache_key: str, df: pd.DataFrame, expires_at: datetime):
+    _ohlcv_cache[cache_key] = df
+    _cache_expiry[cache_key] = expires_at
+    from state_backend import get_state_backend
+    state = get_state_backend()
+    if state.shared:
+        try:
+            await state.put("ohlcv", cache_key, {"expires_at": expires_at.timestamp(), "frame": _frame_to_doc(df)})
+        except Exception as e:
+            logger.warning(f"Could not share OHLCV cache entry {cache_key}: {e}")
+
+
+async def _shared_ohlcv(cache_key: str, now: datetime) -> Optional[pd.DataFrame]:
+    """OHLCV entry cached by another worker (None without a shared state backend)"""
+    from state_backend import get_state_backend
+    state = get_state_backend()
+    if not state.shared:
+        return None
+    try:
+        entry = await state.get("ohlcv", cache_key)
+        if entry and now.timestamp() < entry["expires_at"]:
+            df = _doc_to_frame(entry["frame"])
+            _ohlcv_cache[cache_key] = df
+            _cache_expiry[cache_key] = datetime.fromtimestamp(entry["expires_at"])
+            return df
+    except Exception as e:
+        logger.warning(f"Could not read shared OHLCV cache entry {cache_key}: {e}")
+    return None
+
 async def fetch_metaapi_candles(commodity_id: str, timeframe: str = "1h", limit: int = 100) -> Optional[pd.DataFrame]:
     """
     Fetch historical candle data from MetaAPI for supported commodities
@@ -307,6 +369,11 @@ async def fetch_historical_ohlcv_async(commodity_id: str, timeframe: str = "1d",
                 logger.info(f"Returning cached data for {commodity_id}")
                 return _ohlcv_cache[cache_key]
         
+        shared = await _shared_ohlcv(cache_key, now)
+        if shared is not None:
+            logger.info(f"Returning shared cached data for {commodity_id}")
+            return shared
+        
         commodity = COMMODITIES[commodity_id]
         
         # Priority 1: Try MetaAPI for supported commodities (Gold, Silver, Platinum, WTI, Brent)
@@ -329,8 +396,7 @@ async def fetch_historical_ohlcv_async(commodity_id: str, timeframe: str = "1d",
                 metaapi_data = await fetch_metaapi_candles(commodity_id, metaapi_tf, limit)
                 if metaapi_data is not None and not metaapi_data.empty:
                     # Cache for 1 hour (MetaAPI data is fresh)
-                    _ohlcv_cache[cache_key] = metaapi_data
-                    _cache_expiry[cache_key] = now + timedelta(hours=1)
+                    await _cache_ohlcv(cache_key, metaapi_data, now + timedelta(hours=1))
                     return metaapi_data
                 else:
                     logger.info(f"MetaAPI unavailable for {commodity_id}, falling back to yfinance")
@@ -357,20 +423,20 @@ async def fetch_historical_ohlcv_async(commodity_id: str, timeframe: str = "1d",
         logger.info(f"Fetching {commodity['name']} data: period={period}, interval={interval}")
         
         # Add delay to avoid rate limiting
-        time.sleep(0.5)
+        await asyncio.sleep(0.5)
         
-        hist = ticker.history(period=period, interval=interval)
+        # Blocking HTTP + indicator work off the event loop
+        hist = await asyncio.to_thread(ticker.history, period=period, interval=interval)
         
         if hist.empty or len(hist) == 0:
             logger.warning(f"No data received for {commodity['name']}")
             return None
         
         # Add indicators
-        hist = calculate_indicators(hist)
+        hist = await asyncio.to_thread(calculate_indicators, hist)
         
         # Cache successful result (24 hours for yfinance to avoid rate limiting)
-        _ohlcv_cache[cache_key] = hist
-        _cache_expiry[cache_key] = now + timedelta(hours=24)
+        await _cache_ohlcv(cache_key, hist, now + timedelta(hours=24))
         
         return hist
     except Exception as e:
@@ -408,6 +474,93 @@ def fetch_historical_ohlcv(commodity_id: str, timeframe: str = "1d", period: str
         return asyncio.run(fetch_historical_ohlcv_async(commodity_id, timeframe, period))
 
 
+def build_market_data(commodity_id: str, hist, live_price: Optional[float], settings):
+    """
+    Current market data snapshot of a commodity from its history and live price
+
+    Returns:
+        (market_data, hist with indicators) - market_data is None if there is no usable data,
+        hist is None for a live-price-only snapshot
+    """
+    # If no historical data, create minimal data with live price
+    if hist is None or hist.empty:
+        if not live_price:
+            logger.warning(f"No data for {commodity_id}, skipping update")
+            return None, None
+        logger.info(f"Using live price only for {commodity_id}: ${live_price:.2f}")
+        # Create minimal market data without indicators
+        return {
+            "id": str(uuid.uuid4()),
+            "timestamp": datetime.now(timezone.utc),
+            "commodity": commodity_id,
+            "price": live_price,
+            "volume": 0,
+            "sma_20": live_price,
+            "ema_20": live_price,
+            "rsi": 50.0,  # Neutral
+            "macd": 0.0,
+            "macd_signal": 0.0,
+            "macd_histogram": 0.0,
+            "trend": "NEUTRAL",
+            "signal": "HOLD"
+        }, None
+
+    # If we have live price, update the latest price in hist
+    if live_price:
+        hist.iloc[-1, hist.columns.get_loc('Close')] = live_price
+
+    # Calculate indicators if not already present
+    if 'RSI' not in hist.columns:
+        hist = calculate_indicators(hist)
+
+        # Check again if calculate_indicators returned None
+        if hist is None or hist.empty:
+            logger.warning(f"Indicators calculation failed for {commodity_id}")
+            return None, None
+
+    latest = hist.iloc[-1]
+
+    # Safely get values with defaults
+    close_price = float(latest.get('Close', 0))
+    if close_price == 0:
+        logger.warning(f"Invalid close price for {commodity_id}")
+        return None, None
+
+    sma_20 = float(latest.get('SMA_20', close_price))
+
+    # Determine trend and signal
+    trend = "UP" if close_price > sma_20 else "DOWN"
+
+    # Get trading strategy parameters from settings
+    rsi_oversold = settings.get('rsi_oversold_threshold', 30.0) if settings else 30.0
+    rsi_overbought = settings.get('rsi_overbought_threshold', 70.0) if settings else 70.0
+
+    # Signal logic using configurable thresholds
+    rsi = float(latest.get('RSI', 50))
+    signal = "HOLD"
+    if rsi > rsi_overbought:
+        signal = "SELL"
+    elif rsi < rsi_oversold:
+        signal = "BUY"
+
+    market_data = {
+        "id": str(uuid.uuid4()),
+        "timestamp": datetime.now(timezone.utc),
+        "commodity": commodity_id,
+        "price": close_price,
+        "volume": float(latest.get('Volume', 0)),
+        "sma_20": sma_20,
+        "ema_20": float(latest.get('EMA_20', close_price)),
+        "rsi": rsi,
+        "macd": float(latest.get('MACD', 0)),
+        "macd_signal": float(latest.get('MACD_signal', 0)),
+        "macd_histogram": float(latest.get('MACD_hist', 0)),
+        "trend": trend,
+        "signal": signal
+    }
+    return market_data, hist
+
+
 def calculate_indicators(df):
     """Calculate technical indicators"""
     try:
@@ -496,11 +649,10 @@ def generate_signal(latest_data):
 async def calculate_position_size(balance: float, price: float, db, max_risk_percent: float = 20.0, free_margin: float = None, platform: str = "MT5") -> float:
     """Calculate position size ensuring max portfolio risk per platform and considering free margin"""
     try:
-        # Get all open positions from database FOR THIS PLATFORM ONLY
-        open_trades = await db.trades.find({"status": "OPEN", "mode": platform}).to_list(100)
-        
-        # Calculate total exposure from open positions ON THIS PLATFORM
-        total_exposure = sum([trade.get('entry_price', 0) * trade.get('quantity', 0) for trade in open_trades])
+        # Running exposure of the open positions ON THIS PLATFORM (In-Memory Position Book)
+        from position_book import get_position_book
+        book = await get_position_book(db)
+        total_exposure = book.exposure(platform)
         
         # Calculate available capital (max_risk_percent of balance minus current exposure)
         max_portfolio_value = balance * (max_risk_percent / 100)
@@ -0,0 +1,152 @@
+"""
+Date Normalization - Zeitstempel einheitlich als native BSON Dates speichern
+Ältere Dokumente enthalten ISO-Strings (isoformat()), neuere native datetimes.
+Dieses Modul liefert die Konvertierung für den Schreibpfad und eine Online-
+Migration, die bestehende Dokumente batchweise umschreibt.
+
+Verwendung als Skript:
+    python date_normalization.py [--dry-run] [--batch-size 500]
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Date fields per collection
+DATE_FIELDS = {
+    "trades": ("timestamp", "created_at", "updated_at", "closed_at"),
+    "market_data": ("timestamp",),
+}
+
+
+def to_utc_datetime(value) -> Optional[datetime]:
+    """Convert an ISO string or datetime into a timezone-aware UTC datetime (None if not parseable)"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, str):
+        try:
+            # Python < 3.11 does not accept a trailing 'Z'
+            dt = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    else:
+        return None
+
+    if dt.tzinfo is None:
+        # Naive values were always written as UTC
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def normalize_dates(doc: Dict, fields: Iterable[str]) -> Dict:
+    """Convert the given date fields of a document (in place) to native datetimes"""
+    for field in fields:
+        value = doc.get(field)
+        if isinstance(value, str):
+            converted = to_utc_datetime(value)
+            if converted is not None:
+                doc[field] = converted
+    return doc
+
+
+async def migrate_collection_dates(db, collection_name: str, batch_size: int = 500, dry_run: bool = False) -> Dict:
+    """
+    Rewrite string date fields of one collection to native dates, batch by batch
+
+    Safe to run while the application is writing: every update is conditional
+    on the field still holding the original string, and the scan walks the
+    collection in _id order so it always terminates.
+    """
+    collection = db[collection_name]
+    stats = {"collection": collection_name, "scanned": 0, "converted": 0, "unparseable": 0}
+
+    for field in DATE_FIELDS[collection_name]:
+        last_id = None
+        while True:
+            query = {field: {"$type": "string"}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+
+            batch = await collection.find(query, {"_id": 1, field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+
+            operations = []
+            for doc in batch:
+                original = doc[field]
+                converted = to_utc_datetime(original)
+                if converted is None:
+                    stats["unparseable"] += 1
+                    logger.warning(f"{collection_name}.{field}: cannot parse {original!r} (_id={doc['_id']})")
+                    continue
+                operations.append(UpdateOne(
+                    {"_id": doc["_id"], field: original},
+                    {"$set": {field: converted}}
+                ))
+
+            stats["scanned"] += len(batch)
+            if operations and not dry_run:
+                result = await collection.bulk_write(operations, ordered=False)
+                stats["converted"] += result.modified_count
+            elif dry_run:
+                stats["converted"] += len(operations)
+
+            last_id = batch[-1]["_id"]
+
+            # Yield to other work between batches (online migration)
+            await asyncio.sleep(0)
+
+    logger.info(
+        f"Date migration {collection_name}: {stats['scanned']} scanned, "
+        f"{stats['converted']} converted, {stats['unparseable']} unparseable"
+        + (" (dry run)" if dry_run else "")
+    )
+    return stats
+
+
+async def migrate_all_dates(db, batch_size: int = 500, dry_run: bool = False):
+    """Run the migration for all collections with date fields"""
+    results = []
+    for collection_name in DATE_FIELDS:
+        try:
+            results.append(await migrate_collection_dates(db, collection_name, batch_size, dry_run))
+        except Exception as e:
+            logger.error(f"Date migration failed for {collection_name}: {e}")
+    return results
+
+
+async def _main():
+    import argparse
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Zeitstempel in trades/market_data auf native Dates migrieren")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Nur zählen, nichts schreiben")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    print("=" * 80)
+    print("DATUMS-MIGRATION: ISO-Strings -> native Dates")
+    print("=" * 80)
+
+    for stats in await migrate_all_dates(db, batch_size=args.batch_size, dry_run=args.dry_run):
+        print(f"  {stats['collection']}: {stats['scanned']} geprüft, {stats['converted']} konvertiert, {stats['unparseable']} nicht lesbar")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
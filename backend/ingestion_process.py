@@ -0,0 +1,127 @@
+"""
+Ingestion Process - Marktdaten-Abruf als eigener Prozess
+Holt Live-Ticks und Kerzen, berechnet die Indikatoren und veröffentlicht
+Snapshot und letzte Kerzen im Shared Memory (shared_market_state.py).
+Die API-Worker lesen von dort, statt selbst Broker und yfinance abzufragen;
+Abruf und Indikator-Berechnung konkurrieren so nicht mehr mit den
+HTTP-Requests um Event Loop und GIL.
+
+Die Snapshots werden außerdem wie bisher nach market_data /
+market_snapshots geschrieben (Snapshot Writer).
+
+Start (auf demselben Host wie die API):
+    # backend/.env
+    MARKET_INGESTION=process
+    python ingestion_process.py --interval 10
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from commodity_processor import COMMODITIES, fetch_commodity_data, build_market_data
+from market_hours import is_market_open
+from settings_service import get_settings_service
+from shared_market_state import SharedMarketState, DEFAULT_NAME
+from snapshot_writer import get_snapshot_writer
+from trading_pipeline import fetch_live_tick
+
+logger = logging.getLogger(__name__)
+
+
+async def ingest_commodity(commodity_id: str, settings, shared: SharedMarketState, writer) -> bool:
+    """Fetch, compute and publish one commodity; True if a snapshot was published"""
+    try:
+        live_price = await fetch_live_tick(commodity_id)
+    except Exception as e:
+        logger.debug(f"Could not get live tick for {commodity_id}: {e}")
+        live_price = None
+
+    hist = await asyncio.to_thread(fetch_commodity_data, commodity_id)
+    market_data, hist = await asyncio.to_thread(build_market_data, commodity_id, hist, live_price, settings)
+    if market_data is None:
+        return False
+
+    shared.publish(commodity_id, market_data, hist)
+    writer.submit(market_data)
+    return True
+
+
+async def ingest_cycle(db, shared: SharedMarketState, writer):
+    """One pass over all enabled commodities (bounded concurrency like the inline market loop)"""
+    settings = await get_settings_service(db).get() or {}
+    enabled = settings.get('enabled_commodities', ['WTI_CRUDE'])
+    respect_hours = settings.get('respect_market_hours', True)
+    semaphore = asyncio.Semaphore(max(1, int(settings.get('market_data_concurrency', 4))))
+    timeout = float(settings.get('market_data_timeout_seconds', 20.0))
+
+    async def ingest_one(commodity_id):
+        if respect_hours and not is_market_open(commodity_id):
+            return False
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(ingest_commodity(commodity_id, settings, shared, writer), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⏱️ {commodity_id}: ingestion timed out after {timeout}s")
+            except Exception as e:
+                logger.error(f"Error ingesting {commodity_id}: {e}")
+            return False
+
+    started = time.monotonic()
+    results = await asyncio.gather(*[ingest_one(commodity_id) for commodity_id in enabled])
+    shared.touch()  # Alive even if every market is closed
+    writer.request_flush()
+    logger.info(f"Ingestion cycle: {sum(results)}/{len(results)} published in {(time.monotonic() - started) * 1000:.0f}ms")
+
+
+async def _main():
+    import argparse
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Marktdaten abrufen und per Shared Memory an die API-Worker verteilen")
+    parser.add_argument("--interval", type=float, default=10.0, help="Sekunden zwischen zwei Abrufzyklen")
+    parser.add_argument("--candles", type=int, default=500, help="Kerzen pro Commodity im Shared Memory")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    # Live ticks come from the MT5 platforms, as in the API process
+    from multi_platform_connector import multi_platform
+    import commodity_processor
+    commodity_processor.set_platform_connector(multi_platform)
+    await multi_platform.connect_platform('MT5_ICMARKETS')
+    await multi_platform.connect_platform('MT5_LIBERTEX')
+
+    shared = SharedMarketState.create(list(COMMODITIES), n_candles=args.candles,
+                                      name=os.environ.get('MARKET_SHM_NAME', DEFAULT_NAME))
+    writer = get_snapshot_writer(db)
+    writer.start()
+
+    logger.info(f"📥 Ingestion Process gestartet (alle {args.interval}s)")
+    try:
+        while True:
+            try:
+                await ingest_cycle(db, shared, writer)
+            except Exception as e:
+                logger.error(f"Ingestion cycle failed: {e}")
+                shared.touch()
+            await asyncio.sleep(args.interval)
+    finally:
+        await writer.stop()
+        shared.close()
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
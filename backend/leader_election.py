@@ -0,0 +1,194 @@
+"""
+Leader Election - MongoDB Lease für die Hintergrund-Jobs
+Mit mehreren uvicorn Workern würde jeder Prozess eine eigene Auto-Trading
+Engine starten und doppelte Orders platzieren. Genau ein Worker hält den
+Lease-Eintrag in `leader_leases` und führt Engine, Market Loop und die
+übrigen Singleton-Jobs aus; alle anderen bedienen nur HTTP.
+
+- Der Leader verlängert den Lease alle `heartbeat_seconds`
+- Läuft der Lease ab (Prozess tot, Netzwerk weg), übernimmt ein anderer
+  Worker beim nächsten Heartbeat
+- Kann der Leader nicht rechtzeitig verlängern, stoppt er seine Jobs selbst,
+  bevor ein anderer Worker übernehmen kann (kein Split-Brain)
+- Beim Herunterfahren wird der Lease freigegeben; über den Change Watcher
+  übernimmt ein Follower dann sofort
+
+Ablaufzeiten werden mit der Serverzeit von MongoDB ($$NOW) verglichen, die
+Uhren der Worker spielen keine Rolle.
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+LEASE_COLLECTION = "leader_leases"
+
+
+class LeaderElection:
+    """Lease-based leader election with heartbeat; calls on_elected / on_revoked on changes"""
+
+    def __init__(self, db, name: str = "trading_engine", lease_seconds: float = 15.0,
+                 heartbeat_seconds: float = 5.0):
+        """
+        Args:
+            db: Database connection
+            name: Lease name - one leader per name
+            lease_seconds: Validity of the lease; failover happens at most this long after a crash
+            heartbeat_seconds: Renew / acquire interval (well below lease_seconds)
+        """
+        self.db = db
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._renewed_at = 0.0  # Monotonic time of the last successful renewal
+        self._on_elected = []
+        self._on_revoked = []
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def on_elected(self, callback: Callable):
+        """Call callback() (sync or async) when this process becomes leader - keep it short, the heartbeat waits for it"""
+        self._on_elected.append(callback)
+
+    def on_revoked(self, callback: Callable):
+        """Call callback() (sync or async) when this process loses the leadership"""
+        self._on_revoked.append(callback)
+
+    def wake(self):
+        """Try to acquire right away (e.g. the lease was released)"""
+        self._wake.set()
+
+    def apply_change(self, change: Dict):
+        """Change stream handler for `leader_leases`: react to a released lease immediately"""
+        if change.get('operationType') == 'delete' and not self.is_leader:
+            self.wake()
+
+    async def _try_acquire(self) -> bool:
+        """Take the lease if it is free or expired, or renew it if we hold it"""
+        lease_ms = int(self.lease_seconds * 1000)
+        try:
+            lease = await self.db[LEASE_COLLECTION].find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [
+                        {"holder": self.holder},
+                        {"$expr": {"$lt": ["$expires_at", "$$NOW"]}},
+                    ],
+                },
+                [{"$set": {
+                    "holder": self.holder,
+                    "expires_at": {"$add": ["$$NOW", lease_ms]},
+                    "renewed_at": "$$NOW",
+                    "acquired_at": {"$cond": [{"$eq": ["$holder", self.holder]}, "$acquired_at", "$$NOW"]},
+                }}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Lease exists and is held by another live worker
+            return False
+        return lease is not None and lease.get('holder') == self.holder
+
+    async def _release(self):
+        try:
+            await self.db[LEASE_COLLECTION].delete_one({"_id": self.name, "holder": self.holder})
+        except PyMongoError as e:
+            logger.warning(f"Could not release leader lease: {e}")
+
+    async def _notify(self, callbacks):
+        for callback in callbacks:
+            try:
+                result = callback()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Leader election callback failed: {e}")
+
+    async def _set_leader(self, leader: bool):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        if leader:
+            logger.info(f"👑 Leader für '{self.name}' ({self.holder}) - starte Hintergrund-Jobs")
+            await self._notify(self._on_elected)
+        else:
+            logger.warning(f"Leadership für '{self.name}' verloren ({self.holder}) - stoppe Hintergrund-Jobs")
+            await self._notify(self._on_revoked)
+
+    async def heartbeat(self):
+        """One acquire/renew round"""
+        try:
+            acquired = await self._try_acquire()
+            if acquired:
+                self._renewed_at = time.monotonic()
+            await self._set_leader(acquired)
+        except PyMongoError as e:
+            logger.error(f"Leader heartbeat failed: {e}")
+            # Step down before the lease can expire and another worker takes over
+            if self.is_leader and time.monotonic() - self._renewed_at > self.lease_seconds - self.heartbeat_seconds:
+                await self._set_leader(False)
+
+    async def run(self):
+        logger.info(f"Leader election '{self.name}' gestartet (Lease {self.lease_seconds}s, Heartbeat {self.heartbeat_seconds}s)")
+        while True:
+            await self.heartbeat()
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.heartbeat_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        """Decide the leadership once, then keep the heartbeat running in the background"""
+        if self._task is None or self._task.done():
+            await self.heartbeat()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the heartbeat, stop the leader jobs and release the lease for a fast failover"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            await self._set_leader(False)
+            await self._release()
+
+    def status(self) -> Dict:
+        return {
+            "name": self.name,
+            "holder": self.holder,
+            "is_leader": self.is_leader,
+            "lease_seconds": self.lease_seconds,
+            "heartbeat_seconds": self.heartbeat_seconds,
+        }
+
+
+# Global instance
+_leader_election = None
+
+def get_leader_election(db) -> LeaderElection:
+    """Get or create the leader election (lease/heartbeat from LEADER_LEASE_SECONDS / LEADER_HEARTBEAT_SECONDS)"""
+    global _leader_election
+    if _leader_election is None:
+        _leader_election = LeaderElection(
+            db,
+            lease_seconds=float(os.environ.get('LEADER_LEASE_SECONDS', 15)),
+            heartbeat_seconds=float(os.environ.get('LEADER_HEARTBEAT_SECONDS', 5)),
+        )
+    return _leader_election
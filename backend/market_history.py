@@ -0,0 +1,201 @@
+"""
+Market Snapshot History - MongoDB Time-Series Collection mit Rollups
+Rohdaten (jeder Snapshot) werden in einer Time-Series Collection gespeichert,
+1-Minuten-, 1-Stunden- und 1-Tages-Rollups werden periodisch daraus verdichtet.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+# Raw snapshots: time-series collection, metaField = commodity
+SNAPSHOT_COLLECTION = "market_snapshots"
+RAW_RETENTION_SECONDS = 7 * 24 * 3600  # 7 Tage
+
+# Rollups: each level is built from the previous one (raw -> 1m -> 1h -> 1d)
+ROLLUPS = {
+    "1m": {"collection": "market_snapshots_1m", "unit": "minute", "source": "raw", "retention_seconds": 30 * 24 * 3600},
+    "1h": {"collection": "market_snapshots_1h", "unit": "hour", "source": "1m", "retention_seconds": 2 * 365 * 24 * 3600},
+    "1d": {"collection": "market_snapshots_1d", "unit": "day", "source": "1h", "retention_seconds": None},  # Unbegrenzt
+}
+
+RESOLUTIONS = ["raw"] + list(ROLLUPS.keys())
+
+# Snapshot fields stored per measurement (besides commodity/timestamp)
+SNAPSHOT_FIELDS = ["price", "volume", "sma_20", "ema_20", "rsi", "macd", "macd_signal", "macd_histogram", "trend", "signal"]
+
+_UNIT_DELTAS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+
+def _collection_name(resolution: str) -> str:
+    if resolution == "raw":
+        return SNAPSHOT_COLLECTION
+    return ROLLUPS[resolution]["collection"]
+
+
+async def ensure_market_history_collections(db):
+    """Create the time-series collection and the rollup collections with their indexes (idempotent)"""
+    try:
+        existing = await db.list_collection_names()
+
+        if SNAPSHOT_COLLECTION not in existing:
+            try:
+                await db.create_collection(
+                    SNAPSHOT_COLLECTION,
+                    timeseries={"timeField": "timestamp", "metaField": "commodity", "granularity": "seconds"},
+                    expireAfterSeconds=RAW_RETENTION_SECONDS
+                )
+                logger.info(f"Created time-series collection {SNAPSHOT_COLLECTION}")
+            except CollectionInvalid:
+                pass  # Created concurrently by another worker
+
+        for resolution, rollup in ROLLUPS.items():
+            collection = db[rollup["collection"]]
+            # Unique bucket key - required as $merge target
+            await collection.create_index([("commodity", 1), ("timestamp", 1)], unique=True)
+            if rollup["retention_seconds"]:
+                await collection.create_index("timestamp", expireAfterSeconds=rollup["retention_seconds"])
+
+        logger.info("Market history collections ready")
+    except Exception as e:
+        logger.error(f"Error creating market history collections: {e}")
+
+
+def build_snapshot_doc(market_data: Dict) -> Dict:
+    """Convert a market_data document into a time-series measurement"""
+    doc = {
+        "commodity": market_data["commodity"],
+        "timestamp": market_data.get("timestamp") or datetime.now(timezone.utc),
+    }
+    for field in SNAPSHOT_FIELDS:
+        doc[field] = market_data.get(field)
+    return doc
+
+
+def _rollup_pipeline(resolution: str, since: datetime) -> List[Dict]:
+    """Aggregation that (re)computes all buckets of `resolution` starting at `since`"""
+    rollup = ROLLUPS[resolution]
+    pipeline = [{"$match": {"timestamp": {"$gte": since}}}]
+
+    if rollup["source"] == "raw":
+        # Raw measurements have a single price - give them OHLC shape
+        pipeline.append({"$addFields": {
+            "open": "$price", "high": "$price", "low": "$price", "close": "$price", "samples": 1
+        }})
+
+    last_fields = ["volume", "sma_20", "ema_20", "rsi", "macd", "macd_signal", "macd_histogram", "trend", "signal"]
+    group = {
+        "_id": {
+            "commodity": "$commodity",
+            "timestamp": {"$dateTrunc": {"date": "$timestamp", "unit": rollup["unit"]}}
+        },
+        "open": {"$first": "$open"},
+        "high": {"$max": "$high"},
+        "low": {"$min": "$low"},
+        "close": {"$last": "$close"},
+        "samples": {"$sum": "$samples"},
+    }
+    for field in last_fields:
+        group[field] = {"$last": f"${field}"}
+
+    project = {"_id": 0, "commodity": "$_id.commodity", "timestamp": "$_id.timestamp", "price": "$close"}
+    for field in ["open", "high", "low", "close", "samples"] + last_fields:
+        project[field] = 1
+
+    pipeline += [
+        {"$sort": {"timestamp": 1}},
+        {"$group": group},
+        {"$project": project},
+        {"$merge": {
+            "into": rollup["collection"],
+            "on": ["commodity", "timestamp"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }},
+    ]
+    return pipeline
+
+
+async def rollup_market_history(db, resolution: str, now: Optional[datetime] = None):
+    """
+    Recompute the current and the previous bucket of a rollup level
+
+    Only the tail of the source collection is aggregated, so the cost does not
+    grow with the stored history. Re-running is idempotent ($merge replace).
+    """
+    rollup = ROLLUPS[resolution]
+    now = now or datetime.now(timezone.utc)
+    step = _UNIT_DELTAS[rollup["unit"]]
+
+    # Start of the previous bucket (late snapshots may still land there)
+    if rollup["unit"] == "minute":
+        current = now.replace(second=0, microsecond=0)
+    elif rollup["unit"] == "hour":
+        current = now.replace(minute=0, second=0, microsecond=0)
+    else:
+        current = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    since = current - step
+
+    source = db[_collection_name(rollup["source"])]
+    await source.aggregate(_rollup_pipeline(resolution, since)).to_list(None)
+
+
+async def run_rollup_loop(db, interval_seconds: int = 60):
+    """Background task: keep all rollup levels up to date"""
+    logger.info(f"Market history rollups started (every {interval_seconds}s)")
+    while True:
+        try:
+            for resolution in ROLLUPS:
+                await rollup_market_history(db, resolution)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error rolling up market history: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+async def query_market_history(
+    db,
+    commodity: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: str = "raw",
+    limit: int = 1000
+) -> List[Dict]:
+    """
+    History of one commodity (or all) in a time range at the given resolution
+
+    Uses the (commodity, timestamp) order of the time-series buckets / rollup
+    index, so no collection scan is needed. Returns oldest first.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Invalid resolution. Must be one of: {', '.join(RESOLUTIONS)}")
+
+    query = {}
+    if commodity:
+        query["commodity"] = commodity
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = start
+        if end:
+            query["timestamp"]["$lte"] = end
+
+    collection = db[_collection_name(resolution)]
+
+    if start:
+        # Range query: read forward from the start of the range
+        return await collection.find(query, {"_id": 0}).sort("timestamp", 1).limit(limit).to_list(limit)
+
+    # No start: the most recent `limit` points
+    data = await collection.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
+    return list(reversed(data))
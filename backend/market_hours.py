@@ -0,0 +1,145 @@
+"""
+Market Hours - Handelszeiten-Kalender der Börsen
+Jede Commodity in COMMODITIES verweist über "session" auf einen Kalender.
+Market Loop, Auto-Trading Pipeline, Market Scheduler und Stop Monitor
+überspringen geschlossene Märkte und setzen exakt zur Sessioneröffnung
+wieder ein.
+
+Zeiten sind lokale Börsenzeit (inkl. Sommerzeit über zoneinfo). Feiertage
+sind nicht hinterlegt - an Börsenfeiertagen wird wie an einem normalen
+Handelstag abgefragt.
+"""
+
+from datetime import datetime, date, time, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+MON, TUE, WED, THU, FRI, SAT, SUN = range(7)
+
+# Window: (weekday of the open, open time, close time, days until the close)
+SESSIONS = {
+    # CME Globex metals/energy: Sun-Fri 17:00-16:00 CT, daily maintenance 16:00-17:00
+    "CME_GLOBEX": {
+        "timezone": "America/Chicago",
+        "windows": [(day, "17:00", "16:00", 1) for day in (SUN, MON, TUE, WED, THU)],
+    },
+    # CBOT grains: 19:00-07:45 CT overnight, break, 08:30-13:20 CT day session
+    "CBOT_GRAINS": {
+        "timezone": "America/Chicago",
+        "windows": [(day, "19:00", "07:45", 1) for day in (SUN, MON, TUE, WED, THU)]
+                   + [(day, "08:30", "13:20", 0) for day in (MON, TUE, WED, THU, FRI)],
+    },
+    # ICE Futures Europe Brent: 01:00-23:00 London, the week opens Sunday 23:00
+    "ICE_BRENT": {
+        "timezone": "Europe/London",
+        "windows": [(SUN, "23:00", "23:00", 1)]
+                   + [(day, "01:00", "23:00", 0) for day in (TUE, WED, THU, FRI)],
+    },
+    # ICE US softs (Eastern Time)
+    "ICE_COFFEE": {
+        "timezone": "America/New_York",
+        "windows": [(day, "04:15", "13:30", 0) for day in (MON, TUE, WED, THU, FRI)],
+    },
+    "ICE_SUGAR": {
+        "timezone": "America/New_York",
+        "windows": [(day, "03:30", "13:00", 0) for day in (MON, TUE, WED, THU, FRI)],
+    },
+    "ICE_COCOA": {
+        "timezone": "America/New_York",
+        "windows": [(day, "04:45", "13:30", 0) for day in (MON, TUE, WED, THU, FRI)],
+    },
+    "ICE_COTTON": {
+        "timezone": "America/New_York",
+        "windows": [(day, "21:00", "14:20", 1) for day in (SUN, MON, TUE, WED, THU)],
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def _compiled(session: str) -> Tuple[ZoneInfo, List[Tuple[int, time, time, int]]]:
+    spec = SESSIONS[session]
+    windows = [
+        (weekday, time.fromisoformat(open_at), time.fromisoformat(close_at), days)
+        for weekday, open_at, close_at, days in spec["windows"]
+    ]
+    return ZoneInfo(spec["timezone"]), windows
+
+
+def session_for(commodity_id: str) -> Optional[str]:
+    """Session calendar name of a commodity (None = always open)"""
+    from commodity_processor import COMMODITIES
+    session = COMMODITIES.get(commodity_id, {}).get("session")
+    return session if session in SESSIONS else None
+
+
+def _window_bounds(tz: ZoneInfo, day: date, open_at: time, close_at: time, days: int):
+    start = datetime.combine(day, open_at, tzinfo=tz)
+    end = datetime.combine(day + timedelta(days=days), close_at, tzinfo=tz)
+    return start, end
+
+
+def is_session_open(session: str, now: Optional[datetime] = None) -> bool:
+    now = now or datetime.now(timezone.utc)
+    tz, windows = _compiled(session)
+    today = now.astimezone(tz).date()
+
+    # Windows that opened today or (overnight sessions) yesterday
+    for offset in (0, 1):
+        day = today - timedelta(days=offset)
+        for weekday, open_at, close_at, days in windows:
+            if weekday != day.weekday():
+                continue
+            start, end = _window_bounds(tz, day, open_at, close_at, days)
+            if start <= now < end:
+                return True
+    return False
+
+
+def next_session_open(session: str, now: Optional[datetime] = None) -> datetime:
+    """UTC time at which the session is open next (`now` if it is open)"""
+    now = now or datetime.now(timezone.utc)
+    if is_session_open(session, now):
+        return now
+
+    tz, windows = _compiled(session)
+    today = now.astimezone(tz).date()
+    candidates = []
+    for offset in range(8):
+        day = today + timedelta(days=offset)
+        for weekday, open_at, close_at, days in windows:
+            if weekday == day.weekday():
+                start, _ = _window_bounds(tz, day, open_at, close_at, days)
+                if start > now:
+                    candidates.append(start)
+    return min(candidates).astimezone(timezone.utc)
+
+
+def is_market_open(commodity_id: str, now: Optional[datetime] = None) -> bool:
+    """True if the exchange of the commodity is trading (unknown calendars count as open)"""
+    session = session_for(commodity_id)
+    return True if session is None else is_session_open(session, now)
+
+
+def seconds_until_open(commodity_id: str, now: Optional[datetime] = None) -> float:
+    """0 if open, otherwise seconds until the next session open"""
+    session = session_for(commodity_id)
+    if session is None:
+        return 0.0
+    now = now or datetime.now(timezone.utc)
+    return max((next_session_open(session, now) - now).total_seconds(), 0.0)
+
+
+def market_status(commodity_ids, now: Optional[datetime] = None) -> Dict[str, Dict]:
+    """Open/closed state and next open per commodity (for the API)"""
+    now = now or datetime.now(timezone.utc)
+    status = {}
+    for commodity_id in commodity_ids:
+        session = session_for(commodity_id)
+        is_open = True if session is None else is_session_open(session, now)
+        status[commodity_id] = {
+            "session": session,
+            "open": is_open,
+            "next_open": None if is_open or session is None else next_session_open(session, now).isoformat(),
+        }
+    return status
@@ -0,0 +1,246 @@
+"""
+Market Scheduler - volatilitäts- und exposure-abhängiges Tick-Polling
+Statt alle Rohstoffe im selben Takt abzufragen, bekommt jede Commodity ein
+eigenes Intervall:
+- realisierte Volatilität (EWMA der Log-Returns zwischen zwei Abfragen):
+  volatile Instrumente werden häufiger abgefragt, ruhige seltener
+- offene Positionen (Position Book): gehaltene Instrumente doppelt so oft
+- Handelszeiten (market_hours.py): geschlossene Märkte werden erst zur
+  nächsten Sessioneröffnung wieder abgefragt
+Alle Broker-Abfragen teilen sich ein globales Budget (Token Bucket,
+`broker_calls_per_minute`, get_broker_bucket) - auch die Live-Ticks des
+Marktdaten-Loops und von /market/live-ticks. Reicht das Budget nicht,
+werden fällige Commodities nach Priorität bedient.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from statistics import median
+from typing import Callable, Dict, Optional
+
+from settings_service import get_settings_service
+from position_book import get_position_book
+from market_hours import seconds_until_open
+from shard_coordinator import owned_commodities, worker_share
+
+logger = logging.getLogger(__name__)
+
+EWMA_LAMBDA = 0.94  # RiskMetrics-Glättung der quadrierten Returns
+HELD_SPEEDUP = 2.0  # Gehaltene Instrumente: Intervall / 2
+
+
+class TokenBucket:
+    """Global broker-call budget: `rate` calls per second, bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def take(self, wanted: int) -> int:
+        """Take up to `wanted` tokens, returns how many were granted"""
+        self._refill()
+        granted = min(wanted, int(self.tokens))
+        self.tokens -= granted
+        return granted
+
+    def seconds_until_token(self) -> float:
+        self._refill()
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+# Ein Budget pro Worker für alle Live-Tick Abfragen (Scheduler, Marktdaten-Loop, /market/live-ticks)
+_broker_bucket = TokenBucket(rate=2.0, capacity=10)
+
+def get_broker_bucket(settings: Optional[Dict] = None) -> TokenBucket:
+    """Broker-call budget shared by all live-tick callers; `settings` updates its rate"""
+    if settings is not None:
+        calls_per_minute = float(settings.get('broker_calls_per_minute', 120))
+        # Sharding: every engine worker polls, the budget is split between them
+        _broker_bucket.rate = calls_per_minute / 60.0 * worker_share()
+        _broker_bucket.capacity = max(1.0, _broker_bucket.rate * 5)
+    return _broker_bucket
+
+
+class CommoditySchedule:
+    """Polling state of one commodity"""
+
+    __slots__ = ('last_price', 'last_poll', 'variance', 'interval', 'next_due', 'held', 'polls')
+
+    def __init__(self, interval: float):
+        self.last_price = None
+        self.last_poll = None
+        self.variance = None  # EWMA of squared log returns per second
+        self.interval = interval
+        self.next_due = 0.0  # Poll immediately
+        self.held = False
+        self.polls = 0
+
+    def observe(self, price: float, now: float):
+        if self.last_price and self.last_poll and price > 0:
+            dt = max(now - self.last_poll, 1e-3)
+            sample = math.log(price / self.last_price) ** 2 / dt
+            self.variance = sample if self.variance is None else EWMA_LAMBDA * self.variance + (1 - EWMA_LAMBDA) * sample
+        self.last_price = price
+        self.last_poll = now
+        self.polls += 1
+
+    @property
+    def volatility(self) -> Optional[float]:
+        return math.sqrt(self.variance) if self.variance is not None else None
+
+
+class MarketScheduler:
+    """Polls live ticks per commodity on adaptive intervals under a global call budget"""
+
+    def __init__(self, db, on_tick: Callable, fetch_tick: Callable):
+        """
+        Args:
+            db: Database connection
+            on_tick: Coroutine function (commodity_id, price) receiving each polled price
+            fetch_tick: Coroutine function (commodity_id) -> price or None (one broker call)
+        """
+        self.db = db
+        self.on_tick = on_tick
+        self.fetch_tick = fetch_tick
+        self.schedules: Dict[str, CommoditySchedule] = {}
+        self.bucket = get_broker_bucket()
+        self._task: Optional[asyncio.Task] = None
+
+    def _config(self, settings: Dict):
+        base = float(settings.get('tick_poll_interval_seconds', 5.0))
+        minimum = float(settings.get('tick_poll_min_seconds', 1.0))
+        maximum = float(settings.get('tick_poll_max_seconds', 60.0))
+        return base, minimum, maximum
+
+    def _interval(self, schedule: CommoditySchedule, reference_vol: Optional[float], base, minimum, maximum) -> float:
+        interval = base
+        vol = schedule.volatility
+        if vol is not None and reference_vol:
+            # Twice the typical volatility -> half the interval (and vice versa)
+            interval = base * reference_vol / max(vol, reference_vol * 1e-3)
+        if schedule.held:
+            interval /= HELD_SPEEDUP
+        return min(max(interval, minimum), maximum)
+
+    async def run(self):
+        logger.info("📡 Market Scheduler gestartet (adaptive Intervalle, globales Broker-Budget)")
+        while True:
+            sleep_for = 1.0
+            try:
+                settings = await get_settings_service(self.db).get() or {}
+                if settings.get('auto_trading') or settings.get('use_trailing_stop'):
+                    sleep_for = await self._cycle(settings)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Market scheduler error: {e}")
+            await asyncio.sleep(sleep_for)
+
+    async def _cycle(self, settings: Dict) -> float:
+        """Poll all due commodities the budget allows; returns seconds until the next poll"""
+        base, minimum, maximum = self._config(settings)
+        get_broker_bucket(settings)
+
+        enabled = owned_commodities(settings.get('enabled_commodities', ['WTI_CRUDE']))
+        for commodity_id in enabled:
+            self.schedules.setdefault(commodity_id, CommoditySchedule(base))
+        for commodity_id in list(self.schedules):
+            if commodity_id not in enabled:
+                del self.schedules[commodity_id]
+
+        book = await get_position_book(self.db)
+        for commodity_id, schedule in self.schedules.items():
+            schedule.held = book.has_open(commodity_id)
+
+        now = time.monotonic()
+        if settings.get('respect_market_hours', True):
+            for commodity_id, schedule in self.schedules.items():
+                if schedule.next_due <= now:
+                    closed_for = seconds_until_open(commodity_id)
+                    if closed_for > 0:
+                        # Resume exactly at the session open; the return over the gap is not a volatility sample
+                        schedule.next_due = now + closed_for
+                        schedule.last_price = None
+
+        due = [c for c, s in self.schedules.items() if s.next_due <= now]
+        if due:
+            # Priority when the budget is short: held first, then the most overdue (relative to interval)
+            due.sort(key=lambda c: (not self.schedules[c].held, -(now - self.schedules[c].next_due) / self.schedules[c].interval))
+            granted = self.bucket.take(len(due))
+            polled = due[:granted]
+
+            if polled:
+                prices = await asyncio.gather(*[self.fetch_tick(c) for c in polled], return_exceptions=True)
+                polled_at = time.monotonic()
+                for commodity_id, price in zip(polled, prices):
+                    schedule = self.schedules[commodity_id]
+                    if isinstance(price, Exception):
+                        logger.debug(f"Tick poll failed for {commodity_id}: {price}")
+                        price = None
+                    if isinstance(price, (int, float)) and price > 0:
+                        schedule.observe(float(price), polled_at)
+                        await self.on_tick(commodity_id, price)
+
+                vols = [s.volatility for s in self.schedules.values() if s.volatility]
+                reference_vol = median(vols) if vols else None
+                for commodity_id in polled:
+                    schedule = self.schedules[commodity_id]
+                    schedule.interval = self._interval(schedule, reference_vol, base, minimum, maximum)
+                    schedule.next_due = polled_at + schedule.interval
+
+        now = time.monotonic()
+        next_due = min((s.next_due for s in self.schedules.values()), default=now + base)
+        wait = max(next_due - now, self.bucket.seconds_until_token())
+        return min(max(wait, 0.05), maximum)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "budget_calls_per_minute": round(self.bucket.rate * 60, 1),
+            "tokens": round(self.bucket.tokens, 2),
+            "commodities": {
+                commodity_id: {
+                    "interval_seconds": round(s.interval, 2),
+                    "volatility": s.volatility,
+                    "held": s.held,
+                    "due_in_seconds": round(max(s.next_due - now, 0.0), 2),
+                    "polls": s.polls,
+                }
+                for commodity_id, s in sorted(self.schedules.items())
+            },
+        }
+
+
+# Global instance
+_market_scheduler = None
+
+def get_market_scheduler(db=None, on_tick: Callable = None, fetch_tick: Callable = None) -> Optional[MarketScheduler]:
+    """Get or create the market scheduler (created by the auto-trading engine)"""
+    global _market_scheduler
+    if _market_scheduler is None and db is not None and on_tick is not None and fetch_tick is not None:
+        _market_scheduler = MarketScheduler(db, on_tick, fetch_tick)
+    return _market_scheduler
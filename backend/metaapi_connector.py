@@ -341,6 +341,39 @@ class MetaAPIConnector:
             logger.error(f"Error closing MetaAPI position: {e}")
             return False
     
+    async def modify_position(self, position_id: str, stop_loss: Optional[float] = None,
+                              take_profit: Optional[float] = None) -> bool:
+        """Change stop loss and/or take profit of an open position via MetaAPI"""
+        try:
+            url = f"{self.base_url}/users/current/accounts/{self.account_id}/trade"
+
+            payload = {
+                "actionType": "POSITION_MODIFY",
+                "positionId": str(position_id)
+            }
+            if stop_loss:
+                payload["stopLoss"] = stop_loss
+            if take_profit:
+                payload["takeProfit"] = take_profit
+
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    url,
+                    headers=self._get_headers(),
+                    json=payload,
+                    timeout=aiohttp.ClientTimeout(total=15)
+                ) as response:
+                    if response.status in [200, 201]:
+                        logger.info(f"✅ MetaAPI Position {position_id} modified: SL={stop_loss}, TP={take_profit}")
+                        return True
+                    else:
+                        error_text = await response.text()
+                        logger.error(f"MetaAPI modify failed {response.status}: {error_text}")
+                        return False
+        except Exception as e:
+            logger.error(f"Error modifying MetaAPI position: {e}")
+            return False
+
     def disconnect(self):
         """Disconnect from MetaAPI (no action needed for REST API)"""
         self.connected = False
@@ -0,0 +1,249 @@
+"""
+Position Book - In-Memory Buch aller offenen Positionen
+Wird beim Start einmal aus MongoDB geladen und bei jedem Öffnen, Schließen
+und Ändern eines Trades mitgeführt. Engine, Trailing Stops, AI Position
+Manager und Positionsgrößen-Berechnung lesen daraus statt jeweils
+trades.find({"status": "OPEN"}) auszuführen.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from stop_index import StopIndex
+
+logger = logging.getLogger(__name__)
+
+
+class PositionBook:
+    """Open trades indexed by id, commodity and platform with running exposure totals"""
+
+    def __init__(self, resync_interval: float = 300.0):
+        """
+        Args:
+            resync_interval: Seconds after which the book is reloaded from MongoDB
+                             (safety net for writes by other processes)
+        """
+        self.resync_interval = resync_interval
+        self.loaded = False
+        self.loaded_at = 0.0
+        self._trades: Dict[str, Dict] = {}
+        self._by_commodity = defaultdict(set)
+        self._by_platform = defaultdict(set)
+        self._exposure = defaultdict(float)  # platform -> sum(entry_price * quantity)
+        self._loading = False
+        self._journal = []  # Mutations that happen while a reload is in flight
+        self._version = 0  # Bumped on every change - invalidates the array view
+        self.stop_index = StopIndex()  # Sorted SL/TP levels, kept in sync with the book
+        self._arrays = None
+        self._arrays_version = -1
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    async def load(self, db):
+        """(Re)load all open trades from the database"""
+        self._loading = True
+        self._journal = []
+        try:
+            open_trades = await db.trades.find({"status": "OPEN"}).to_list(None)
+
+            self._clear()
+            for trade in open_trades:
+                self._add(trade)
+
+            # Replay changes made while the query was running
+            for method, args in self._journal:
+                getattr(self, method)(*args)
+
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+            logger.info(f"Position Book geladen: {len(self._trades)} offene Positionen")
+        finally:
+            self._loading = False
+            self._journal = []
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.loaded_at > self.resync_interval
+
+    def invalidate(self):
+        """Force a reload on the next access"""
+        self.loaded = False
+
+    # ------------------------------------------------------------------
+    # Mutations - call on every open, close and modify
+    # ------------------------------------------------------------------
+    def add(self, trade: Dict):
+        """Register a newly opened trade"""
+        if self._loading:
+            self._journal.append(('_add', (dict(trade),)))
+        self._add(dict(trade))
+
+    def remove(self, trade_id: str):
+        """Drop a closed or deleted trade"""
+        if self._loading:
+            self._journal.append(('_remove', (trade_id,)))
+        self._remove(trade_id)
+
+    def apply(self, trade_id: str, fields: Dict):
+        """Apply a `$set` style change; trades that are no longer OPEN are dropped"""
+        if self._loading:
+            self._journal.append(('_apply', (trade_id, dict(fields))))
+        self._apply(trade_id, fields)
+
+    def apply_change(self, change: Dict):
+        """Change stream handler: follow trade writes made by any process"""
+        operation = change.get('operationType')
+        trade = change.get('fullDocument')
+        if operation in ('insert', 'update', 'replace') and trade is not None:
+            if trade.get('status') == 'OPEN':
+                self.add(trade)
+            else:
+                self.remove(trade.get('id'))
+        else:
+            # Deletes only carry the _id - reload instead of guessing
+            self.invalidate()
+
+    # ------------------------------------------------------------------
+    # Lookups - returned documents are shared, do not modify them directly
+    # ------------------------------------------------------------------
+    def get(self, trade_id: str) -> Optional[Dict]:
+        return self._trades.get(trade_id)
+
+    def open_trades(self) -> List[Dict]:
+        return list(self._trades.values())
+
+    def by_commodity(self, commodity: str) -> List[Dict]:
+        return [self._trades[trade_id] for trade_id in self._by_commodity.get(commodity, ())]
+
+    def by_platform(self, platform: str) -> List[Dict]:
+        return [self._trades[trade_id] for trade_id in self._by_platform.get(platform, ())]
+
+    def has_open(self, commodity: str) -> bool:
+        return bool(self._by_commodity.get(commodity))
+
+    def exposure(self, platform: Optional[str] = None) -> float:
+        """Sum of entry_price * quantity of the open trades (of one platform or all)"""
+        if platform is not None:
+            return self._exposure.get(platform, 0.0)
+        return sum(self._exposure.values())
+
+    def __len__(self):
+        return len(self._trades)
+
+    def as_arrays(self) -> Dict:
+        """
+        Column view of the open trades for vectorized stop evaluation
+
+        Rebuilt only after the book changed. Missing/zero levels are NaN,
+        `commodity_idx` indexes into `commodities`.
+        """
+        if self._arrays is not None and self._arrays_version == self._version:
+            return self._arrays
+
+        trades = list(self._trades.values())
+        commodities = sorted({trade.get('commodity', 'WTI_CRUDE') for trade in trades})
+        position = {commodity: i for i, commodity in enumerate(commodities)}
+
+        def column(field):
+            return np.array([trade.get(field) or np.nan for trade in trades], dtype=float)
+
+        self._arrays = {
+            "ids": [trade['id'] for trade in trades],
+            "trades": trades,
+            "commodities": commodities,
+            "commodity_idx": np.array([position[trade.get('commodity', 'WTI_CRUDE')] for trade in trades], dtype=np.intp),
+            "is_buy": np.array([trade.get('type') == 'BUY' for trade in trades], dtype=bool),
+            "is_sell": np.array([trade.get('type') == 'SELL' for trade in trades], dtype=bool),
+            "entry_price": column('entry_price'),
+            "stop_loss": column('stop_loss'),
+            "take_profit": column('take_profit'),
+        }
+        self._arrays_version = self._version
+        return self._arrays
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _platform(trade: Dict) -> Optional[str]:
+        # Trades are attributed to their platform via `mode` (see calculate_position_size)
+        return trade.get('mode')
+
+    @staticmethod
+    def _notional(trade: Dict) -> float:
+        return (trade.get('entry_price') or 0) * (trade.get('quantity') or 0)
+
+    def _clear(self):
+        self._version += 1
+        self._trades.clear()
+        self.stop_index.clear()
+        self._by_commodity.clear()
+        self._by_platform.clear()
+        self._exposure.clear()
+
+    def _add(self, trade: Dict):
+        trade_id = trade.get('id')
+        if not trade_id or trade.get('status', 'OPEN') != 'OPEN':
+            return
+        if trade_id in self._trades:
+            self._remove(trade_id)
+
+        self._version += 1
+        self._trades[trade_id] = trade
+        self.stop_index.add(trade)
+        self._by_commodity[trade.get('commodity', 'WTI_CRUDE')].add(trade_id)
+        platform = self._platform(trade)
+        self._by_platform[platform].add(trade_id)
+        self._exposure[platform] += self._notional(trade)
+
+    def _remove(self, trade_id: str):
+        trade = self._trades.pop(trade_id, None)
+        if trade is None:
+            return
+        self._version += 1
+        self.stop_index.remove(trade_id)
+
+        commodity = trade.get('commodity', 'WTI_CRUDE')
+        self._by_commodity[commodity].discard(trade_id)
+        if not self._by_commodity[commodity]:
+            del self._by_commodity[commodity]
+
+        platform = self._platform(trade)
+        self._by_platform[platform].discard(trade_id)
+        self._exposure[platform] -= self._notional(trade)
+        if not self._by_platform[platform]:
+            del self._by_platform[platform]
+            del self._exposure[platform]
+
+    def _apply(self, trade_id: str, fields: Dict):
+        if 'status' in fields and fields['status'] != 'OPEN':
+            self._remove(trade_id)
+            return
+
+        trade = self._trades.get(trade_id)
+        if trade is None:
+            return
+
+        # Re-index so commodity/platform/exposure stay consistent
+        updated = dict(trade)
+        updated.update(fields)
+        self._remove(trade_id)
+        self._add(updated)
+
+
+# Global instance
+_position_book = PositionBook()
+_load_lock = asyncio.Lock()
+
+async def get_position_book(db) -> PositionBook:
+    """Get the position book, loading it on first use and resyncing it periodically"""
+    if not _position_book.loaded or _position_book.is_stale():
+        async with _load_lock:
+            if not _position_book.loaded or _position_book.is_stale():
+                await _position_book.load(db)
+    return _position_book
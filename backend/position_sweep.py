@@ -0,0 +1,143 @@
+"""
+Position Sweep - ein Durchlauf für Trailing Stops, SL/TP und KI-Schließungen
+Ersetzt die früher getrennten Schritte Trailing Stops → SL/TP-Prüfung →
+KI-Positionsverwaltung im Market Loop. Preise und
+offene Positionen werden einmal geladen, die Regeln der Reihe nach
+angewendet und alle Änderungen eines Zyklus mit einem bulk_write
+geschrieben.
+
+Reihenfolge der Regeln pro Position:
+1. Trailing Stop nachziehen (vektorisiert, trailing_stop.compute_trailing_stops)
+2. SL/TP ausgelöst? (sortierter Level-Index des Position Books)
+3. KI-Regeln (ai_position_manager.evaluate_position) mit dem neuen Stop
+
+Ein nachgezogener Stop liegt immer auf der richtigen Seite des aktuellen
+Preises, Schritt 2 kann daher die Level vor dem Nachziehen verwenden.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from position_book import get_position_book
+from trade_writes import bulk_update_trades
+from trailing_stop import price_vector, compute_trailing_stops
+from ai_position_manager import evaluate_position, position_profit_loss, load_market_signals
+from broker_stop_sync import get_broker_stop_sync
+
+logger = logging.getLogger(__name__)
+
+
+async def sweep_positions(db, current_prices: Dict[str, float], settings,
+                          market_signals: Optional[Dict[str, dict]] = None,
+                          include_ai: bool = True) -> Dict:
+    """
+    Apply trailing, trigger and AI-close rules to all open positions in one pass
+
+    Args:
+        db: Database connection
+        current_prices: Dict mapping commodity_id to current price
+        settings: Trading settings (use_trailing_stop, use_ai_analysis, ...)
+        market_signals: commodity -> {'signal', 'trend'} (latest_market_data);
+                        loaded with one `$in` query if needed and missing
+        include_ai: Apply the AI position manager rules
+
+    Returns:
+        Dict with matched/modified/failed counts and the per-trade results of
+        the stop updates and the closes
+    """
+    summary = {"matched": 0, "modified": 0, "failed": 0, "stop_updates": [], "closes": []}
+    settings = settings or {}
+    use_trailing = settings.get('use_trailing_stop', False)
+    use_ai = include_ai and settings.get('use_ai_analysis', False)
+    if not use_trailing and not use_ai:
+        return summary
+
+    try:
+        book = await get_position_book(db)
+        arrays = book.as_arrays()
+        if not arrays['ids']:
+            return summary
+
+        # 1. Trailing stops for all positions at once
+        new_stops = {}
+        if use_trailing:
+            trailing_distance = settings.get('trailing_stop_distance', 1.5) / 100
+            prices = price_vector(arrays, current_prices)
+            indices, levels = compute_trailing_stops(arrays, prices, trailing_distance)
+            for i, level in zip(indices, levels):
+                new_stops[arrays['ids'][i]] = float(level)
+
+        # 2. Triggered SL/TP levels - only the levels crossed by the price are visited
+        closes = {}  # trade_id -> (reason, exit_price, profit_loss)
+        if use_trailing:
+            for commodity, current_price in current_prices.items():
+                if not current_price:
+                    continue
+                for trade_id, reason in book.stop_index.triggered(commodity, current_price):
+                    closes[trade_id] = (reason, current_price, None)
+
+        # 3. AI rules for the remaining positions, evaluated against the trailed stop
+        if use_ai:
+            if market_signals is None:
+                market_signals = await load_market_signals(db, arrays['commodities'])
+            for trade in arrays['trades']:
+                if trade['id'] in closes:
+                    continue
+                commodity = trade.get('commodity', 'WTI_CRUDE')
+                current_price = current_prices.get(commodity)
+                if not current_price:
+                    continue
+                if trade['id'] in new_stops:
+                    trade = dict(trade, stop_loss=new_stops[trade['id']])
+                reason = evaluate_position(trade, current_price, market_signals.get(commodity))
+                if reason:
+                    closes[trade['id']] = (reason, current_price, position_profit_loss(trade, current_price))
+
+        # One bulk_write for the whole cycle - closed positions get no stop update
+        closed_at = datetime.now(timezone.utc)
+        updates = []
+        kinds = []
+        for trade_id, stop_loss in new_stops.items():
+            if trade_id not in closes:
+                updates.append((trade_id, {"stop_loss": stop_loss}))
+                kinds.append('stop')
+        for trade_id, (reason, exit_price, profit_loss) in closes.items():
+            fields = {
+                "status": "CLOSED",
+                "exit_price": exit_price,
+                "closed_at": closed_at,
+                "strategy_signal": reason
+            }
+            if profit_loss is not None:
+                fields["profit_loss"] = profit_loss
+            updates.append((trade_id, fields))
+            kinds.append('close')
+
+        if not updates:
+            return summary
+
+        result = await bulk_update_trades(db, updates, only_open=True)
+        summary.update(matched=result['matched'], modified=result['modified'], failed=result['failed'])
+
+        stop_sync = get_broker_stop_sync(db)
+        for kind, (trade_id, fields), op_result in zip(kinds, updates, result['results']):
+            if kind == 'stop':
+                summary['stop_updates'].append(op_result)
+                if op_result['ok']:
+                    # Broker side: queued, debounced and coalesced per position
+                    stop_sync.submit(trade_id, fields['stop_loss'])
+            else:
+                summary['closes'].append(op_result)
+                if op_result['ok']:
+                    logger.info(f"Position auto-closed: {fields['strategy_signal']}")
+
+        logger.info(
+            f"Position sweep: {len(summary['stop_updates'])} trailing stops, "
+            f"{len(summary['closes'])} closes in one bulk write"
+        )
+        return summary
+
+    except Exception as e:
+        logger.error(f"Error in position sweep: {e}")
+        return summary
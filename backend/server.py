@@ -6,8 +6,11 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 import uuid
+import json
+import base64
+import time
 from datetime import datetime, timezone, timedelta
 import yfinance as yf
 import pandas as pd
@@ -19,8 +22,24 @@ import asyncio
 from threading import Thread
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 from commodity_processor import COMMODITIES, fetch_commodity_data, calculate_indicators, generate_signal, calculate_position_size
-from trailing_stop import update_trailing_stops, check_stop_loss_triggers
-from ai_position_manager import manage_open_positions
+from position_sweep import sweep_positions
+from trade_writes import insert_trade, update_trade
+from date_normalization import to_utc_datetime, migrate_all_dates
+from settings_service import get_settings_service
+from backtester import STRATEGY_PARAMS, strategy_params, run_backtest
+from position_book import get_position_book
+from market_history import ensure_market_history_collections, run_rollup_loop, query_market_history, RESOLUTIONS
+from snapshot_writer import get_snapshot_writer
+from change_watcher import get_change_watcher
+from trading_pipeline import get_trading_pipeline
+from market_scheduler import get_market_scheduler, get_broker_bucket
+from market_hours import is_market_open, market_status, session_for
+from broker_stop_sync import get_broker_stop_sync
+from leader_election import get_leader_election
+from state_backend import get_state_backend, hour_key, take_slot
+from shared_market_state import attach_shared_market_state, stale_seconds
+from shard_coordinator import get_shard_coordinator, owned_commodities
+from trade_archive import ensure_archive_collections, archive_closed_trades, run_archive_loop, find_trades, get_archived_totals, get_hot_totals, delete_archived_trade
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -93,7 +112,7 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)  # Dates come back as aware UTC datetimes
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
@@ -111,9 +130,11 @@ logger = logging.getLogger(__name__)
 
 # Global variables
 latest_market_data = {}  # Dictionary to cache latest market data
+last_market_cycle = {"finished_at": 0.0, "timings": None}  # Last market data cycle of this worker
+market_cycle_lock = asyncio.Lock()  # Periodic loop and manual refresh never overlap
+MARKET_LOOP_SECONDS = float(os.environ.get('MARKET_LOOP_SECONDS', 10))
 scheduler = BackgroundScheduler()
 auto_trading_enabled = False
-trade_count_per_hour = 0
 ai_chat = None  # AI chat instance for market analysis
 
 # AI System Message
@@ -247,6 +268,11 @@ class Trade(BaseModel):
     strategy_signal: Optional[str] = None
     closed_at: Optional[datetime] = None
     mt5_ticket: Optional[str] = None  # MT5 order ticket number
+    broker_stop_loss: Optional[float] = None  # Stop loss as last sent to the broker
+
+# Fields selectable via the `fields` projection of /trades/list
+TRADE_LIST_FIELDS = set(Trade.model_fields) | {"created_at", "updated_at"}
+TRADES_PAGE_SIZE_MAX = 1000
 
 class TradingSettings(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -283,6 +309,24 @@ class TradingSettings(BaseModel):
     min_confidence_score: float = 0.6  # Minimale Konfidenz für automatisches Trading (0-1)
     use_volume_confirmation: bool = True  # Verwende Volumen zur Bestätigung
     risk_per_trade_percent: float = 2.0  # Maximales Risiko pro Trade (% der Balance)
+    tick_poll_interval_seconds: float = 5.0  # Basis-Intervall der Live-Ticks (wird je Volatilität/Position angepasst)
+    tick_poll_min_seconds: float = 1.0
+    tick_poll_max_seconds: float = 60.0
+    broker_calls_per_minute: int = 120  # Globales MetaAPI-Budget für Tick-Abfragen
+    respect_market_hours: bool = True  # Geschlossene Börsen (Wochenende, Pausen) überspringen
+    
+    # Trailing Stops an den Broker übertragen (POSITION_MODIFY), entprellt
+    sync_stops_to_broker: bool = True
+    stop_sync_min_step_percent: float = 0.1  # Mindeständerung ggü. dem Broker-Stop
+    stop_sync_min_seconds: float = 30.0  # Mindestabstand zwischen zwei Modify-Calls pro Position
+    stop_sync_calls_per_minute: int = 30  # Globales Budget für Modify-Calls
+    
+    # Archiv: geschlossene Trades älter als N Tage ins Cold Storage verschieben (0 = nie)
+    archive_closed_trades_after_days: int = 30
+    
+    # Marktdaten-Zyklus: parallel verarbeitete Rohstoffe und Timeout pro Rohstoff
+    market_data_concurrency: int = 4
+    market_data_timeout_seconds: float = 20.0
     
     # MT5 Libertex Credentials
     mt5_libertex_account_id: Optional[str] = None
@@ -306,7 +350,158 @@ class TradeStats(BaseModel):
     winning_trades: int
     losing_trades: int
 
+class BacktestRequest(BaseModel):
+    commodities: Optional[List[str]] = Field(default=None, max_length=len(COMMODITIES))  # Default: enabled commodities
+    timeframe: Literal["15m", "30m", "1h", "4h", "1d"] = "1h"
+    period: Literal["1mo", "3mo", "6mo", "1y", "2y", "5y"] = "2y"
+    rule: Literal["rsi", "macd"] = "rsi"  # rsi = Pipeline-Schwellen, macd = generate_signal
+    # Strategy parameters; missing values come from the current settings
+    rsi_oversold_threshold: Optional[float] = None
+    rsi_overbought_threshold: Optional[float] = None
+    stop_loss_percent: Optional[float] = None
+    take_profit_percent: Optional[float] = None
+    trailing_stop_distance: Optional[float] = None
+    use_trailing_stop: Optional[bool] = None
+    include_trades: bool = False
+
+# Settings cache (write-through, invalidated across processes via version counter)
+settings_service = get_settings_service(db, model=TradingSettings)
+snapshot_writer = get_snapshot_writer(db)
+# Counters and last-value tables shared by all workers (STATE_BACKEND=memory|mongo)
+state = get_state_backend(db)
+
 # Helper Functions
+def apply_market_data_change(change: dict):
+    """Change stream handler: keep latest_market_data in sync with writes of other processes"""
+    doc = change.get('fullDocument')
+    if not doc or 'commodity' not in doc:
+        return
+    current = latest_market_data.get(doc['commodity'])
+    if current is not None:
+        current_ts, new_ts = current.get('timestamp'), doc.get('timestamp')
+        if isinstance(current_ts, datetime) and isinstance(new_ts, datetime) and new_ts <= current_ts:
+            return  # Our own (write-behind) echo or an older snapshot
+    doc.pop('_id', None)
+    latest_market_data[doc['commodity']] = doc
+
+async def publish_market_data(commodity_id: str, market_data: dict):
+    """Update latest_market_data and the shared last-value table read by the other workers"""
+    latest_market_data[commodity_id] = market_data
+    await state.put("market_data", commodity_id, market_data)
+
+async def run_market_state_sync(interval_seconds: float = 2.0):
+    """Background task: follow the shared market_data table (only with a shared state backend)"""
+    cursor = None
+    while True:
+        try:
+            values, cursor = await state.changes("market_data", since=cursor)
+            for doc in values.values():
+                apply_market_data_change({"fullDocument": dict(doc)})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error syncing shared market state: {e}")
+        await asyncio.sleep(interval_seconds)
+
+shared_market = None  # Shared-memory market state of the ingestion process (MARKET_INGESTION=process)
+shared_market_retry_at = 0.0
+SHARED_MARKET_RETRY_SECONDS = 5.0
+
+def get_shared_market():
+    """Shared memory of a live ingestion process; None while there is none (fetch inline)"""
+    global shared_market, shared_market_retry_at
+    if shared_market is not None and not shared_market.is_live(stale_seconds()):
+        # Ingestion process restarted (new region) or died: never serve frozen snapshots
+        logger.warning("⚠️ Ingestion process restarted or stopped - detaching from shared market state")
+        shared_market.close()
+        shared_market = None
+    if shared_market is None and time.monotonic() >= shared_market_retry_at:
+        quiet = shared_market_retry_at > 0  # Warn only on the first failed attempt
+        shared_market = attach_shared_market_state(list(COMMODITIES.keys()), quiet=quiet)
+        shared_market_retry_at = 0.0 if shared_market is not None else time.monotonic() + SHARED_MARKET_RETRY_SECONDS
+        if shared_market is not None:
+            logger.info("📥 Attached to the ingestion process' shared market state")
+    return shared_market
+
+async def consume_shared_market_data(shared, commodity_id: str) -> bool:
+    """Publish the ingestion process' snapshot of a commodity and seed the pipeline from its candles"""
+    market_data = shared.read_snapshot(commodity_id)
+    if market_data is None:
+        return False
+    market_data["id"] = str(uuid.uuid4())
+    # Local mirror only - every worker on the host reads the region itself
+    apply_market_data_change({"fullDocument": market_data})
+    
+    pipeline = get_trading_pipeline()
+    if pipeline is not None and owned_commodities([commodity_id]):
+        candles = shared.read_candles(commodity_id)
+        if candles is not None and len(candles):
+            pipeline.seed(commodity_id, candles[:, 4])  # close column
+            await pipeline.submit_tick(commodity_id, market_data['price'])
+    return True
+
+async def run_shared_market_sync(interval_seconds: float = 1.0):
+    """Background task: pick up every snapshot the ingestion process publishes"""
+    versions = {}
+    generation = None
+    while True:
+        try:
+            shared = get_shared_market()
+            if shared is not None and shared.generation != generation:
+                # New region: sequence numbers start over
+                generation = shared.generation
+                versions = {}
+            if shared is not None:
+                for commodity_id in shared.commodities:
+                    version = shared.version(commodity_id)
+                    if version != versions.get(commodity_id):
+                        versions[commodity_id] = version
+                        await consume_shared_market_data(shared, commodity_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reading shared market state: {e}")
+        await asyncio.sleep(interval_seconds)
+
+async def start_change_watcher():
+    """Push changes of trades, settings and market data into the in-process caches"""
+    book = await get_position_book(db)
+    watcher = get_change_watcher(db)
+    watcher.register("trading_settings", settings_service.apply_change)
+    watcher.register("trades", book.apply_change)
+    watcher.register("market_data", apply_market_data_change)
+    watcher.register("leader_leases", get_leader_election(db).apply_change)
+
+    def on_status(active: bool):
+        # While the streams are live the caches only need a rare safety resync
+        settings_service.check_interval = 300.0 if active else 2.0
+        book.resync_interval = 3600.0 if active else 300.0
+
+    watcher.on_status(on_status)
+    try:
+        await watcher.start()
+    except Exception as e:
+        logger.error(f"Could not start change watcher: {e}")
+
+async def ensure_indexes():
+    """Create the indexes used by the API queries (idempotent)"""
+    try:
+        # Legacy auto-trades only have created_at - give them the sort key too
+        await db.trades.update_many(
+            {"timestamp": {"$exists": False}, "created_at": {"$exists": True}},
+            [{"$set": {"timestamp": "$created_at"}}]
+        )
+        
+        # Keyset pagination of /trades/list (newest first, optional filters)
+        await db.trades.create_index([("timestamp", -1), ("id", -1)])
+        await db.trades.create_index([("status", 1), ("timestamp", -1), ("id", -1)])
+        await db.trades.create_index([("commodity", 1), ("timestamp", -1), ("id", -1)])
+        await db.trades.create_index([("mode", 1), ("timestamp", -1), ("id", -1)])
+        await db.trades.create_index("id")
+        logger.info("Database indexes ensured")
+    except Exception as e:
+        logger.error(f"Error creating indexes: {e}")
+
 def fetch_commodity_data(commodity_id: str):
     """Fetch commodity data from Yahoo Finance"""
     try:
@@ -332,11 +527,9 @@ def fetch_commodity_data(commodity_id: str):
 async def calculate_position_size(balance: float, price: float, max_risk_percent: float = 20.0) -> float:
     """Calculate position size ensuring max 20% portfolio risk"""
     try:
-        # Get all open positions
-        open_trades = await db.trades.find({"status": "OPEN"}).to_list(100)
-        
-        # Calculate total exposure from open positions
-        total_exposure = sum([trade.get('entry_price', 0) * trade.get('quantity', 0) for trade in open_trades])
+        # Running exposure of all open positions (In-Memory Position Book)
+        book = await get_position_book(db)
+        total_exposure = book.exposure()
         
         # Calculate available capital (20% of balance minus current exposure)
         max_portfolio_value = balance * (max_risk_percent / 100)
@@ -485,77 +678,122 @@ Provide your trading recommendation in JSON format."""
         logger.error(f"Error getting AI analysis for {commodity_id}: {e}")
         return None
 
+def current_market_prices(commodity_ids, respect_hours: bool = True) -> Dict[str, float]:
+    """Latest in-memory price per commodity; closed markets are left out (no stops on stale quotes)"""
+    return {
+        commodity_id: latest_market_data[commodity_id]['price']
+        for commodity_id in commodity_ids
+        if commodity_id in latest_market_data
+        and not (respect_hours and not is_market_open(commodity_id))
+    }
+
+
+def runs_engine() -> bool:
+    """True if this worker runs the market loop (the leader, or every worker when sharded)"""
+    coordinator = get_shard_coordinator()
+    if coordinator is not None:
+        return coordinator.active
+    return get_leader_election(db).is_leader
+
+
+async def run_market_loop(interval_seconds: float = MARKET_LOOP_SECONDS):
+    """Market data cycle of the engine worker - the only place market data is fetched periodically"""
+    while True:
+        try:
+            await process_market_data()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Market loop error: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
 async def process_market_data():
-    """Background task to fetch and process market data for ALL enabled commodities"""
-    global latest_market_data, auto_trading_enabled, trade_count_per_hour
+    """Fetch and process market data for ALL enabled commodities (one cycle at a time)"""
+    async with market_cycle_lock:
+        timings = await _process_market_data()
+    last_market_cycle.update(finished_at=time.monotonic(), timings=timings)
+    return timings
+
+
+async def _process_market_data():
+    global latest_market_data, auto_trading_enabled
     
     try:
         # Get settings to check enabled commodities
-        settings = await db.trading_settings.find_one({"id": "trading_settings"})
+        settings = await settings_service.get()
         enabled_commodities = settings.get('enabled_commodities', ['WTI_CRUDE']) if settings else ['WTI_CRUDE']
+        # Sharding mode: only the commodities assigned to this worker
+        enabled_commodities = owned_commodities(enabled_commodities)
         
-        logger.info(f"Fetching market data for {len(enabled_commodities)} commodities: {enabled_commodities}")
+        concurrency = max(1, int(settings.get('market_data_concurrency', 4))) if settings else 4
+        timeout = float(settings.get('market_data_timeout_seconds', 20.0)) if settings else 20.0
         
-        # Process each enabled commodity
-        for commodity_id in enabled_commodities:
-            try:
-                await process_commodity_market_data(commodity_id, settings)
-            except Exception as e:
-                logger.error(f"Error processing {commodity_id}: {e}")
-                continue
-        
-        # Update trailing stops for all commodities
-        if settings and settings.get('use_trailing_stop', False):
-            current_prices = {}
-            for commodity_id in enabled_commodities:
-                market_data = await db.market_data.find_one(
-                    {"commodity": commodity_id},
-                    sort=[("timestamp", -1)]
-                )
-                if market_data:
-                    current_prices[commodity_id] = market_data['price']
-            
-            await update_trailing_stops(db, current_prices, settings)
-            
-            # Check for stop loss triggers
-            trades_to_close = await check_stop_loss_triggers(db, current_prices)
-            for trade_info in trades_to_close:
-                await db.trades.update_one(
-                    {"id": trade_info['id']},
-                    {
-                        "$set": {
-                            "status": "CLOSED",
-                            "exit_price": trade_info['exit_price'],
-                            "closed_at": datetime.now(timezone.utc),
-                            "strategy_signal": trade_info['reason']
-                        }
-                    }
-                )
-                logger.info(f"Position auto-closed: {trade_info['reason']}")
-        
-        # AI Position Manager - Überwacht ALLE Positionen (auch manuell eröffnete)
-        if settings and settings.get('use_ai_analysis'):
-            current_prices = {}
-            for commodity_id in enabled_commodities:
-                market_data = await db.market_data.find_one(
-                    {"commodity": commodity_id},
-                    sort=[("timestamp", -1)]
-                )
-                if market_data:
-                    current_prices[commodity_id] = market_data['price']
-            
-            await manage_open_positions(db, current_prices, settings)
+        logger.info(f"Fetching market data for {len(enabled_commodities)} commodities: {enabled_commodities} (concurrency {concurrency})")
+        
+        # Process commodities concurrently - one slow symbol must not delay the rest
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        respect_hours = settings.get('respect_market_hours', True) if settings else True
+        
+        async def process_one(commodity_id):
+            # Closed exchange: no broker calls, no indicator work
+            if respect_hours and not is_market_open(commodity_id):
+                return {"commodity": commodity_id, "status": "closed", "duration_ms": 0}
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    updated = await asyncio.wait_for(process_commodity_market_data(commodity_id, settings), timeout=timeout)
+                    status = "ok" if updated else "no_data"
+                except asyncio.TimeoutError:
+                    status = "timeout"
+                    logger.warning(f"⏱️ {commodity_id}: market data processing timed out after {timeout}s")
+                except Exception as e:
+                    status = "error"
+                    logger.error(f"Error processing {commodity_id}: {e}")
+                return {"commodity": commodity_id, "status": status, "duration_ms": round((time.monotonic() - started) * 1000)}
+        
+        cycle_started = time.monotonic()
+        timings = await asyncio.gather(*[process_one(commodity_id) for commodity_id in enabled_commodities])
+        cycle_ms = round((time.monotonic() - cycle_started) * 1000)
+        
+        slowest = max(timings, key=lambda t: t['duration_ms'], default=None)
+        logger.info(
+            f"Market data cycle: {len([t for t in timings if t['status'] == 'ok'])}/{len(timings)} ok in {cycle_ms}ms"
+            + (f" (slowest: {slowest['commodity']} {slowest['duration_ms']}ms)" if slowest else "")
+        )
+        
+        # Write the snapshots of this cycle as one batch in the background
+        snapshot_writer.request_flush()
+        
+        # Current prices from this cycle (the database write may still be pending)
+        current_prices = current_market_prices(enabled_commodities, respect_hours)
+        
+        # Trailing stops, SL/TP triggers and AI Position Manager (überwacht ALLE
+        # Positionen, auch manuell eröffnete) in einem Durchlauf mit einem bulk_write.
+        # Signale/Trends aus dem Speicher statt einer Abfrage pro Trade
+        await sweep_positions(db, current_prices, settings, market_signals=latest_market_data)
         
         logger.info("Market data processing complete for all commodities")
+        return {"duration_ms": cycle_ms, "concurrency": concurrency, "commodities": timings}
         
     except Exception as e:
         logger.error(f"Error processing market data: {e}")
+        return None
 
 
 async def process_commodity_market_data(commodity_id: str, settings):
-    """Process market data for a specific commodity - NOW WITH LIVE TICKS!"""
+    """Process market data for a specific commodity - NOW WITH LIVE TICKS!
+
+    Returns True if the market data of the commodity was updated.
+    """
+    # Separate ingestion process running: take its snapshot instead of fetching here
+    shared = get_shared_market()
+    if shared is not None:
+        return await consume_shared_market_data(shared, commodity_id)
+    
     try:
-        from commodity_processor import fetch_commodity_data, calculate_indicators, COMMODITIES
+        from commodity_processor import fetch_commodity_data, build_market_data, COMMODITIES
         from multi_platform_connector import multi_platform
         
         # PRIORITY 1: Try to get LIVE tick price from MetaAPI
@@ -572,7 +810,8 @@ async def process_commodity_market_data(commodity_id: str, settings):
                 elif 'MT5_LIBERTEX' in multi_platform.platforms:
                     connector = multi_platform.platforms['MT5_LIBERTEX'].get('connector')
                 
-                if connector:
+                # Same broker budget as the market scheduler; without a token the history close is used
+                if connector and get_broker_bucket(settings).take(1):
                     tick = await connector.get_symbol_price(symbol)
                     if tick:
                         live_price = tick['price']
@@ -580,114 +819,30 @@ async def process_commodity_market_data(commodity_id: str, settings):
             except Exception as e:
                 logger.debug(f"Could not get live tick for {commodity_id}: {e}")
         
-        # Fetch historical data for indicators (cached, so not rate-limited)
-        hist = fetch_commodity_data(commodity_id)
-        
-        # If no historical data, create minimal data with live price
-        if hist is None or hist.empty:
-            if live_price:
-                logger.info(f"Using live price only for {commodity_id}: ${live_price:.2f}")
-                # Create minimal market data without indicators
-                market_data = {
-                    "id": str(uuid.uuid4()),
-                    "timestamp": datetime.now(timezone.utc),
-                    "commodity": commodity_id,
-                    "price": live_price,
-                    "volume": 0,
-                    "sma_20": live_price,
-                    "ema_20": live_price,
-                    "rsi": 50.0,  # Neutral
-                    "macd": 0.0,
-                    "macd_signal": 0.0,
-                    "macd_histogram": 0.0,
-                    "trend": "NEUTRAL",
-                    "signal": "HOLD"
-                }
-                
-                # Store in database
-                await db.market_data.update_one(
-                    {"commodity": commodity_id},
-                    {"$set": market_data},
-                    upsert=True
-                )
-                latest_market_data[commodity_id] = market_data
-                logger.info(f"✅ Updated market data for {commodity_id}: ${live_price:.2f}, Signal: HOLD (live only)")
-                return
-            else:
-                logger.warning(f"No data for {commodity_id}, skipping update")
-                return
-        
-        # If we have live price, update the latest price in hist
-        if live_price:
-            hist.iloc[-1, hist.columns.get_loc('Close')] = live_price
-        
-        # Calculate indicators if not already present
-        if hist is not None and 'RSI' not in hist.columns:
-            hist = calculate_indicators(hist)
-            
-            # Check again if calculate_indicators returned None
-            if hist is None or hist.empty:
-                logger.warning(f"Indicators calculation failed for {commodity_id}")
-                return
-        
-        # Get latest data point - with safety check
-        if len(hist) == 0:
-            logger.warning(f"Empty history for {commodity_id}")
-            return
-            
-        latest = hist.iloc[-1]
+        # Fetch historical data for indicators (cached, so not rate-limited) -
+        # yfinance blocks, so run it in a worker thread
+        hist = await asyncio.to_thread(fetch_commodity_data, commodity_id)
         
-        # Safely get values with defaults
-        close_price = float(latest.get('Close', 0))
-        if close_price == 0:
-            logger.warning(f"Invalid close price for {commodity_id}")
+        # Snapshot with indicators (pandas/ta work, also in a worker thread)
+        market_data, hist = await asyncio.to_thread(build_market_data, commodity_id, hist, live_price, settings)
+        if market_data is None:
             return
         
-        sma_20 = float(latest.get('SMA_20', close_price))
+        # Store in database (upsert by commodity) and append to the snapshot history -
+        # write-behind, so processing does not wait for MongoDB round trips
+        snapshot_writer.submit(market_data)
         
-        # Determine trend and signal
-        trend = "UP" if close_price > sma_20 else "DOWN"
+        # Update in-memory cache and the shared state of the other workers
+        await publish_market_data(commodity_id, market_data)
         
-        # Get trading strategy parameters from settings
-        rsi_oversold = settings.get('rsi_oversold_threshold', 30.0) if settings else 30.0
-        rsi_overbought = settings.get('rsi_overbought_threshold', 70.0) if settings else 70.0
+        # Feed the auto-trading pipeline: reseed the RSI from the history, then the current price
+        pipeline = get_trading_pipeline()
+        if pipeline is not None and hist is not None:
+            pipeline.seed(commodity_id, hist['Close'].values)
+            await pipeline.submit_tick(commodity_id, market_data['price'])
         
-        # Signal logic using configurable thresholds
-        rsi = float(latest.get('RSI', 50))
-        signal = "HOLD"
-        if rsi > rsi_overbought:
-            signal = "SELL"
-        elif rsi < rsi_oversold:
-            signal = "BUY"
-        
-        # Prepare market data
-        market_data = {
-            "id": str(uuid.uuid4()),
-            "timestamp": datetime.now(timezone.utc),
-            "commodity": commodity_id,
-            "price": close_price,
-            "volume": float(latest.get('Volume', 0)),
-            "sma_20": sma_20,
-            "ema_20": float(latest.get('EMA_20', close_price)),
-            "rsi": rsi,
-            "macd": float(latest.get('MACD', 0)),
-            "macd_signal": float(latest.get('MACD_signal', 0)),
-            "macd_histogram": float(latest.get('MACD_hist', 0)),
-            "trend": trend,
-            "signal": signal
-        }
-        
-        # Store in database (upsert by commodity)
-        await db.market_data.update_one(
-            {"commodity": commodity_id},
-            {"$set": market_data},
-            upsert=True
-        )
-        
-        # Update in-memory cache
-        latest_market_data[commodity_id] = market_data
-        
-        logger.info(f"✅ Updated market data for {commodity_id}: ${close_price:.2f}, Signal: {signal}")
+        logger.info(f"✅ Updated market data for {commodity_id}: ${market_data['price']:.2f}, Signal: {market_data['signal']}")
+        return True
         
     except Exception as e:
         logger.error(f"Error processing commodity {commodity_id}: {e}")
@@ -698,7 +853,7 @@ async def process_commodity_market_data(commodity_id: str, settings):
 async def sync_mt5_positions():
     """Background task to sync closed positions from MT5 to app database"""
     try:
-        settings = await db.trading_settings.find_one({"id": "trading_settings"})
+        settings = await settings_service.get()
         if not settings or settings.get('mode') != 'MT5':
             return
         
@@ -709,8 +864,9 @@ async def sync_mt5_positions():
         mt5_positions = await connector.get_positions()
         mt5_tickets = {str(pos['ticket']) for pos in mt5_positions}
         
-        # Get open trades from database (MT5 only)
-        open_trades = await db.trades.find({"status": "OPEN", "mode": "MT5"}).to_list(100)
+        # Get open trades (MT5 only) from the position book
+        book = await get_position_book(db)
+        open_trades = book.by_platform("MT5")
         
         synced_count = 0
         for trade in open_trades:
@@ -729,15 +885,12 @@ async def sync_mt5_positions():
                     else:
                         pl = (trade['entry_price'] - current_price) * trade['quantity']
                     
-                    await db.trades.update_one(
-                        {"id": trade['id']},
-                        {"$set": {
-                            "status": "CLOSED",
-                            "exit_price": current_price,
-                            "profit_loss": pl,
-                            "closed_at": datetime.now(timezone.utc).isoformat()
-                        }}
-                    )
+                    await update_trade(db, trade['id'], {
+                        "status": "CLOSED",
+                        "exit_price": current_price,
+                        "profit_loss": pl,
+                        "closed_at": datetime.now(timezone.utc)
+                    })
                     
                     synced_count += 1
                     logger.info(f"✅ Synced closed position: {trade['commodity']} (Ticket: {mt5_ticket})")
@@ -803,7 +956,6 @@ async def sync_mt5_positions():
         
         # Store in database
         doc = market_data.model_dump()
-        doc['timestamp'] = doc['timestamp'].isoformat()
         if ai_reasoning:
             doc['ai_analysis'] = {
                 'signal': ai_signal,
@@ -815,9 +967,8 @@ async def sync_mt5_positions():
         # Auto-trading logic
         if settings and settings.get('auto_trading') and signal in ["BUY", "SELL"]:
             max_trades = settings.get('max_trades_per_hour', 3)
-            if trade_count_per_hour < max_trades:
+            if await take_slot(state, hour_key("trades_per_hour"), max_trades, ttl_seconds=7200):
                 await execute_trade_logic(signal, market_data.price, settings, commodity_id)
-                trade_count_per_hour += 1
         
         logger.info(f"{commodity_id}: Price={market_data.price}, Signal={signal}, Trend={trend}")
         
@@ -828,7 +979,8 @@ async def execute_trade_logic(signal, price, settings, commodity_id='WTI_CRUDE')
     """Execute trade based on signal"""
     try:
         # Check for open positions for this commodity
-        open_trades = await db.trades.find({"status": "OPEN", "commodity": commodity_id}).to_list(100)
+        book = await get_position_book(db)
+        open_trades = book.by_commodity(commodity_id)
         
         if signal == "BUY" and len([t for t in open_trades if t['type'] == 'BUY']) == 0:
             # Open BUY position
@@ -847,9 +999,7 @@ async def execute_trade_logic(signal, price, settings, commodity_id='WTI_CRUDE')
                 strategy_signal="RSI + MACD + Trend"
             )
             
-            doc = trade.model_dump()
-            doc['timestamp'] = doc['timestamp'].isoformat()
-            await db.trades.insert_one(doc)
+            await insert_trade(db, trade.model_dump())
             logger.info(f"{commodity_id}: BUY trade executed at {price}")
             
         elif signal == "SELL" and len([t for t in open_trades if t['type'] == 'BUY']) > 0:
@@ -857,25 +1007,16 @@ async def execute_trade_logic(signal, price, settings, commodity_id='WTI_CRUDE')
             for trade in open_trades:
                 if trade['type'] == 'BUY':
                     profit_loss = (price - trade['entry_price']) * trade['quantity']
-                    await db.trades.update_one(
-                        {"id": trade['id']},
-                        {"$set": {
-                            "status": "CLOSED",
-                            "exit_price": price,
-                            "profit_loss": profit_loss,
-                            "closed_at": datetime.now(timezone.utc).isoformat()
-                        }}
-                    )
+                    await update_trade(db, trade['id'], {
+                        "status": "CLOSED",
+                        "exit_price": price,
+                        "profit_loss": profit_loss,
+                        "closed_at": datetime.now(timezone.utc)
+                    })
                     logger.info(f"{commodity_id}: Position closed at {price}, P/L: {profit_loss}")
     except Exception as e:
         logger.error(f"Error executing trade for {commodity_id}: {e}")
 
-def reset_trade_count():
-    """Reset hourly trade count"""
-    global trade_count_per_hour
-    trade_count_per_hour = 0
-    logger.info("Hourly trade count reset")
-
 def run_async_task():
     """Run async task in separate thread - DISABLED due to event loop conflicts"""
     # This function is disabled because APScheduler's BackgroundScheduler
@@ -891,7 +1032,11 @@ async def root():
 @api_router.get("/commodities")
 async def get_commodities():
     """Get list of all available commodities"""
-    return {"commodities": COMMODITIES}
+    # Trading-hours calendar from commodity_processor.COMMODITIES (market_hours.session_for)
+    return {"commodities": {
+        commodity_id: {**info, "session": session_for(commodity_id)}
+        for commodity_id, info in COMMODITIES.items()
+    }}
 
 @api_router.get("/market/current")
 async def get_current_market(commodity: str = "WTI_CRUDE"):
@@ -900,7 +1045,7 @@ async def get_current_market(commodity: str = "WTI_CRUDE"):
         raise HTTPException(status_code=400, detail=f"Unknown commodity: {commodity}")
     
     # Check if commodity is enabled
-    settings = await db.trading_settings.find_one({"id": "trading_settings"})
+    settings = await settings_service.get()
     if settings and commodity not in settings.get('enabled_commodities', ["WTI_CRUDE"]):
         raise HTTPException(status_code=403, detail=f"Commodity {commodity} is not enabled")
     
@@ -920,7 +1065,7 @@ async def get_current_market(commodity: str = "WTI_CRUDE"):
 async def get_all_markets():
     """Get current market data for all enabled commodities"""
     try:
-        settings = await db.trading_settings.find_one({"id": "trading_settings"})
+        settings = await settings_service.get()
         enabled = settings.get('enabled_commodities', list(COMMODITIES.keys())) if settings else list(COMMODITIES.keys())
         
         results = {}
@@ -983,12 +1128,17 @@ async def get_live_ticks():
             logger.warning("No MetaAPI connector available for live ticks")
             return {"error": "MetaAPI not connected", "live_prices": {}}
         
-        # Fetch live ticks for all MT5-available commodities
+        # Fetch live ticks for all MT5-available commodities - within the shared broker budget
+        bucket = get_broker_bucket(await settings_service.get())
+        throttled = []
         for commodity_id, commodity_info in COMMODITIES.items():
             # Get symbol (prefer ICMarkets)
             symbol = commodity_info.get('mt5_icmarkets_symbol') or commodity_info.get('mt5_libertex_symbol')
             
             if symbol:
+                if not bucket.take(1):
+                    throttled.append(commodity_id)
+                    continue
                 tick = await connector.get_symbol_price(symbol)
                 if tick:
                     live_prices[commodity_id] = {
@@ -1008,7 +1158,8 @@ async def get_live_ticks():
             "live_prices": live_prices,
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "source": "MetaAPI",
-            "count": len(live_prices)
+            "count": len(live_prices),
+            "throttled": throttled
         }
         
     except Exception as e:
@@ -1099,11 +1250,11 @@ async def ai_chat_endpoint(
         from ai_chat_service import send_chat_message
         
         # Get settings from correct collection
-        settings_doc = await db.trading_settings.find_one({"id": "trading_settings"})
+        settings_doc = await settings_service.get()
         settings = settings_doc if settings_doc else {}
         
         # Get open trades
-        open_trades = await db.trades.find({"status": "OPEN"}).to_list(100)
+        open_trades = (await get_position_book(db)).open_trades()
         
         # Send message to AI
         result = await send_chat_message(
@@ -1144,17 +1295,41 @@ async def ai_chat_endpoint(
     return latest_market_data
 
 @api_router.get("/market/history")
-async def get_market_history(limit: int = 100):
-    """Get historical market data (snapshot history from DB)"""
+async def get_market_history(
+    commodity: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: str = "raw",
+    limit: int = 100
+):
+    """
+    Get historical market snapshots from the time-series history
+    
+    Parameters:
+    - commodity: Commodity ID (all commodities if omitted)
+    - start, end: Optional time range
+    - resolution: raw, 1m, 1h or 1d
+    - limit: Max number of points (1-10000)
+    """
+    if commodity and commodity not in COMMODITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown commodity: {commodity}")
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid resolution. Must be one of: {', '.join(RESOLUTIONS)}"
+        )
+    
     try:
-        data = await db.market_data.find({}, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
-        
-        # Convert timestamps
-        for item in data:
-            if isinstance(item['timestamp'], str):
-                item['timestamp'] = datetime.fromisoformat(item['timestamp']).isoformat()
-        
-        return {"data": list(reversed(data))}
+        limit = max(1, min(limit, 10000))
+        data = await query_market_history(
+            db,
+            commodity=commodity,
+            start=start,
+            end=end,
+            resolution=resolution,
+            limit=limit
+        )
+        return {"data": data, "commodity": commodity, "resolution": resolution}
     except Exception as e:
         logger.error(f"Error fetching market history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1242,7 +1417,7 @@ async def get_ohlcv_data(
 async def execute_trade(trade_type: str, price: float, quantity: float = None, commodity: str = "WTI_CRUDE"):
     """Manually execute a trade with automatic position sizing - SENDET AN MT5!"""
     try:
-        settings = await db.trading_settings.find_one({"id": "trading_settings"})
+        settings = await settings_service.get()
         if not settings:
             settings = TradingSettings().model_dump()
         
@@ -1432,12 +1607,12 @@ async def execute_trade(trade_type: str, price: float, quantity: float = None, c
                 entry_price=price,
                 stop_loss=stop_loss,
                 take_profit=take_profit,
-                strategy_signal=f"Manual - {default_platform} #{platform_ticket}"
+                strategy_signal=f"Manual - {default_platform} #{platform_ticket}",
+                mt5_ticket=str(platform_ticket) if default_platform.startswith('MT5') else None,
+                broker_stop_loss=stop_loss if default_platform.startswith('MT5') else None
             )
             
-            doc = trade.model_dump()
-            doc['timestamp'] = doc['timestamp'].isoformat()
-            await db.trades.insert_one(doc)
+            doc = await insert_trade(db, trade.model_dump())
             
             logger.info(f"✅ Trade gespeichert: {trade_type} {quantity:.4f} {commodity} @ {price}")
             
@@ -1469,15 +1644,12 @@ async def close_trade(trade_id: str, exit_price: float):
         if trade['type'] == 'SELL':
             profit_loss = -profit_loss
         
-        await db.trades.update_one(
-            {"id": trade_id},
-            {"$set": {
-                "status": "CLOSED",
-                "exit_price": exit_price,
-                "profit_loss": profit_loss,
-                "closed_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
+        await update_trade(db, trade_id, {
+            "status": "CLOSED",
+            "exit_price": exit_price,
+            "profit_loss": profit_loss,
+            "closed_at": datetime.now(timezone.utc)
+        })
         
         return {"success": True, "profit_loss": profit_loss}
     except HTTPException:
@@ -1486,45 +1658,126 @@ async def close_trade(trade_id: str, exit_price: float):
         logger.error(f"Error closing trade: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def encode_trade_cursor(trade: dict) -> str:
+    """Encode the sort key (timestamp, id) of the last trade of a page as opaque cursor"""
+    timestamp = trade.get('timestamp')
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    raw = json.dumps([timestamp, trade.get('id')])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_trade_cursor(cursor: str):
+    """Decode a cursor created by encode_trade_cursor into (timestamp, id)"""
+    try:
+        timestamp, trade_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        # Native dates are stored - compare against a datetime
+        return to_utc_datetime(timestamp) or timestamp, trade_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @api_router.get("/trades/list")
-async def get_trades(status: Optional[str] = None):
-    """Get all trades"""
+async def get_trades(
+    status: Optional[str] = None,
+    limit: int = TRADES_PAGE_SIZE_MAX,  # Clients without cursor support still get the former 1000 trades
+    cursor: Optional[str] = None,
+    platform: Optional[str] = None,
+    commodity: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    fields: Optional[str] = None
+):
+    """
+    Get trades page by page (keyset pagination, newest first)
+
+    Parameters:
+    - limit: Page size (1-1000)
+    - cursor: `next_cursor` of the previous page
+    - platform, commodity: Optional filters
+    - date_from, date_to: Optional time range on the trade timestamp
+    - fields: Comma separated projection, e.g. "commodity,type,status,profit_loss"
+    """
     try:
+        limit = max(1, min(limit, TRADES_PAGE_SIZE_MAX))
+
         query = {}
         if status:
             query['status'] = status.upper()
-        
-        # Sort by created_at (new field) or timestamp (legacy)
-        trades = await db.trades.find(query, {"_id": 0}).to_list(1000)
-        
-        # Sort manually if needed
-        trades.sort(key=lambda x: x.get('created_at') or x.get('timestamp') or '', reverse=True)
-        
-        # Convert timestamps
-        for trade in trades:
-            # Handle both created_at and timestamp fields
-            if 'timestamp' in trade and isinstance(trade['timestamp'], str):
-                trade['timestamp'] = datetime.fromisoformat(trade['timestamp']).isoformat()
-            if 'created_at' in trade and isinstance(trade['created_at'], str):
-                # Add timestamp field for frontend compatibility
-                trade['timestamp'] = trade['created_at']
-            if trade.get('closed_at') and isinstance(trade['closed_at'], str):
-                trade['closed_at'] = datetime.fromisoformat(trade['closed_at']).isoformat()
-        
-        return {"trades": trades}
+        if platform:
+            query['mode'] = platform
+        if commodity:
+            query['commodity'] = commodity
+        if date_from or date_to:
+            query['timestamp'] = {}
+            if date_from:
+                query['timestamp']['$gte'] = to_utc_datetime(date_from)
+            if date_to:
+                query['timestamp']['$lte'] = to_utc_datetime(date_to)
+
+        # Keyset: continue strictly after the last (timestamp, id) of the previous page
+        if cursor:
+            last_timestamp, last_id = decode_trade_cursor(cursor)
+            query['$or'] = [
+                {"timestamp": {"$lt": last_timestamp}},
+                {"timestamp": last_timestamp, "id": {"$lt": last_id}}
+            ]
+
+        projection = {"_id": 0}
+        if fields:
+            requested = {f.strip() for f in fields.split(',') if f.strip()}
+            unknown = requested - TRADE_LIST_FIELDS
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+            # id and timestamp are always needed for the cursor
+            for field in requested | {"id", "timestamp"}:
+                projection[field] = 1
+
+        # Sort on the indexed (timestamp, id) key - fetch one extra to detect the next page.
+        # Archived trades are merged in transparently.
+        trades = await find_trades(db, query, projection, [("timestamp", -1), ("id", -1)], limit + 1)
+
+        next_cursor = None
+        if len(trades) > limit:
+            trades = trades[:limit]
+            next_cursor = encode_trade_cursor(trades[-1])
+
+        return {"trades": trades, "next_cursor": next_cursor, "limit": limit}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching trades: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/trades/archive")
+async def archive_trades(days: Optional[int] = None, dry_run: bool = False):
+    """
+    Move closed trades older than `days` (default: archive_closed_trades_after_days) to the archive
+
+    With dry_run=true only the number of affected trades is returned.
+    """
+    try:
+        if days is None:
+            settings = await settings_service.get()
+            days = (settings or {}).get('archive_closed_trades_after_days', 30)
+        if days < 1:
+            raise HTTPException(status_code=400, detail="days must be >= 1")
+
+        return await archive_closed_trades(db, older_than_days=days, dry_run=dry_run)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error archiving trades: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.get("/trades/stats", response_model=TradeStats)
 async def get_trade_stats():
-    """Get trading statistics - includes DB trades and MT5 positions"""
+    """Get trading statistics - includes DB trades, archived trades and MT5 positions"""
     try:
-        # Get DB trades
-        db_trades = await db.trades.find({}, {"_id": 0}).to_list(10000)
+        # Hot collection (open and recently closed) and archive: aggregated totals only
+        hot = await get_hot_totals(db)
+        archived = await get_archived_totals(db)
         
         # Get MT5 positions from all active platforms
-        settings = await db.trading_settings.find_one({"id": "trading_settings"})
+        settings = await settings_service.get()
         active_platforms = settings.get('active_platforms', []) if settings else []
         
         mt5_positions = []
@@ -1551,19 +1804,19 @@ async def get_trade_stats():
                 logger.warning(f"Could not fetch MT5 ICMarkets positions: {e}")
         
         # Combine counts
-        total_trades = len(db_trades) + len(mt5_positions)
-        open_positions = len([t for t in db_trades if t['status'] == 'OPEN']) + len(mt5_positions)
-        closed_positions = len([t for t in db_trades if t['status'] == 'CLOSED'])
+        total_trades = hot['total'] + archived['closed'] + len(mt5_positions)
+        open_positions = hot['open'] + len(mt5_positions)
+        closed_positions = hot['closed'] + archived['closed']
         
         # Calculate P&L
-        closed_trades = [t for t in db_trades if t['status'] == 'CLOSED' and t.get('profit_loss') is not None]
-        db_profit_loss = sum([t['profit_loss'] for t in closed_trades])
+        db_profit_loss = hot['profit_loss'] + archived['profit_loss']
         total_profit_loss = db_profit_loss + total_mt5_pl
         
-        winning_trades = len([t for t in closed_trades if t['profit_loss'] > 0])
-        losing_trades = len([t for t in closed_trades if t['profit_loss'] <= 0])
+        winning_trades = hot['winning'] + archived['winning']
+        losing_trades = hot['losing'] + archived['losing']
+        closed_with_pl = hot['with_profit_loss'] + archived['with_profit_loss']
         
-        win_rate = (winning_trades / len(closed_trades) * 100) if len(closed_trades) > 0 else 0
+        win_rate = (winning_trades / closed_with_pl * 100) if closed_with_pl > 0 else 0
         
         return TradeStats(
             total_trades=total_trades,
@@ -1581,12 +1834,11 @@ async def get_trade_stats():
 @api_router.get("/settings", response_model=TradingSettings)
 async def get_settings():
     """Get trading settings"""
-    settings = await db.trading_settings.find_one({"id": "trading_settings"})
+    settings = await settings_service.get()
     if not settings:
         # Create default settings
         default_settings = TradingSettings()
-        doc = default_settings.model_dump()
-        await db.trading_settings.insert_one(doc)
+        await settings_service.update(default_settings.model_dump())
         return default_settings
     
     settings.pop('_id', None)
@@ -1600,7 +1852,7 @@ async def update_settings(settings: TradingSettings):
         doc = settings.model_dump(exclude_unset=False, exclude_none=False)
         
         # Get existing settings first to preserve API keys
-        existing = await db.trading_settings.find_one({"id": "trading_settings"})
+        existing = await settings_service.get()
         
         # Merge: Keep existing values for fields that weren't explicitly set
         if existing:
@@ -1610,11 +1862,8 @@ async def update_settings(settings: TradingSettings):
                 if key in existing and (key not in doc or doc[key] is None or doc[key] == ''):
                     doc[key] = existing[key]
         
-        await db.trading_settings.update_one(
-            {"id": "trading_settings"},
-            {"$set": doc},
-            upsert=True
-        )
+        # Write-through: updates the cache and bumps the version for other workers
+        await settings_service.update(doc)
         
         # Reinitialize AI chat with new settings
         provider = settings.ai_provider
@@ -1674,7 +1923,7 @@ async def reset_settings_to_default():
         )
         
         # Get existing settings to preserve API keys
-        existing = await db.trading_settings.find_one({"id": "trading_settings"})
+        existing = await settings_service.get()
         
         # Preserve API keys and credentials
         if existing:
@@ -1686,12 +1935,8 @@ async def reset_settings_to_default():
             default_settings.mt5_icmarkets_account_id = existing.get('mt5_icmarkets_account_id')
             default_settings.bitpanda_email = existing.get('bitpanda_email')
         
-        # Update database
-        await db.trading_settings.update_one(
-            {"id": "trading_settings"},
-            {"$set": default_settings.model_dump()},
-            upsert=True
-        )
+        # Update database (write-through)
+        await settings_service.update(default_settings.model_dump())
         
         # Reinitialize AI with default settings
         init_ai_chat(provider="emergent", model="gpt-5")
@@ -1705,61 +1950,110 @@ async def reset_settings_to_default():
 
 @api_router.post("/market/refresh")
 async def refresh_market_data():
-    """Manually refresh market data"""
-    await process_market_data()
-    return {"success": True, "message": "Market data refreshed"}
+    """Manually refresh market data (returns per-commodity timings)
+
+    Only the engine worker fetches market data; other workers answer from the
+    cached snapshots. A cycle that finished less than half a loop interval ago
+    is not repeated (the dashboard polls this endpoint).
+    """
+    if not runs_engine():
+        return {"success": True, "message": "Market data served from cache (engine runs in another worker)",
+                "timings": None, "commodities": sorted(latest_market_data)}
+    if time.monotonic() - last_market_cycle["finished_at"] < MARKET_LOOP_SECONDS / 2:
+        return {"success": True, "message": "Market data is current", "timings": last_market_cycle["timings"]}
+    timings = await process_market_data()
+    return {"success": True, "message": "Market data refreshed", "timings": timings}
+
+@api_router.get("/auto-trading/pipeline")
+async def get_pipeline_status():
+    """Auto-trading pipeline status: queue depths, counters and last tick-to-order latency"""
+    pipeline = get_trading_pipeline()
+    if pipeline is None:
+        return {"running": False}
+    return pipeline.status()
+
+@api_router.get("/system/leader")
+async def get_leader_status():
+    """Which worker holds the leader lease (runs auto-trading and the market loop)"""
+    return get_leader_election(db).status()
+
+@api_router.get("/system/shards")
+async def get_shard_assignments():
+    """Engine workers and their commodity shards (sharding mode)"""
+    coordinator = get_shard_coordinator()
+    if coordinator is None:
+        return {"sharding": False}
+    return {
+        "sharding": True,
+        "worker_id": coordinator.worker_id,
+        "shard": coordinator.shard,
+        "workers": await coordinator.assignments(),
+    }
+
+@api_router.get("/market/hours")
+async def get_market_hours():
+    """Exchange session state (open / next open) of the enabled commodities"""
+    settings = await settings_service.get()
+    enabled = settings.get('enabled_commodities', list(COMMODITIES.keys())) if settings else list(COMMODITIES.keys())
+    return {"now": datetime.now(timezone.utc).isoformat(), "commodities": market_status(enabled)}
+
+@api_router.get("/market/schedule")
+async def get_market_schedule():
+    """Adaptive tick polling: interval, volatility and exposure per commodity"""
+    scheduler = get_market_scheduler()
+    if scheduler is None:
+        return {"commodities": {}}
+    return scheduler.status()
 
 @api_router.post("/trailing-stop/update")
 async def update_trailing_stops_endpoint():
     """Update trailing stops for all open positions"""
     try:
         # Get current market data
-        settings = await db.trading_settings.find_one({"id": "trading_settings"})
+        settings = await settings_service.get()
         
         if not settings or not settings.get('use_trailing_stop', False):
             return {"success": False, "message": "Trailing stop not enabled"}
         
-        # Get latest prices for all commodities
-        current_prices = {}
+        # Latest prices from memory, one sweep and one bulk write
         enabled = settings.get('enabled_commodities', ['WTI_CRUDE'])
-        
-        for commodity_id in enabled:
-            market_data = await db.market_data.find_one(
-                {"commodity": commodity_id},
-                sort=[("timestamp", -1)]
-            )
-            if market_data:
-                current_prices[commodity_id] = market_data['price']
-        
-        # Update trailing stops
-        await update_trailing_stops(db, current_prices, settings)
-        
-        # Check for stop loss triggers
-        trades_to_close = await check_stop_loss_triggers(db, current_prices)
-        
-        # Close triggered positions
-        for trade_info in trades_to_close:
-            await db.trades.update_one(
-                {"id": trade_info['id']},
-                {
-                    "$set": {
-                        "status": "CLOSED",
-                        "exit_price": trade_info['exit_price'],
-                        "closed_at": datetime.now(timezone.utc),
-                        "strategy_signal": trade_info['reason']
-                    }
-                }
-            )
+        current_prices = current_market_prices(enabled, settings.get('respect_market_hours', True))
+        result = await sweep_positions(db, current_prices, settings, include_ai=False)
         
         return {
             "success": True,
             "message": "Trailing stops updated",
-            "closed_positions": len(trades_to_close)
+            "closed_positions": len([c for c in result['closes'] if c['ok']]),
+            "stop_updates": result['stop_updates'],
+            "closes": result['closes']
         }
     except Exception as e:
         logger.error(f"Error updating trailing stops: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+backtest_slots = asyncio.Semaphore(2)  # Concurrent backtests per worker
+
+@api_router.post("/backtest")
+async def backtest_strategy(request: BacktestRequest):
+    """Replay stored candles through the signal rules and SL/TP/trailing exits"""
+    settings = await settings_service.get() or {}
+    commodities = list(dict.fromkeys(request.commodities or settings.get('enabled_commodities', ['WTI_CRUDE'])))
+    unknown = [c for c in commodities if c not in COMMODITIES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown commodities: {', '.join(unknown)}")
+
+    params = strategy_params(settings, **request.model_dump(include=set(STRATEGY_PARAMS)))
+    use_trailing = request.use_trailing_stop
+    if use_trailing is None:
+        use_trailing = settings.get('use_trailing_stop', False)
+    try:
+        async with backtest_slots:
+            return await run_backtest(commodities, params, request.timeframe, request.period, request.rule,
+                                      use_trailing, include_trades=request.include_trades)
+    except Exception as e:
+        logger.error(f"Error running backtest: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # MT5 Integration Endpoints
 @api_router.get("/mt5/account")
 async def get_mt5_account():
@@ -1788,7 +2082,7 @@ async def get_bitpanda_account():
         from bitpanda_connector import get_bitpanda_connector
         
         # Get API key from settings or environment
-        settings = await db.trading_settings.find_one({"id": "trading_settings"})
+        settings = await settings_service.get()
         api_key = settings.get('bitpanda_api_key') if settings else None
         
         if not api_key:
@@ -1814,7 +2108,7 @@ async def get_bitpanda_account():
 async def get_bitpanda_status():
     """Check Bitpanda connection status"""
     try:
-        settings = await db.trading_settings.find_one({"id": "trading_settings"})
+        settings = await settings_service.get()
         api_key = settings.get('bitpanda_api_key') if settings else None
         
         if not api_key:
@@ -1864,9 +2158,12 @@ async def delete_trade(trade_id: str):
     try:
         result = await db.trades.delete_one({"id": trade_id})
         
-        if result.deleted_count == 0:
+        # Not in the hot collection - may already be archived
+        if result.deleted_count == 0 and not await delete_archived_trade(db, trade_id):
             raise HTTPException(status_code=404, detail="Trade nicht gefunden")
         
+        (await get_position_book(db)).remove(trade_id)
+        
         # Recalculate stats
         open_count = await db.trades.count_documents({"status": "OPEN"})
         closed_count = await db.trades.count_documents({"status": "CLOSED"})
@@ -2082,10 +2379,8 @@ async def get_platform_account(platform_name: str):
             balance = account_info.get('balance', 0)
             
             # Get open trades for this platform
-            open_trades = await db.trades.find({
-                "mode": platform_name,
-                "status": "OPEN"
-            }).to_list(1000)
+            book = await get_position_book(db)
+            open_trades = book.by_platform(platform_name)
             
             # Calculate total risk exposure
             total_risk = 0.0
@@ -2146,13 +2441,97 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+leader_tasks = []  # Background loops owned by the leader worker
+engine_tasks = []  # Market loop of the engine worker (leader, or every worker when sharded)
+
+async def start_engine_jobs():
+    """Auto-trading engine and market loop - in the leader, or in every worker when sharded"""
+    # Push trailing stop changes to the broker (debounced, coalesced)
+    get_broker_stop_sync(db).start()
+    
+    # Start Auto-Trading Engine first so the initial market data seeds its pipeline
+    from auto_trading_engine import get_auto_trading_engine
+    auto_engine = get_auto_trading_engine(db, latest_market_data)
+    await auto_engine.start()
+    logger.info("🤖 Auto-Trading Engine gestartet (LIVE TICKER - Tick → Order Pipeline)")
+    
+    # Periodic market data cycle (in the background - the lease heartbeat must not wait for it)
+    engine_tasks.append(asyncio.create_task(run_market_loop()))
+
+async def stop_engine_jobs():
+    from auto_trading_engine import get_auto_trading_engine
+    for task in engine_tasks:
+        task.cancel()
+    await asyncio.gather(*engine_tasks, return_exceptions=True)
+    engine_tasks.clear()
+    await get_auto_trading_engine(db).stop()
+    await get_broker_stop_sync(db).stop()
+
+async def start_leader_jobs():
+    """Start everything that must run exactly once across all workers"""
+    if get_shard_coordinator() is None:
+        await start_engine_jobs()
+    
+    # Online migration of legacy ISO-string timestamps to native dates (batched, idempotent)
+    leader_tasks.append(asyncio.create_task(migrate_all_dates(db)))
+    
+    # Keep 1m/1h/1d rollups of the snapshot history up to date
+    leader_tasks.append(asyncio.create_task(run_rollup_loop(db)))
+    
+    # Move old closed trades to the cold archive (age from settings)
+    leader_tasks.append(asyncio.create_task(run_archive_loop(db)))
+
+async def stop_leader_jobs():
+    """Stop the leader-only jobs (leadership lost or shutdown)"""
+    if get_shard_coordinator() is None:
+        await stop_engine_jobs()
+    for task in leader_tasks:
+        task.cancel()
+    await asyncio.gather(*leader_tasks, return_exceptions=True)
+    leader_tasks.clear()
+
+async def on_shard_change(added, removed):
+    """Seed the pipeline for commodities taken over from another worker"""
+    if added:
+        asyncio.create_task(process_market_data())
+
+async def load_latest_market_data():
+    """Fill latest_market_data from the database (followers do not fetch market data themselves)"""
+    try:
+        async for doc in db.market_data.find({}, {"_id": 0}):
+            apply_market_data_change({"fullDocument": doc})
+    except Exception as e:
+        logger.error(f"Error loading latest market data: {e}")
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize background tasks on startup"""
     logger.info("Starting WTI Smart Trader API...")
     
+    await ensure_indexes()
+    await ensure_market_history_collections(db)
+    await ensure_archive_collections(db)
+    
+    # Background writer for market_data upserts and snapshot history
+    snapshot_writer.start()
+    
+    # Shared state: all workers serve the market snapshots published by the leader
+    await state.ensure()
+    if state.shared:
+        asyncio.create_task(run_market_state_sync())
+    
+    # Market data from a separate ingestion process via shared memory (same host)
+    if os.environ.get('MARKET_INGESTION', 'inline').lower() == 'process':
+        asyncio.create_task(run_shared_market_sync())
+    
+    # Load open positions once - kept in sync on every open/close/modify
+    await get_position_book(db)
+    
+    # Cross-process cache invalidation (requires a replica set, otherwise polling)
+    await start_change_watcher()
+    
     # Load settings and initialize AI
-    settings = await db.trading_settings.find_one({"id": "trading_settings"})
+    settings = await settings_service.get()
     if settings:
         provider = settings.get('ai_provider', 'emergent')
         model = settings.get('ai_model', 'gpt-5')
@@ -2182,14 +2561,11 @@ async def startup_event():
     if mt5_login and mt5_password and mt5_server:
         # Update default settings with MT5 credentials
         if settings:
-            await db.trading_settings.update_one(
-                {"id": "trading_settings"},
-                {"$set": {
-                    "mt5_login": mt5_login,
-                    "mt5_password": mt5_password,
-                    "mt5_server": mt5_server
-                }}
-            )
+            await settings_service.update({
+                "mt5_login": mt5_login,
+                "mt5_password": mt5_password,
+                "mt5_server": mt5_server
+            })
         else:
             # Create default settings with MT5 credentials
             default_settings = TradingSettings(
@@ -2197,7 +2573,7 @@ async def startup_event():
                 mt5_password=mt5_password,
                 mt5_server=mt5_server
             )
-            await db.trading_settings.insert_one(default_settings.model_dump())
+            await settings_service.update(default_settings.model_dump())
         
         logger.info(f"MT5 credentials loaded: Server={mt5_server}, Login={mt5_login}")
     
@@ -2211,14 +2587,24 @@ async def startup_event():
     await multi_platform.connect_platform('MT5_LIBERTEX')
     logger.info("Platform connector initialized and platforms connected for MetaAPI chart data")
     
-    # Fetch initial market data
-    await process_market_data()
+    # Sharding mode: every worker runs the engine for its part of the commodities
+    coordinator = get_shard_coordinator(db)
+    if coordinator is not None:
+        coordinator.on_change(on_shard_change)
+        await coordinator.start()
+        await start_engine_jobs()
     
-    # Start Auto-Trading Engine (LIVE TICKER MODE)
-    from auto_trading_engine import get_auto_trading_engine
-    auto_engine = get_auto_trading_engine(db)
-    asyncio.create_task(auto_engine.start())
-    logger.info("🤖 Auto-Trading Engine gestartet (LIVE TICKER - alle 10 Sekunden)")
+    # Engine, market loop and the singleton jobs run in exactly one worker (MongoDB lease)
+    election = get_leader_election(db)
+    election.on_elected(start_leader_jobs)
+    election.on_revoked(stop_leader_jobs)
+    await election.start()
+    
+    if not election.is_leader or coordinator is not None:
+        # Serve the latest data of the commodities processed by other workers
+        await load_latest_market_data()
+    if not election.is_leader and coordinator is None:
+        logger.info("Follower worker - auto-trading runs in the leader process")
     
     logger.info("API ready - market data available via /api/market/current and /api/market/refresh")
     logger.info("AI analysis enabled for intelligent trading decisions")
@@ -2228,5 +2614,12 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     scheduler.shutdown()
+    await get_leader_election(db).stop()  # Stops the leader jobs and releases the lease
+    coordinator = get_shard_coordinator()
+    if coordinator is not None:
+        await stop_engine_jobs()
+        await coordinator.stop()  # Leave the ring so the shard moves immediately
+    await get_change_watcher(db).stop()
+    await snapshot_writer.stop()  # Flush buffered snapshots before the connection closes
     client.close()
     logger.info("Application shutdown complete")
\ No newline at end of file
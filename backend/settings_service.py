@@ -0,0 +1,143 @@
+"""
+Settings Service - In-Process Cache für die Trading Settings
+Hält die validierten TradingSettings im Speicher. Schreibzugriffe laufen
+über den Service (write-through) und erhöhen einen Versionszähler im
+Settings-Dokument, über den andere Prozesse Änderungen erkennen.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_ID = "trading_settings"
+
+
+class SettingsService:
+    """Caches the trading settings document and invalidates it via a version counter"""
+
+    def __init__(self, db, model=None, check_interval: float = 2.0):
+        """
+        Args:
+            db: Database connection
+            model: Pydantic model used to validate the settings (TradingSettings)
+            check_interval: Seconds between version checks against MongoDB
+        """
+        self.db = db
+        self.model = model
+        self.check_interval = check_interval
+        self._settings = None  # Validated model instance
+        self._doc: Optional[Dict[str, Any]] = None  # Dict view handed to consumers
+        self._version = None
+        self._loaded = False
+        self._last_check = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> Optional[Dict[str, Any]]:
+        """Current settings as dict (None if no settings document exists yet)"""
+        await self._refresh_if_stale()
+        return dict(self._doc) if self._doc is not None else None
+
+    async def get_model(self):
+        """Current settings as validated model instance (None if no settings document exists yet)"""
+        await self._refresh_if_stale()
+        return self._settings
+
+    async def update(self, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Write-through update: `$set` fields, bump the version and refresh the cache"""
+        fields = {k: v for k, v in fields.items() if k not in ('_id', 'version')}
+        fields['id'] = SETTINGS_ID
+
+        async with self._lock:
+            doc = await self.db.trading_settings.find_one_and_update(
+                {"id": SETTINGS_ID},
+                {"$set": fields, "$inc": {"version": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            self._apply(doc)
+
+        logger.info(f"Settings updated (version {self._version})")
+        return dict(self._doc) if self._doc is not None else None
+
+    def invalidate(self):
+        """Force a reload on the next access"""
+        self._loaded = False
+
+    def apply_change(self, change: Dict[str, Any]):
+        """Change stream handler: take over settings written by any process"""
+        operation = change.get('operationType')
+        if operation in ('insert', 'update', 'replace'):
+            doc = change.get('fullDocument')
+            if doc is None:
+                self.invalidate()
+            elif doc.get('id') == SETTINGS_ID and doc.get('version', 0) >= (self._version or 0):
+                self._apply(doc)
+                logger.info(f"Settings changed externally (version {self._version})")
+        elif operation in ('delete', 'drop', 'invalidate'):
+            self.invalidate()
+
+    async def _refresh_if_stale(self):
+        if self._loaded and time.monotonic() - self._last_check < self.check_interval:
+            return
+
+        async with self._lock:
+            if self._loaded and time.monotonic() - self._last_check < self.check_interval:
+                return
+
+            # Cheap check: only the version field
+            marker = await self.db.trading_settings.find_one({"id": SETTINGS_ID}, {"_id": 0, "version": 1})
+            version = marker.get('version', 0) if marker is not None else None
+
+            if not self._loaded or version != self._version:
+                doc = await self.db.trading_settings.find_one({"id": SETTINGS_ID})
+                self._apply(doc)
+                if self._loaded:
+                    logger.info(f"Settings reloaded (version {self._version})")
+
+            self._loaded = True
+            self._last_check = time.monotonic()
+
+    def _apply(self, doc: Optional[Dict[str, Any]]):
+        """Validate a raw settings document and store it in the cache"""
+        if doc is None:
+            self._settings = None
+            self._doc = None
+            self._version = None
+        else:
+            doc = dict(doc)
+            doc.pop('_id', None)
+            self._version = doc.pop('version', 0)
+
+            if self.model is not None:
+                try:
+                    self._settings = self.model(**doc)
+                    self._doc = self._settings.model_dump()
+                except Exception as e:
+                    # Keep serving the raw document rather than failing every request
+                    logger.error(f"Invalid settings document (version {self._version}): {e}")
+                    self._settings = None
+                    self._doc = doc
+            else:
+                self._doc = doc
+
+        self._loaded = True
+        self._last_check = time.monotonic()
+
+
+# Global instance
+_settings_service = None
+
+def get_settings_service(db, model=None) -> SettingsService:
+    """Get or create settings service instance"""
+    global _settings_service
+    if _settings_service is None:
+        _settings_service = SettingsService(db, model=model)
+    elif model is not None and _settings_service.model is None:
+        _settings_service.model = model
+        _settings_service.invalidate()
+    return _settings_service
@@ -0,0 +1,234 @@
+"""
+Shard Coordinator - Commodities auf mehrere Engine-Worker verteilen
+Im Sharding-Modus (ENGINE_SHARDING=1) läuft die Auto-Trading Engine in jedem
+uvicorn Worker, aber jeder Worker ist nur für einen Teil der Commodities
+zuständig: Marktdaten-Abruf, Signale und Stop-Überwachung seines Shards.
+
+- Jeder Worker meldet sich per Heartbeat in `engine_workers` an
+- Die Zuordnung Commodity → Worker ergibt sich aus einem Consistent-Hash-Ring
+  über alle lebenden Worker (virtuelle Knoten für gleichmäßige Verteilung);
+  jeder Worker berechnet sie selbst und trägt seinen Shard in sein Dokument ein
+- Stirbt ein Worker, fällt er nach `ttl_seconds` aus dem Ring; nur seine
+  Commodities wandern zu den übrigen Workern
+
+Während eines Wechsels können zwei Worker für höchstens einen Heartbeat
+dieselbe Commodity bedienen; das Position Book verhindert doppelte Trades.
+Erreicht ein Worker die Datenbank länger als `ttl_seconds` nicht, gibt er
+seinen Shard selbst auf (Fencing) - die anderen Worker haben ihn dann
+bereits übernommen.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import inspect
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+WORKERS_COLLECTION = "engine_workers"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 64):
+        self.vnodes = vnodes
+        self._ring: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            if point not in self._owners:
+                bisect.insort(self._ring, point)
+                self._owners[point] = node
+
+    def remove(self, node: str):
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._ring.remove(point)
+
+    def owner(self, key: str) -> Optional[str]:
+        """Node owning the key: first virtual node clockwise from the key's hash"""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._ring, _hash(key)) % len(self._ring)
+        return self._owners[self._ring[index]]
+
+
+class ShardCoordinator:
+    """Heartbeat-based worker membership and consistent-hash commodity assignment"""
+
+    def __init__(self, db, heartbeat_seconds: float = 5.0, ttl_seconds: float = 15.0, vnodes: int = 64):
+        """
+        Args:
+            db: Database connection
+            heartbeat_seconds: Membership / assignment refresh interval
+            ttl_seconds: A worker without heartbeat for this long is considered dead
+            vnodes: Virtual nodes per worker on the hash ring
+        """
+        self.db = db
+        self.heartbeat_seconds = heartbeat_seconds
+        self.ttl_seconds = ttl_seconds
+        self.vnodes = vnodes
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.workers: List[str] = []
+        self.shard: List[str] = []
+        self.active = False
+        self.last_heartbeat: Optional[float] = None  # monotonic time of the last successful heartbeat
+        self._on_change: List[Callable] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def on_change(self, callback: Callable):
+        """Call callback(added, removed) (sync or async) when the own shard changes"""
+        self._on_change.append(callback)
+
+    def fenced(self) -> bool:
+        """True once the last successful heartbeat is older than the TTL (the shard moved away)"""
+        return self.last_heartbeat is None or time.monotonic() - self.last_heartbeat > self.ttl_seconds
+
+    def owns(self, commodity_id: str) -> bool:
+        return commodity_id in self.shard and not self.fenced()
+
+    async def _set_shard(self, shard: List[str]):
+        previous = set(self.shard)
+        self.shard = shard
+        if set(shard) != previous:
+            added = sorted(set(shard) - previous)
+            removed = sorted(previous - set(shard))
+            logger.info(f"🧩 Shard von {self.worker_id}: {len(shard)} Commodities bei {len(self.workers)} Workern (+{added} -{removed})")
+            for callback in self._on_change:
+                try:
+                    result = callback(added, removed)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"Shard change callback failed: {e}")
+
+    async def heartbeat(self):
+        """Report liveness, read the live workers and recompute the own shard"""
+        from commodity_processor import COMMODITIES
+
+        started = time.monotonic()
+        collection = self.db[WORKERS_COLLECTION]
+        await collection.update_one(
+            {"_id": self.worker_id},
+            [{"$set": {
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "heartbeat_at": "$$NOW",
+                "started_at": {"$ifNull": ["$started_at", "$$NOW"]},
+            }}],
+            upsert=True,
+        )
+
+        ttl_ms = int(self.ttl_seconds * 1000)
+        live = await collection.find(
+            {"$expr": {"$gt": ["$heartbeat_at", {"$subtract": ["$$NOW", ttl_ms]}]}},
+            {"_id": 1}
+        ).to_list(None)
+        workers = sorted(doc["_id"] for doc in live)
+
+        ring = HashRing(workers, vnodes=self.vnodes)
+        shard = sorted(c for c in COMMODITIES if ring.owner(c) == self.worker_id)
+
+        # Record the assignment so operators (and /system/shards) can see it
+        await collection.update_one({"_id": self.worker_id}, {"$set": {"commodities": shard, "workers": len(workers)}})
+
+        # Long-dead workers are removed for good
+        await collection.delete_many(
+            {"$expr": {"$lt": ["$heartbeat_at", {"$subtract": ["$$NOW", ttl_ms * 4]}]}}
+        )
+
+        # Counted from the start of the round trip: the others saw us alive at the latest then
+        self.last_heartbeat = started
+        self.workers = workers
+        await self._set_shard(shard)
+
+    async def run(self):
+        while True:
+            try:
+                await self.heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.error(f"Shard heartbeat failed: {e}")
+                if self.shard and self.fenced():
+                    # The other workers took over our commodities - stop serving them
+                    logger.warning(f"🚧 No heartbeat for {self.ttl_seconds}s - giving up shard of {self.worker_id}")
+                    await self._set_shard([])
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    async def start(self):
+        """First assignment before the engine starts, then heartbeats in the background"""
+        self.active = True
+        await self.heartbeat()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Leave the ring right away so the other workers take over the shard without waiting for the TTL"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.active = False
+        try:
+            await self.db[WORKERS_COLLECTION].delete_one({"_id": self.worker_id})
+        except PyMongoError as e:
+            logger.warning(f"Could not deregister engine worker: {e}")
+
+    async def assignments(self) -> List[Dict]:
+        """All registered workers with their shards"""
+        return await self.db[WORKERS_COLLECTION].find({}).sort("_id", 1).to_list(None)
+
+
+# Global instance
+_shard_coordinator = None
+
+def sharding_enabled() -> bool:
+    return os.environ.get('ENGINE_SHARDING', '0').lower() in ('1', 'true', 'yes')
+
+def get_shard_coordinator(db=None) -> Optional[ShardCoordinator]:
+    """Get or create the shard coordinator (None unless ENGINE_SHARDING is set)"""
+    global _shard_coordinator
+    if _shard_coordinator is None and db is not None and sharding_enabled():
+        _shard_coordinator = ShardCoordinator(
+            db,
+            heartbeat_seconds=float(os.environ.get('SHARD_HEARTBEAT_SECONDS', 5)),
+            ttl_seconds=float(os.environ.get('SHARD_TTL_SECONDS', 15)),
+        )
+    return _shard_coordinator
+
+def worker_share() -> float:
+    """Fraction of global budgets (broker calls) this worker may use: 1 / live engine workers"""
+    coordinator = _shard_coordinator
+    if coordinator is None or not coordinator.active:
+        return 1.0
+    return 1.0 / max(1, len(coordinator.workers))
+
+def owned_commodities(commodity_ids: Iterable[str]) -> List[str]:
+    """The commodities this worker is responsible for (all of them without sharding)"""
+    coordinator = _shard_coordinator
+    if coordinator is None or not coordinator.active:
+        return list(commodity_ids)
+    return [commodity_id for commodity_id in commodity_ids if coordinator.owns(commodity_id)]
@@ -0,0 +1,340 @@
+"""
+Shared Market State - Marktdaten im Shared Memory
+Der Ingestion-Prozess (ingestion_process.py) schreibt den letzten Snapshot
+und die letzten Kerzen jeder Commodity in einen Shared-Memory-Block mit
+festem Layout. API-Worker auf demselben Host lesen daraus ohne Serialisierung
+und ohne Netzwerk-Roundtrip.
+
+Layout (alles NumPy-Arrays über einem Block):
+- header   int64[6]          magic, version, Anzahl Commodities, Kerzen pro Commodity,
+                             Generation (0 = abgelöst), Heartbeat des Schreibers (Unix ms)
+- names    S32[N]            Commodity pro Zeile
+- seq      uint64[N]         Sequence Lock pro Commodity (ungerade = Schreiben läuft)
+- snapshot float64[N, F]     SNAPSHOT_FIELDS (trend/signal als Codes)
+- counts   int64[N]          Anzahl gültiger Kerzen
+- candles  float64[N, C, 6]  CANDLE_FIELDS, rechtsbündig (neueste Kerze zuletzt)
+
+Es gibt genau einen Schreiber. Leser kopieren eine Zeile und prüfen danach,
+ob sich die Sequenznummer geändert hat; wenn ja, wird erneut gelesen.
+
+Startet der Ingestion-Prozess neu, markiert er den alten Block als abgelöst
+(Generation 0), bevor er einen neuen anlegt. Leser prüfen Generation und
+Heartbeat (is_live) und hängen sich neu an bzw. holen die Daten selbst,
+solange kein lebender Schreiber existiert.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAME = "wti_market_state"
+MAGIC = 0x4D4B5453  # "MKTS"
+VERSION = 2
+HEADER_SIZE = 6
+_GENERATION = 4
+_HEARTBEAT = 5
+NAME_DTYPE = "S32"
+
+SNAPSHOT_FIELDS = ("timestamp", "price", "volume", "sma_20", "ema_20", "rsi",
+                   "macd", "macd_signal", "macd_histogram", "trend", "signal")
+CANDLE_FIELDS = ("time", "open", "high", "low", "close", "volume")
+
+TREND_CODES = {"DOWN": -1.0, "NEUTRAL": 0.0, "UP": 1.0}
+SIGNAL_CODES = {"SELL": -1.0, "HOLD": 0.0, "BUY": 1.0}
+_TRENDS = {code: name for name, code in TREND_CODES.items()}
+_SIGNALS = {code: name for name, code in SIGNAL_CODES.items()}
+
+_FIELD = {name: i for i, name in enumerate(SNAPSHOT_FIELDS)}
+_HIST_COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+
+
+def _layout(n_commodities: int, n_candles: int):
+    """(name, dtype, shape, offset) of every array and the total size in bytes"""
+    arrays = []
+    offset = 0
+    for name, dtype, shape in (
+        ("header", np.int64, (HEADER_SIZE,)),
+        ("names", np.dtype(NAME_DTYPE), (n_commodities,)),
+        ("seq", np.uint64, (n_commodities,)),
+        ("snapshot", np.float64, (n_commodities, len(SNAPSHOT_FIELDS))),
+        ("counts", np.int64, (n_commodities,)),
+        ("candles", np.float64, (n_commodities, n_candles, len(CANDLE_FIELDS))),
+    ):
+        arrays.append((name, dtype, shape, offset))
+        offset += int(np.dtype(dtype).itemsize * np.prod(shape))
+        offset += -offset % 8  # Keep the following arrays 8-byte aligned
+    return arrays, offset
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class SharedMarketState:
+    """Fixed-layout market snapshot / candle arrays in shared memory, one writer, many readers"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, commodities: List[str], n_candles: int, owner: bool):
+        self.shm = shm
+        self.commodities = list(commodities)
+        self.n_candles = n_candles
+        self.owner = owner
+        self._row = {commodity: i for i, commodity in enumerate(self.commodities)}
+        self.generation = None  # Generation this handle was created / attached with
+
+        layout, _ = _layout(len(self.commodities), n_candles)
+        for name, dtype, shape, offset in layout:
+            setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset))
+
+    # ------------------------------------------------------------------
+    # Creation / attach
+    # ------------------------------------------------------------------
+    @classmethod
+    def create(cls, commodities: List[str], n_candles: int = 500, name: str = DEFAULT_NAME) -> "SharedMarketState":
+        """Create (or replace) the region - called by the ingestion process"""
+        commodities = sorted(commodities)
+        _, size = _layout(len(commodities), n_candles)
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            _retire(stale)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        # Unlinked by close() only while still current; the resource tracker would
+        # unlink by name at exit - possibly a successor's region after a restart
+        _untrack(shm)
+        state = cls(shm, commodities, n_candles, owner=True)
+        state.seq[:] = 0
+        state.snapshot[:] = np.nan
+        state.counts[:] = 0
+        state.names[:] = [commodity.encode() for commodity in commodities]
+        generation = int.from_bytes(os.urandom(7), "big") or 1
+        state.header[:] = (MAGIC, VERSION, len(commodities), n_candles, generation, _now_ms())
+        state.generation = generation
+        logger.info(f"Shared market state '{name}' angelegt: {len(commodities)} Commodities, {n_candles} Kerzen, {size / 1024:.0f} KB")
+        return state
+
+    @classmethod
+    def attach(cls, commodities: List[str], name: str = DEFAULT_NAME) -> Optional["SharedMarketState"]:
+        """Attach to the region of a running ingestion process (None if there is none)"""
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return None
+
+        # Readers must not unlink the segment when they exit
+        _untrack(shm)
+
+        header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)
+        magic, version, n_commodities, n_candles = (int(v) for v in header[:4])
+        commodities = sorted(commodities)
+        if magic != MAGIC or version != VERSION or n_commodities != len(commodities):
+            del header
+            logger.warning(f"Shared market state '{name}' has an incompatible layout - ignored")
+            shm.close()
+            return None
+        del header
+
+        state = cls(shm, commodities, n_candles, owner=False)
+        # Same size is not enough - every row must belong to the same commodity
+        names = [raw.decode() for raw in state.names]
+        if names != commodities:
+            logger.warning(f"Shared market state '{name}' holds other commodities ({names}) - ignored")
+            state.close()
+            return None
+        state.generation = int(state.header[_GENERATION])
+        return state
+
+    def close(self):
+        # A writer whose region was already replaced must not unlink the successor's region
+        replaced = self.header is None or int(self.header[_GENERATION]) != self.generation
+        if self.owner and not replaced:
+            self.header[_GENERATION] = 0  # Readers still attached detach right away
+        # Views must go before the buffer can be released
+        for name in ("header", "names", "seq", "snapshot", "counts", "candles"):
+            setattr(self, name, None)
+        try:
+            self.shm.close()
+        except BufferError:
+            logger.debug("Shared market state still referenced - unmapped on garbage collection")
+        if self.owner and not replaced:
+            _track(self.shm)  # unlink() unregisters again
+            self.shm.unlink()
+
+    # ------------------------------------------------------------------
+    # Liveness
+    # ------------------------------------------------------------------
+    def touch(self):
+        """Writer heartbeat - also when nothing was published (closed markets)"""
+        self.header[_HEARTBEAT] = _now_ms()
+
+    def heartbeat_age(self) -> float:
+        """Seconds since the writer's last heartbeat"""
+        return max(0.0, (_now_ms() - int(self.header[_HEARTBEAT])) / 1000)
+
+    def is_live(self, stale_seconds: float = 30.0) -> bool:
+        """False once the writer replaced this region or stopped heartbeating"""
+        if self.header is None:
+            return False
+        if int(self.header[_GENERATION]) != self.generation:
+            return False
+        return self.heartbeat_age() <= stale_seconds
+
+    # ------------------------------------------------------------------
+    # Writer
+    # ------------------------------------------------------------------
+    def publish(self, commodity: str, market_data: Dict, hist=None):
+        """Write the snapshot (and the most recent candles of `hist`) of one commodity"""
+        row = self._row.get(commodity)
+        if row is None:
+            return
+
+        values = np.full(len(SNAPSHOT_FIELDS), np.nan)
+        for name, i in _FIELD.items():
+            value = market_data.get(name)
+            if name == "timestamp":
+                value = value.timestamp() if isinstance(value, datetime) else value
+            elif name == "trend":
+                value = TREND_CODES.get(value)
+            elif name == "signal":
+                value = SIGNAL_CODES.get(value)
+            if value is not None:
+                values[i] = float(value)
+
+        candles = None
+        if hist is not None and len(hist):
+            recent = hist.iloc[-self.n_candles:]
+            candles = np.empty((len(recent), len(CANDLE_FIELDS)))
+            candles[:, 0] = [ts.timestamp() for ts in recent.index]
+            for i, column in enumerate(_HIST_COLUMNS, start=1):
+                candles[:, i] = recent[column].to_numpy(dtype=float) if column in recent.columns else np.nan
+
+        self.seq[row] += 1  # Odd: readers retry
+        try:
+            self.snapshot[row] = values
+            if candles is not None:
+                count = len(candles)
+                self.candles[row, self.n_candles - count:] = candles
+                self.counts[row] = count
+        finally:
+            self.seq[row] += 1
+        self.touch()
+
+    # ------------------------------------------------------------------
+    # Readers
+    # ------------------------------------------------------------------
+    def version(self, commodity: str) -> int:
+        """Sequence number of a commodity - changes with every publish"""
+        row = self._row.get(commodity)
+        return int(self.seq[row]) if row is not None else 0
+
+    def _read(self, row: int, read, retries: int = 1000):
+        for attempt in range(retries):
+            before = int(self.seq[row])
+            if before % 2 == 0:
+                result = read()
+                if int(self.seq[row]) == before:
+                    return result, before
+            if attempt > 10:
+                time.sleep(0)  # Let the writer finish
+        raise TimeoutError("shared market state is being rewritten continuously")
+
+    def read_snapshot(self, commodity: str) -> Optional[Dict]:
+        """Latest market data of a commodity as a market_data dict (None if nothing published)"""
+        row = self._row.get(commodity)
+        if row is None:
+            return None
+        values, _ = self._read(row, lambda: self.snapshot[row].copy())
+        if np.isnan(values[_FIELD["price"]]):
+            return None
+
+        market_data = {"commodity": commodity}
+        for name, i in _FIELD.items():
+            value = values[i]
+            if name == "timestamp":
+                market_data[name] = datetime.fromtimestamp(value, tz=timezone.utc)
+            elif name == "trend":
+                market_data[name] = _TRENDS.get(value, "NEUTRAL")
+            elif name == "signal":
+                market_data[name] = _SIGNALS.get(value, "HOLD")
+            else:
+                market_data[name] = None if np.isnan(value) else float(value)
+        return market_data
+
+    def read_candles(self, commodity: str) -> Optional[np.ndarray]:
+        """Recent candles (count x CANDLE_FIELDS), oldest first"""
+        row = self._row.get(commodity)
+        if row is None:
+            return None
+
+        def read():
+            count = int(self.counts[row])
+            return self.candles[row, self.n_candles - count:].copy()
+
+        candles, _ = self._read(row, read)
+        return candles
+
+    def status(self) -> Dict:
+        return {
+            "name": self.shm.name,
+            "generation": int(self.header[_GENERATION]),
+            "heartbeat_age_seconds": round(self.heartbeat_age(), 1),
+            "commodities": {
+                commodity: {"version": self.version(commodity), "candles": int(self.counts[row])}
+                for commodity, row in self._row.items()
+            },
+        }
+
+
+def _untrack(shm: shared_memory.SharedMemory):
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+
+def _track(shm: shared_memory.SharedMemory):
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.register(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+
+def _retire(shm: shared_memory.SharedMemory):
+    """Mark a region about to be replaced so that attached readers detach"""
+    if shm.size < HEADER_SIZE * 8:
+        return
+    header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)
+    if int(header[0]) == MAGIC and int(header[1]) == VERSION:
+        header[_GENERATION] = 0
+    del header
+
+
+def stale_seconds() -> float:
+    """Heartbeat age after which the ingestion process is considered dead"""
+    return float(os.environ.get('MARKET_SHM_STALE_SECONDS', 30))
+
+
+def attach_shared_market_state(commodities: List[str], quiet: bool = False) -> Optional[SharedMarketState]:
+    """Attach to a live ingestion process' region if MARKET_INGESTION=process (None otherwise)"""
+    if os.environ.get('MARKET_INGESTION', 'inline').lower() != 'process':
+        return None
+    state = SharedMarketState.attach(commodities, name=os.environ.get('MARKET_SHM_NAME', DEFAULT_NAME))
+    if state is not None and not state.is_live(stale_seconds()):
+        # Left behind by a crashed ingestion process
+        state.close()
+        state = None
+    if state is None and not quiet:
+        logger.warning("MARKET_INGESTION=process, but no ingestion process is running - fetching inline")
+    return state
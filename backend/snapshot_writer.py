@@ -0,0 +1,134 @@
+"""
+Snapshot Writer - Write-Behind Puffer für Marktdaten
+Die Marktdaten-Verarbeitung legt Snapshots nur noch in einen begrenzten
+Puffer. Ein Hintergrund-Task schreibt sie gesammelt: ein bulk_write für die
+market_data Upserts (pro Commodity zusammengefasst) und ein insert_many für
+die Snapshot-Historie. Beim Shutdown wird der Puffer geleert.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+
+from market_history import SNAPSHOT_COLLECTION, build_snapshot_doc
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotWriter:
+    """Bounded write-behind buffer for market_data upserts and history snapshots"""
+
+    def __init__(self, db, max_queue: int = 1000, flush_interval: float = 2.0):
+        """
+        Args:
+            db: Database connection
+            max_queue: Maximum buffered snapshots - the oldest are dropped when full
+            flush_interval: Seconds between background flushes (a cycle end flushes earlier)
+        """
+        self.db = db
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self._buffer = deque(maxlen=max_queue)
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.written = 0
+
+    def submit(self, market_data: Dict):
+        """Queue one snapshot (never blocks, never touches the database)"""
+        if len(self._buffer) == self.max_queue:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"Snapshot buffer full ({self.max_queue}) - dropping oldest ({self.dropped} dropped so far)")
+        self._buffer.append(dict(market_data))
+
+    def request_flush(self):
+        """Ask the background task to flush now (e.g. at the end of a processing cycle)"""
+        self._flush_requested.set()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    async def flush(self) -> int:
+        """Write everything buffered so far; returns the number of snapshots written"""
+        async with self._flush_lock:
+            if not self._buffer:
+                return 0
+
+            snapshots = []
+            while self._buffer:
+                snapshots.append(self._buffer.popleft())
+
+            # market_data holds only the latest document per commodity - coalesce
+            latest = {}
+            for snapshot in snapshots:
+                latest[snapshot['commodity']] = snapshot
+
+            try:
+                await self.db.market_data.bulk_write(
+                    [UpdateOne({"commodity": commodity}, {"$set": doc}, upsert=True) for commodity, doc in latest.items()],
+                    ordered=False
+                )
+            except Exception as e:
+                logger.error(f"Error writing market data batch ({len(latest)} commodities): {e}")
+
+            try:
+                await self.db[SNAPSHOT_COLLECTION].insert_many(
+                    [build_snapshot_doc(snapshot) for snapshot in snapshots],
+                    ordered=False
+                )
+            except Exception as e:
+                logger.error(f"Error writing snapshot history batch ({len(snapshots)} snapshots): {e}")
+
+            self.written += len(snapshots)
+            logger.debug(f"Flushed {len(snapshots)} snapshots ({len(latest)} market_data upserts)")
+            return len(snapshots)
+
+    async def run(self):
+        """Background task: flush on request or every flush_interval seconds"""
+        logger.info(f"Snapshot writer started (max {self.max_queue} buffered, flush every {self.flush_interval}s)")
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error flushing snapshots: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the background task and write what is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        written = await self.flush()
+        logger.info(f"Snapshot writer stopped ({written} snapshots flushed on shutdown)")
+
+
+# Global instance
+_snapshot_writer = None
+
+def get_snapshot_writer(db) -> SnapshotWriter:
+    """Get or create snapshot writer instance"""
+    global _snapshot_writer
+    if _snapshot_writer is None:
+        _snapshot_writer = SnapshotWriter(db)
+    return _snapshot_writer
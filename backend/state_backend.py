@@ -0,0 +1,185 @@
+"""
+State Backend - geteilter Zustand für mehrere uvicorn Worker
+Marktdaten-Cache, Trade-Zähler, Cooldowns der Engine und der OHLCV-Cache
+liegen sonst als Modul-Globals in jedem Prozess getrennt. Das Backend
+bietet zwei Primitive:
+- atomare Zähler (incr / counter / reset), optional mit Ablaufzeit
+- Last-Value Tabellen (put / get / table): pro Schlüssel zählt nur der
+  zuletzt geschriebene Wert, `changes(since=...)` liefert nur Änderungen
+
+Auswahl über die Umgebungsvariable STATE_BACKEND:
+- "memory" (Standard): In-Process, keine Roundtrips - ein Worker
+- "mongo": Collections `state_counters` / `state_values` - alle Worker
+  sehen denselben Zustand
+Mit ENGINE_SHARDING=1 handeln mehrere Worker; Trade-Limits und Cooldowns
+müssen dann geteilt sein, daher wird dort immer "mongo" verwendet.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+def hour_key(name: str, now: Optional[datetime] = None) -> str:
+    """Counter name of the current UTC hour (e.g. trades_per_hour:2025111014)"""
+    now = now or datetime.now(timezone.utc)
+    return f"{name}:{now:%Y%m%d%H}"
+
+
+async def take_slot(state, counter: str, limit: int, ttl_seconds: Optional[float] = None) -> bool:
+    """
+    Reserve one of `limit` slots of a counter (e.g. max_trades_per_hour)
+
+    Increments first and checks the returned value - a separate counter()
+    read before incr() lets concurrent workers all pass the check. On
+    overflow the increment is rolled back and False returned.
+    """
+    value = await state.incr(counter, ttl_seconds=ttl_seconds)
+    if value > limit:
+        await state.incr(counter, -1)
+        return False
+    return True
+
+
+class InMemoryStateBackend:
+    """Process-local state (default)"""
+
+    shared = False
+
+    def __init__(self):
+        self._counters: Dict[str, Tuple[int, Optional[datetime]]] = {}
+        self._tables: Dict[str, Dict[str, Tuple[Any, datetime]]] = {}
+
+    async def ensure(self):
+        pass
+
+    async def incr(self, counter: str, amount: int = 1, ttl_seconds: Optional[float] = None) -> int:
+        value, expires_at = self._counters.get(counter, (0, None))
+        now = datetime.now(timezone.utc)
+        if expires_at is not None and expires_at <= now:
+            value = 0
+        if ttl_seconds is not None:
+            expires_at = now + timedelta(seconds=ttl_seconds)
+        value += amount
+        self._counters[counter] = (value, expires_at)
+        return value
+
+    async def counter(self, counter: str) -> int:
+        value, expires_at = self._counters.get(counter, (0, None))
+        if expires_at is not None and expires_at <= datetime.now(timezone.utc):
+            return 0
+        return value
+
+    async def reset(self, counter: str):
+        self._counters.pop(counter, None)
+
+    async def put(self, table: str, key: str, value: Any):
+        self._tables.setdefault(table, {})[key] = (value, datetime.now(timezone.utc))
+
+    async def get(self, table: str, key: str, default: Any = None) -> Any:
+        entry = self._tables.get(table, {}).get(key)
+        return entry[0] if entry is not None else default
+
+    async def changes(self, table: str, since: Optional[datetime] = None) -> Tuple[Dict[str, Any], Optional[datetime]]:
+        """Values written after `since` and the cursor to pass next time"""
+        values, cursor = {}, since
+        for key, (value, updated_at) in self._tables.get(table, {}).items():
+            if since is None or updated_at > since:
+                values[key] = value
+                cursor = updated_at if cursor is None else max(cursor, updated_at)
+        return values, cursor
+
+    async def table(self, table: str) -> Dict[str, Any]:
+        return (await self.changes(table))[0]
+
+
+class MongoStateBackend:
+    """State shared by all workers through MongoDB (atomic $inc, upserted last values)"""
+
+    shared = True
+
+    def __init__(self, db):
+        self.db = db
+        self.counters = db.state_counters
+        self.values = db.state_values
+
+    async def ensure(self):
+        """Indexes: TTL for expiring counters, (table, updated_at) for change polling"""
+        try:
+            await self.counters.create_index("expires_at", expireAfterSeconds=0)
+            await self.values.create_index([("table", 1), ("updated_at", 1)])
+        except Exception as e:
+            logger.error(f"Error creating state backend indexes: {e}")
+
+    async def incr(self, counter: str, amount: int = 1, ttl_seconds: Optional[float] = None) -> int:
+        update = {"$inc": {"value": amount}}
+        if ttl_seconds is not None:
+            update["$set"] = {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)}
+        doc = await self.counters.find_one_and_update(
+            {"_id": counter}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return doc.get("value", 0)
+
+    async def counter(self, counter: str) -> int:
+        doc = await self.counters.find_one({"_id": counter})
+        if not doc:
+            return 0
+        expires_at = doc.get("expires_at")
+        if expires_at is not None and expires_at <= datetime.now(timezone.utc):
+            return 0  # The TTL monitor runs only once a minute
+        return doc.get("value", 0)
+
+    async def reset(self, counter: str):
+        await self.counters.delete_one({"_id": counter})
+
+    async def put(self, table: str, key: str, value: Any):
+        # Server time ($$NOW) so `since` works across hosts; $literal keeps "$" strings in the value verbatim
+        await self.values.update_one(
+            {"_id": f"{table}:{key}"},
+            [{"$set": {"table": table, "key": key, "value": {"$literal": value}, "updated_at": "$$NOW"}}],
+            upsert=True,
+        )
+
+    async def get(self, table: str, key: str, default: Any = None) -> Any:
+        doc = await self.values.find_one({"_id": f"{table}:{key}"}, {"value": 1})
+        return doc["value"] if doc else default
+
+    async def changes(self, table: str, since: Optional[datetime] = None) -> Tuple[Dict[str, Any], Optional[datetime]]:
+        """Values written after `since` and the cursor to pass next time"""
+        query = {"table": table}
+        if since is not None:
+            query["updated_at"] = {"$gt": since}
+        docs = await self.values.find(query, {"key": 1, "value": 1, "updated_at": 1}).to_list(None)
+        cursor = max((doc["updated_at"] for doc in docs), default=since)
+        return {doc["key"]: doc["value"] for doc in docs}, cursor
+
+    async def table(self, table: str) -> Dict[str, Any]:
+        return (await self.changes(table))[0]
+
+
+# Global instance
+_state_backend = None
+
+def get_state_backend(db=None):
+    """Get or create the state backend selected by STATE_BACKEND (memory / mongo)"""
+    global _state_backend
+    if _state_backend is None:
+        kind = os.environ.get('STATE_BACKEND', 'memory').lower()
+        from shard_coordinator import sharding_enabled
+        if sharding_enabled() and kind != 'mongo':
+            # Per-process counters would allow max_trades_per_hour once per shard
+            logger.warning(f"ENGINE_SHARDING=1 requires shared state - STATE_BACKEND={kind} ignored, using mongo")
+            kind = 'mongo'
+        if kind == 'mongo' and db is not None:
+            _state_backend = MongoStateBackend(db)
+        else:
+            if kind != 'memory':
+                logger.warning(f"STATE_BACKEND={kind} not available here, using in-process state")
+            _state_backend = InMemoryStateBackend()
+        logger.info(f"State backend: {type(_state_backend).__name__}")
+    return _state_backend
@@ -0,0 +1,126 @@
+"""
+Stop Index - sortierte Stop-Loss/Take-Profit Level pro Commodity
+Pro Commodity gibt es zwei sortierte Level-Listen:
+- upper: löst aus, wenn der Preis das Level erreicht oder übersteigt
+         (SELL Stop Loss, BUY Take Profit)
+- lower: löst aus, wenn der Preis das Level erreicht oder unterschreitet
+         (BUY Stop Loss, SELL Take Profit)
+Da ausgelöste Positionen geschlossen und entfernt werden, liegen alle noch
+vorhandenen upper-Level über und alle lower-Level unter dem letzten Preis.
+Ein neuer Preis findet die gekreuzten Level per bisect in O(log n + k).
+
+Wird vom PositionBook bei jedem Öffnen, Schließen und Ändern (inklusive
+Trailing-Stop-Updates) mitgeführt.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+class _Levels:
+    """Sorted (level, trade_id, reason) entries of one side of one commodity"""
+
+    __slots__ = ('levels', 'entries')
+
+    def __init__(self):
+        self.levels: List[float] = []  # Sorted, parallel to entries
+        self.entries: List[Tuple[float, str, str]] = []
+
+    def add(self, level: float, trade_id: str, reason: str):
+        entry = (level, trade_id, reason)
+        i = bisect_right(self.entries, entry)
+        self.entries.insert(i, entry)
+        self.levels.insert(i, level)
+
+    def remove(self, level: float, trade_id: str, reason: str):
+        i = bisect_left(self.entries, (level, trade_id, reason))
+        if i < len(self.entries) and self.entries[i] == (level, trade_id, reason):
+            del self.entries[i]
+            del self.levels[i]
+
+    def at_or_below(self, price: float):
+        return self.entries[:bisect_right(self.levels, price)]
+
+    def at_or_above(self, price: float):
+        return self.entries[bisect_left(self.levels, price):]
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class StopIndex:
+    """Per-commodity sorted stop levels for trigger detection without full scans"""
+
+    def __init__(self):
+        self._upper: Dict[str, _Levels] = defaultdict(_Levels)
+        self._lower: Dict[str, _Levels] = defaultdict(_Levels)
+        self._by_trade: Dict[str, List[Tuple[str, str, float, str]]] = {}  # trade_id -> [(commodity, side, level, reason)]
+
+    def add(self, trade: Dict):
+        """Index the SL/TP levels of an open trade (replaces previous levels)"""
+        trade_id = trade.get('id')
+        if not trade_id:
+            return
+        self.remove(trade_id)
+
+        commodity = trade.get('commodity', 'WTI_CRUDE')
+        trade_type = trade.get('type')
+        stop_loss = trade.get('stop_loss')
+        take_profit = trade.get('take_profit')
+
+        entries = []
+        if trade_type == 'BUY':
+            if stop_loss:
+                entries.append((commodity, 'lower', float(stop_loss), 'STOP_LOSS'))
+            if take_profit:
+                entries.append((commodity, 'upper', float(take_profit), 'TAKE_PROFIT'))
+        elif trade_type == 'SELL':
+            if stop_loss:
+                entries.append((commodity, 'upper', float(stop_loss), 'STOP_LOSS'))
+            if take_profit:
+                entries.append((commodity, 'lower', float(take_profit), 'TAKE_PROFIT'))
+
+        for commodity, side, level, reason in entries:
+            self._side(side)[commodity].add(level, trade_id, reason)
+        if entries:
+            self._by_trade[trade_id] = entries
+
+    def remove(self, trade_id: str):
+        for commodity, side, level, reason in self._by_trade.pop(trade_id, ()):
+            levels = self._side(side).get(commodity)
+            if levels is not None:
+                levels.remove(level, trade_id, reason)
+                if not levels:
+                    del self._side(side)[commodity]
+
+    def clear(self):
+        self._upper.clear()
+        self._lower.clear()
+        self._by_trade.clear()
+
+    def triggered(self, commodity: str, price: float) -> List[Tuple[str, str]]:
+        """
+        (trade_id, reason) of all levels crossed at `price`
+
+        A trade whose stop loss and take profit are both crossed is reported
+        once, as STOP_LOSS. Does not modify the index - entries disappear when
+        the trade is closed.
+        """
+        hits = {}
+        upper = self._upper.get(commodity)
+        if upper:
+            for _, trade_id, reason in upper.at_or_below(price):
+                hits[trade_id] = reason
+        lower = self._lower.get(commodity)
+        if lower:
+            for _, trade_id, reason in lower.at_or_above(price):
+                if hits.get(trade_id) != 'STOP_LOSS':
+                    hits[trade_id] = reason
+        return list(hits.items())
+
+    def __len__(self):
+        return len(self._by_trade)
+
+    def _side(self, side: str) -> Dict[str, _Levels]:
+        return self._upper if side == 'upper' else self._lower
@@ -0,0 +1,351 @@
+"""
+Strategy Optimizer - Parameter-Suche für die Strategie-Schwellenwerte
+Testet Kombinationen von RSI-Schwellen, Stop Loss, Take Profit und Trailing
+Stop Abstand mit dem Backtester und sortiert sie nach wählbaren Kennzahlen.
+
+- Grid Search (alle Kombinationen) oder Random Search (N Stichproben aus den
+  Wertebereichen)
+- Die Kombinationen werden in Blöcken auf einen ProcessPoolExecutor verteilt
+  (standardmäßig ein Prozess pro CPU-Kern)
+- Kerzen und die parameterunabhängigen Indikatoren werden einmal berechnet und
+  als .npy-Dateien abgelegt; die Worker öffnen sie read-only per np.memmap.
+  Die Kursdaten liegen so nur einmal im Page Cache, statt in jeden Prozess
+  kopiert (oder pro Aufgabe gepickelt) zu werden.
+
+CLI:
+    python strategy_optimizer.py --commodities GOLD SILVER --method random --samples 500 \
+        --metrics sharpe total_return_pct --min-trades 20
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from backtester import (
+    STRATEGY_PARAMS, METRICS, SIGNAL_RULES,
+    strategy_params, compute_indicators, backtest_candles, aggregate_results, load_candles,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rows of the per-commodity price array: candles, then the precomputed indicators
+ARRAY_FIELDS = ("time", "open", "high", "low", "close", "rsi", "ema_20", "macd", "macd_signal")
+_CANDLE_FIELDS = ARRAY_FIELDS[:5]
+_INDICATOR_FIELDS = ARRAY_FIELDS[5:]
+MANIFEST = "manifest.json"
+
+DEFAULT_SPACE = {
+    "rsi_oversold_threshold": [20, 25, 30, 35],
+    "rsi_overbought_threshold": [65, 70, 75, 80],
+    "stop_loss_percent": [1.0, 1.5, 2.0, 3.0],
+    "take_profit_percent": [2.0, 3.0, 4.0, 6.0],
+    "trailing_stop_distance": [1.0, 1.5, 2.0],
+}
+
+# Metrics where smaller is better; all others are maximized
+LOWER_IS_BETTER = {"max_drawdown_pct"}
+
+
+# ----------------------------------------------------------------------
+# Shared price arrays
+# ----------------------------------------------------------------------
+class SharedPriceArrays:
+    """Candles + indicators per commodity as .npy files that worker processes memory-map read-only"""
+
+    def __init__(self, candles: Dict[str, Dict[str, np.ndarray]], directory: Optional[str] = None):
+        """
+        Args:
+            candles: backtester candles (open/high/low/close/time arrays) per commodity
+            directory: Where to put the files (default: a temporary directory removed on close)
+        """
+        self.owns_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix="strategy_optimizer_")
+        os.makedirs(self.directory, exist_ok=True)
+        self.commodities = sorted(candles)
+
+        for commodity_id in self.commodities:
+            data = candles[commodity_id]
+            indicators = compute_indicators(data["close"])
+            array = np.lib.format.open_memmap(
+                self._path(self.directory, commodity_id), mode="w+", dtype=np.float64,
+                shape=(len(ARRAY_FIELDS), len(data["close"]))
+            )
+            for i, field in enumerate(_CANDLE_FIELDS):
+                array[i] = data[field]
+            for i, field in enumerate(_INDICATOR_FIELDS, start=len(_CANDLE_FIELDS)):
+                array[i] = indicators[field]
+            array.flush()
+            del array
+
+        with open(os.path.join(self.directory, MANIFEST), "w") as f:
+            json.dump({"commodities": self.commodities, "fields": list(ARRAY_FIELDS)}, f)
+
+    @staticmethod
+    def _path(directory: str, commodity_id: str) -> str:
+        return os.path.join(directory, f"{commodity_id}.npy")
+
+    @classmethod
+    def load(cls, directory: str) -> Dict[str, Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]]:
+        """(candles, indicators) per commodity as read-only views on the memory-mapped files"""
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        arrays = {}
+        for commodity_id in manifest["commodities"]:
+            array = np.load(cls._path(directory, commodity_id), mmap_mode="r")
+            rows = dict(zip(ARRAY_FIELDS, array))
+            arrays[commodity_id] = (
+                {field: rows[field] for field in _CANDLE_FIELDS},
+                {field: rows[field] for field in _INDICATOR_FIELDS},
+            )
+        return arrays
+
+    def time_range(self) -> Tuple[float, float]:
+        """First and last candle time over all commodities"""
+        arrays = self.load(self.directory)
+        starts = [candles["time"][0] for candles, _ in arrays.values() if len(candles["time"])]
+        ends = [candles["time"][-1] for candles, _ in arrays.values() if len(candles["time"])]
+        return (float(min(starts)), float(max(ends))) if starts else (0.0, 0.0)
+
+    def close(self):
+        if self.owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ----------------------------------------------------------------------
+# Worker side
+# ----------------------------------------------------------------------
+_worker_arrays = None
+
+
+def _init_worker(directory: str):
+    global _worker_arrays
+    _worker_arrays = SharedPriceArrays.load(directory)
+
+
+def _evaluate_chunk(combinations: List[Dict[str, float]], rule: str, use_trailing: bool,
+                    window: Optional[Tuple[float, float]] = None) -> List[Dict]:
+    """Backtest each combination on all commodities, optionally only on candles with time in [start, end)"""
+    results = []
+    for params in combinations:
+        per_commodity = {}
+        for commodity_id, (candles, indicators) in _worker_arrays.items():
+            start, end = 0, len(candles["close"])
+            if window is not None:
+                start, end = np.searchsorted(candles["time"], window, side="left")
+            if end - start < 2:
+                continue
+            per_commodity[commodity_id] = backtest_candles(
+                candles, params, rule, use_trailing, indicators=indicators, start=int(start), end=int(end)
+            )
+        results.append({
+            "params": params,
+            "portfolio": aggregate_results(per_commodity),
+            "commodities": {
+                commodity_id: {"trades": r["trades"], "total_return_pct": r["total_return_pct"]}
+                for commodity_id, r in per_commodity.items()
+            },
+        })
+    return results
+
+
+# ----------------------------------------------------------------------
+# Search space and ranking
+# ----------------------------------------------------------------------
+def _valid(params: Dict[str, float]) -> bool:
+    return params["rsi_oversold_threshold"] < params["rsi_overbought_threshold"]
+
+
+def grid_combinations(space: Dict[str, List[float]], base: Dict[str, float]) -> List[Dict[str, float]]:
+    """Every combination of the listed values; parameters not in `space` keep their base value"""
+    keys = list(space)
+    combinations = []
+    for values in itertools.product(*(space[key] for key in keys)):
+        params = {**base, **{key: float(value) for key, value in zip(keys, values)}}
+        if _valid(params):
+            combinations.append(params)
+    return combinations
+
+
+def random_combinations(space: Dict[str, List[float]], base: Dict[str, float], samples: int,
+                        seed: Optional[int] = None) -> List[Dict[str, float]]:
+    """`samples` combinations drawn uniformly from [min, max] of each parameter's values"""
+    rng = random.Random(seed)
+    combinations = []
+    attempts = 0
+    while len(combinations) < samples and attempts < samples * 20:
+        attempts += 1
+        params = dict(base)
+        for key, values in space.items():
+            params[key] = round(rng.uniform(min(values), max(values)), 2)
+        if _valid(params):
+            combinations.append(params)
+    return combinations
+
+
+def build_combinations(space: Dict[str, List[float]], base: Dict[str, float], method: str = "grid",
+                       samples: int = 200, use_trailing: bool = False, seed: Optional[int] = None) -> List[Dict[str, float]]:
+    unknown = set(space) - set(STRATEGY_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    if not use_trailing:
+        # Without trailing stop the distance has no effect - don't test it
+        space = {key: values for key, values in space.items() if key != "trailing_stop_distance"}
+    if method == "grid":
+        return grid_combinations(space, base)
+    if method == "random":
+        return random_combinations(space, base, samples, seed)
+    raise ValueError(f"Unknown search method: {method}")
+
+
+def rank_results(results: List[Dict], metrics: Iterable[str] = ("sharpe", "total_return_pct"),
+                 min_trades: int = 0) -> List[Dict]:
+    """Sort by the metrics in order (ties broken by the next one); missing values rank last"""
+    metrics = list(metrics)
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+
+    def key(result):
+        values = []
+        for metric in metrics:
+            value = result["portfolio"].get(metric)
+            if value is None:
+                values.append((1, 0.0))
+            else:
+                values.append((0, value if metric in LOWER_IS_BETTER else -value))
+        return values
+
+    eligible = [r for r in results if r["portfolio"]["trades"] >= min_trades]
+    return sorted(eligible, key=key)
+
+
+# ----------------------------------------------------------------------
+# Driver
+# ----------------------------------------------------------------------
+def open_pool(arrays: SharedPriceArrays, workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Worker pool with the price arrays memory-mapped in every process"""
+    # spawn: no forked copy of the parent (event loop, connections) in the workers
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(arrays.directory,),
+    )
+
+
+def evaluate_combinations(executor: ProcessPoolExecutor, combinations: List[Dict[str, float]], rule: str = "rsi",
+                          use_trailing: bool = False, window: Optional[Tuple[float, float]] = None,
+                          workers: Optional[int] = None, chunk_size: Optional[int] = None):
+    """Submit the combinations in chunks; returns the futures (each resolves to a list of results)"""
+    if chunk_size is None:
+        # A few chunks per worker: balances the load without paying IPC per combination
+        chunk_size = max(1, len(combinations) // ((workers or os.cpu_count() or 1) * 4))
+    return [
+        executor.submit(_evaluate_chunk, combinations[i:i + chunk_size], rule, use_trailing, window)
+        for i in range(0, len(combinations), chunk_size)
+    ]
+
+
+def optimize(candles: Dict[str, Dict[str, np.ndarray]], space: Optional[Dict[str, List[float]]] = None,
+             base: Optional[Dict[str, float]] = None, method: str = "grid", samples: int = 200,
+             metrics: Iterable[str] = ("sharpe", "total_return_pct"), min_trades: int = 0,
+             rule: str = "rsi", use_trailing: bool = False, workers: Optional[int] = None,
+             seed: Optional[int] = None, top: Optional[int] = 20) -> Dict:
+    """Run a parameter sweep over the candles and return the ranked combinations"""
+    combinations = build_combinations(space or DEFAULT_SPACE, base or strategy_params(), method, samples, use_trailing, seed)
+    if not combinations:
+        raise ValueError("No valid parameter combinations")
+
+    started = time.monotonic()
+    with SharedPriceArrays(candles) as arrays, open_pool(arrays, workers) as executor:
+        futures = evaluate_combinations(executor, combinations, rule, use_trailing, workers=workers)
+        results = [result for future in futures for result in future.result()]
+    duration = round(time.monotonic() - started, 2)
+
+    ranked = rank_results(results, metrics, min_trades)
+    logger.info(f"🔧 Optimizer: {len(combinations)} Kombinationen × {len(candles)} Commodities in {duration}s")
+    return {
+        "method": method,
+        "rule": rule,
+        "use_trailing_stop": use_trailing,
+        "metrics": list(metrics),
+        "combinations": len(combinations),
+        "eligible": len(ranked),
+        "duration_seconds": duration,
+        "results": ranked[:top] if top else ranked,
+    }
+
+
+async def run_optimization(commodity_ids: List[str], timeframe: str = "1h", period: str = "2y", **kwargs) -> Dict:
+    """Load candles, then run the sweep off the event loop"""
+    candles = await load_candles(commodity_ids, timeframe, period)
+    if not candles:
+        raise ValueError("No candles for the requested commodities")
+    result = await asyncio.to_thread(optimize, candles, **kwargs)
+    result.update({"timeframe": timeframe, "period": period, "commodities": sorted(candles)})
+    return result
+
+
+def format_params(params: Dict[str, float]) -> str:
+    return " ".join(f"{key.replace('_percent', '%').replace('_threshold', '')}={value:g}" for key, value in params.items())
+
+
+async def _main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Strategie-Parameter per Grid/Random Search optimieren")
+    parser.add_argument("--commodities", nargs="+", default=["WTI_CRUDE"])
+    parser.add_argument("--timeframe", default="1h")
+    parser.add_argument("--period", default="2y")
+    parser.add_argument("--rule", choices=SIGNAL_RULES, default="rsi")
+    parser.add_argument("--trailing", action="store_true", help="Trailing Stop verwenden (und dessen Abstand optimieren)")
+    parser.add_argument("--method", choices=("grid", "random"), default="grid")
+    parser.add_argument("--samples", type=int, default=200, help="Stichproben bei --method random")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--space", type=json.loads, default=None,
+                        help='Suchraum als JSON, z.B. \'{"stop_loss_percent": [1, 2, 3]}\'')
+    parser.add_argument("--metrics", nargs="+", choices=METRICS, default=["sharpe", "total_return_pct"],
+                        help="Sortierung (weitere Kennzahlen entscheiden bei Gleichstand)")
+    parser.add_argument("--min-trades", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None, help="Prozesse (Standard: alle Kerne)")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    result = await run_optimization(
+        args.commodities, args.timeframe, args.period, space=args.space, method=args.method,
+        samples=args.samples, metrics=args.metrics, min_trades=args.min_trades, rule=args.rule,
+        use_trailing=args.trailing, workers=args.workers, seed=args.seed, top=args.top,
+    )
+
+    print("=" * 80)
+    print(f"OPTIMIZER: {result['combinations']} Kombinationen ({args.method}), "
+          f"{', '.join(result['commodities'])}, {result['duration_seconds']}s")
+    print(f"Sortiert nach: {', '.join(args.metrics)} (min. {args.min_trades} Trades, {result['eligible']} qualifiziert)")
+    print("=" * 80)
+    for rank, entry in enumerate(result["results"], start=1):
+        portfolio = entry["portfolio"]
+        print(f"{rank:3}. {format_params(entry['params'])}")
+        print(f"     Sharpe {portfolio['sharpe']}  Return {portfolio['total_return_pct']}%  "
+              f"MaxDD {portfolio['max_drawdown_pct']}%  Win {portfolio['win_rate']}%  Trades {portfolio['trades']}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
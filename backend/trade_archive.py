@@ -0,0 +1,278 @@
+"""
+Trade Archive - Cold Storage für geschlossene Trades
+Geschlossene Trades, die älter als `archive_closed_trades_after_days` sind,
+werden aus der heißen `trades` Collection in eine zstd-komprimierte
+Archiv-Collection verschoben. Pro Tag/Commodity/Plattform bleibt eine
+kompakte Zusammenfassung in `trade_summaries` stehen, aus der die
+Statistiken berechnet werden. Listen-Abfragen vereinen beide Collections.
+
+Verwendung als Skript:
+    python trade_archive.py [--days 30] [--batch-size 500] [--dry-run]
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List
+
+from pymongo import ReplaceOne
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLLECTION = "trades_archive"
+SUMMARY_COLLECTION = "trade_summaries"
+DEFAULT_ARCHIVE_AFTER_DAYS = 30
+
+
+async def ensure_archive_collections(db):
+    """Create the compressed archive collection and the summary indexes (idempotent)"""
+    try:
+        existing = await db.list_collection_names()
+        if ARCHIVE_COLLECTION not in existing:
+            try:
+                # Cold data: trade CPU for disk with zstd block compression
+                await db.create_collection(
+                    ARCHIVE_COLLECTION,
+                    storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}}
+                )
+                logger.info(f"Created archive collection {ARCHIVE_COLLECTION} (zstd)")
+            except CollectionInvalid:
+                pass  # Created concurrently by another worker
+
+        archive = db[ARCHIVE_COLLECTION]
+        # Same sort keys as the hot collection so the union can page by (timestamp, id)
+        await archive.create_index([("timestamp", -1), ("id", -1)])
+        await archive.create_index([("commodity", 1), ("timestamp", -1), ("id", -1)])
+        await archive.create_index([("mode", 1), ("timestamp", -1), ("id", -1)])
+        await archive.create_index("id", unique=True)
+        await archive.create_index("closed_at")
+
+        await db[SUMMARY_COLLECTION].create_index([("day", 1), ("commodity", 1), ("platform", 1)], unique=True)
+        logger.info("Trade archive collections ready")
+    except Exception as e:
+        logger.error(f"Error creating trade archive collections: {e}")
+
+
+def _summary_pipeline(start: datetime, end: datetime) -> List[Dict]:
+    """Aggregation that (re)computes the summaries of all archived days in [start, end)"""
+    has_pl = {"$ne": [{"$ifNull": ["$profit_loss", None]}, None]}
+    return [
+        {"$match": {"closed_at": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateTrunc": {"date": "$closed_at", "unit": "day"}},
+                "commodity": {"$ifNull": ["$commodity", "WTI_CRUDE"]},
+                "platform": "$mode",
+            },
+            "closed": {"$sum": 1},
+            "with_profit_loss": {"$sum": {"$cond": [has_pl, 1, 0]}},
+            "winning": {"$sum": {"$cond": [{"$and": [has_pl, {"$gt": ["$profit_loss", 0]}]}, 1, 0]}},
+            "losing": {"$sum": {"$cond": [{"$and": [has_pl, {"$lte": ["$profit_loss", 0]}]}, 1, 0]}},
+            "profit_loss": {"$sum": {"$ifNull": ["$profit_loss", 0]}},
+            "quantity": {"$sum": {"$ifNull": ["$quantity", 0]}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "day": "$_id.day",
+            "commodity": "$_id.commodity",
+            "platform": "$_id.platform",
+            "closed": 1, "with_profit_loss": 1, "winning": 1, "losing": 1, "profit_loss": 1, "quantity": 1,
+        }},
+        {"$merge": {
+            "into": SUMMARY_COLLECTION,
+            "on": ["day", "commodity", "platform"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }},
+    ]
+
+
+async def refresh_summaries(db, days: List[datetime]):
+    """Recompute the summaries of the given days from the archive (idempotent)"""
+    if not days:
+        return
+    start = min(days).replace(hour=0, minute=0, second=0, microsecond=0)
+    end = max(days).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    # Days that lost their last trade (e.g. deleted) would otherwise keep a stale summary
+    await db[SUMMARY_COLLECTION].delete_many({"day": {"$gte": start, "$lt": end}})
+    await db[ARCHIVE_COLLECTION].aggregate(_summary_pipeline(start, end)).to_list(None)
+
+
+async def archive_closed_trades(db, older_than_days: int = DEFAULT_ARCHIVE_AFTER_DAYS,
+                                batch_size: int = 500, dry_run: bool = False) -> Dict:
+    """
+    Move CLOSED trades whose closed_at is older than `older_than_days` into the archive
+
+    Each batch is copied first (upsert by id) and only then deleted from the hot
+    collection, so an interrupted run loses nothing and can simply be repeated.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    query = {"status": "CLOSED", "closed_at": {"$lt": cutoff}}
+    stats = {"cutoff": cutoff.isoformat(), "archived": 0, "dry_run": dry_run}
+
+    if dry_run:
+        stats["archived"] = await db.trades.count_documents(query)
+        return stats
+
+    days = []
+    while True:
+        batch = await db.trades.find(query, {"_id": 0}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        archived_at = datetime.now(timezone.utc)
+        for trade in batch:
+            trade["archived_at"] = archived_at
+
+        await db[ARCHIVE_COLLECTION].bulk_write(
+            [ReplaceOne({"id": trade["id"]}, trade, upsert=True) for trade in batch],
+            ordered=False
+        )
+        result = await db.trades.delete_many({"id": {"$in": [trade["id"] for trade in batch]}, "status": "CLOSED"})
+
+        stats["archived"] += result.deleted_count
+        days.extend(trade["closed_at"] for trade in batch)
+
+        # Yield between batches - the API keeps serving
+        await asyncio.sleep(0)
+
+    await refresh_summaries(db, days)
+
+    if stats["archived"]:
+        logger.info(f"📦 {stats['archived']} closed trades archived (closed before {cutoff.date()})")
+    return stats
+
+
+async def run_archive_loop(db, interval_seconds: int = 3600):
+    """Background task: archive old closed trades using the age from the trading settings"""
+    from settings_service import get_settings_service
+
+    logger.info(f"Trade archive job started (every {interval_seconds}s)")
+    while True:
+        try:
+            settings = await get_settings_service(db).get()
+            days = (settings or {}).get('archive_closed_trades_after_days', DEFAULT_ARCHIVE_AFTER_DAYS)
+            if days and days > 0:
+                await archive_closed_trades(db, older_than_days=days)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error archiving closed trades: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+async def find_trades(db, query: Dict, projection: Dict, sort: List, limit: int) -> List[Dict]:
+    """
+    Query hot and archived trades as one sorted result
+
+    OPEN trades are never archived, so such queries stay on the hot collection.
+    Otherwise both sides are sorted and limited on their own indexes before
+    the union, so at most 2 * limit documents are merged.
+    """
+    if query.get("status") == "OPEN":
+        return await db.trades.find(query, projection).sort(sort).limit(limit).to_list(limit)
+
+    sort_stage = {"$sort": dict(sort)}
+    pipeline = [
+        {"$match": query},
+        sort_stage,
+        {"$limit": limit},
+        {"$unionWith": {
+            "coll": ARCHIVE_COLLECTION,
+            "pipeline": [{"$match": query}, sort_stage, {"$limit": limit}]
+        }},
+        sort_stage,
+        {"$limit": limit},
+        {"$project": projection},
+    ]
+    return await db.trades.aggregate(pipeline).to_list(limit)
+
+
+async def get_archived_totals(db) -> Dict:
+    """Totals over all archived trades, read from the compact summaries"""
+    result = await db[SUMMARY_COLLECTION].aggregate([
+        {"$group": {
+            "_id": None,
+            "closed": {"$sum": "$closed"},
+            "with_profit_loss": {"$sum": "$with_profit_loss"},
+            "winning": {"$sum": "$winning"},
+            "losing": {"$sum": "$losing"},
+            "profit_loss": {"$sum": "$profit_loss"},
+        }}
+    ]).to_list(1)
+
+    totals = {"closed": 0, "with_profit_loss": 0, "winning": 0, "losing": 0, "profit_loss": 0.0}
+    if result:
+        totals.update({k: v for k, v in result[0].items() if k != "_id"})
+    return totals
+
+
+async def get_hot_totals(db) -> Dict:
+    """Counts and P&L of the hot trades collection in one $group (no documents loaded)"""
+    is_closed = {"$eq": ["$status", "CLOSED"]}
+    has_pl = {"$and": [is_closed, {"$ne": [{"$ifNull": ["$profit_loss", None]}, None]}]}
+    result = await db.trades.aggregate([
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "open": {"$sum": {"$cond": [{"$eq": ["$status", "OPEN"]}, 1, 0]}},
+            "closed": {"$sum": {"$cond": [is_closed, 1, 0]}},
+            "with_profit_loss": {"$sum": {"$cond": [has_pl, 1, 0]}},
+            "winning": {"$sum": {"$cond": [{"$and": [has_pl, {"$gt": ["$profit_loss", 0]}]}, 1, 0]}},
+            "losing": {"$sum": {"$cond": [{"$and": [has_pl, {"$lte": ["$profit_loss", 0]}]}, 1, 0]}},
+            "profit_loss": {"$sum": {"$cond": [has_pl, "$profit_loss", 0]}},
+        }}
+    ]).to_list(1)
+
+    totals = {"total": 0, "open": 0, "closed": 0, "with_profit_loss": 0, "winning": 0, "losing": 0, "profit_loss": 0.0}
+    if result:
+        totals.update({k: v for k, v in result[0].items() if k != "_id"})
+    return totals
+
+
+async def delete_archived_trade(db, trade_id: str) -> bool:
+    """Delete a trade from the archive and fix the summary of its day"""
+    trade = await db[ARCHIVE_COLLECTION].find_one_and_delete({"id": trade_id})
+    if trade is None:
+        return False
+    if trade.get("closed_at"):
+        await refresh_summaries(db, [trade["closed_at"]])
+    return True
+
+
+async def _main():
+    import argparse
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Geschlossene Trades ins Archiv verschieben")
+    parser.add_argument("--days", type=int, default=DEFAULT_ARCHIVE_AFTER_DAYS, help="Trades älter als N Tage archivieren")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Nur zählen, nichts verschieben")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    print("=" * 80)
+    print(f"TRADE-ARCHIV: geschlossene Trades älter als {args.days} Tage")
+    print("=" * 80)
+
+    await ensure_archive_collections(db)
+    stats = await archive_closed_trades(db, older_than_days=args.days, batch_size=args.batch_size, dry_run=args.dry_run)
+
+    if args.dry_run:
+        print(f"  {stats['archived']} Trades würden archiviert (Stichtag {stats['cutoff']})")
+    else:
+        print(f"  ✅ {stats['archived']} Trades archiviert (Stichtag {stats['cutoff']})")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
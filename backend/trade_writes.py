@@ -0,0 +1,166 @@
+"""
+Write path for the trades collection
+Alle Trade-Schreibzugriffe laufen hierüber: Zeitstempel werden als native
+BSON Dates gespeichert, das Position Book wird mitgeführt und Änderungen
+eines Zyklus werden mit einem einzigen bulk_write geschrieben.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from date_normalization import DATE_FIELDS, normalize_dates, to_utc_datetime
+from position_book import get_position_book
+
+logger = logging.getLogger(__name__)
+
+TRADE_DATE_FIELDS = DATE_FIELDS["trades"]
+
+
+async def insert_trade(db, doc: Dict) -> Dict:
+    """Insert a new trade (native dates) and register it in the position book"""
+    normalize_dates(doc, TRADE_DATE_FIELDS)
+    await db.trades.insert_one(doc)
+    (await get_position_book(db)).add(doc)
+    return doc
+
+
+async def update_trade(db, trade_id: str, fields: Dict, only_open: bool = False):
+    """`$set` fields of one trade (native dates) and apply the change to the position book"""
+    normalize_dates(fields, TRADE_DATE_FIELDS)
+    query = {"id": trade_id}
+    if only_open:
+        query["status"] = "OPEN"
+    result = await db.trades.update_one(query, {"$set": fields})
+    (await get_position_book(db)).apply(trade_id, fields)
+    return result
+
+
+def _stored_equal(stored, value) -> bool:
+    if isinstance(value, datetime):
+        stored = to_utc_datetime(stored)
+        # BSON dates keep milliseconds only
+        return stored is not None and abs(stored - to_utc_datetime(value)) < timedelta(milliseconds=1)
+    return stored == value
+
+
+async def _unmatched_updates(db, updates: List[Tuple[str, Dict]], indices: List[int], only_open: bool) -> Set[int]:
+    """
+    Indices of the operations that matched no document
+
+    bulk_write only reports the total matched_count. A document whose stored
+    values differ from what an operation set was not written by it (e.g. the
+    trade was closed by another writer before an only_open update).
+    """
+    ids = list({updates[index][0] for index in indices})
+    docs = {doc['id']: doc async for doc in db.trades.find({"id": {"$in": ids}}, {"_id": 0})}
+
+    unmatched = set()
+    for index in indices:
+        trade_id, fields = updates[index]
+        expected = dict(fields)
+        if only_open and 'status' not in expected:
+            expected['status'] = "OPEN"
+        doc = docs.get(trade_id)
+        if doc is None or not all(_stored_equal(doc.get(key), value) for key, value in expected.items()):
+            unmatched.add(index)
+    return unmatched
+
+
+async def bulk_update_trades(db, updates: List[Tuple[str, Dict]], only_open: bool = False) -> Dict:
+    """
+    Apply many `$set` updates to trades in one unordered bulk_write
+
+    Args:
+        db: Database connection
+        updates: List of (trade_id, fields_to_set)
+        only_open: Only touch trades that are still OPEN (prevents double closes)
+
+    Returns:
+        Dict with matched/modified counts and one result entry per operation
+        ("ok" is False for failed operations and for those that matched no trade)
+    """
+    if not updates:
+        return {"matched": 0, "modified": 0, "failed": 0, "results": []}
+
+    operations = []
+    for trade_id, fields in updates:
+        normalize_dates(fields, TRADE_DATE_FIELDS)
+        query = {"id": trade_id}
+        if only_open:
+            query["status"] = "OPEN"
+        operations.append(UpdateOne(query, {"$set": fields}))
+
+    errors = {}
+    try:
+        result = await db.trades.bulk_write(operations, ordered=False)
+        matched = result.matched_count
+        modified = result.modified_count
+    except BulkWriteError as e:
+        # Unordered: all other operations were still applied
+        details = e.details or {}
+        matched = details.get('nMatched', 0)
+        modified = details.get('nModified', 0)
+        for error in details.get('writeErrors', []):
+            errors[error.get('index')] = error.get('errmsg', 'unknown error')
+
+    applied = [index for index in range(len(updates)) if index not in errors]
+    unmatched = set()
+    if matched < len(applied):
+        try:
+            unmatched = await _unmatched_updates(db, updates, applied, only_open)
+        except Exception as e:
+            # Unknown which ones matched - report none as done rather than all
+            logger.error(f"Error checking unmatched bulk updates: {e}")
+            unmatched = set(applied)
+
+    # Keep the in-memory position book in sync with the applied changes
+    book = await get_position_book(db)
+
+    results = []
+    for index, (trade_id, fields) in enumerate(updates):
+        error = errors.get(index)
+        if error is None and index in unmatched:
+            error = "no matching trade" + (" (not open anymore)" if only_open else "")
+            logger.warning(f"Bulk update matched no trade {trade_id}")
+        elif error:
+            logger.error(f"Bulk update failed for trade {trade_id}: {error}")
+        else:
+            book.apply(trade_id, fields)
+        results.append({"id": trade_id, "ok": error is None, "error": error})
+
+    failed = len(results) - sum(1 for op_result in results if op_result['ok'])
+    logger.info(f"Bulk update: {len(updates)} operations, {matched} matched, {modified} modified, {failed} failed")
+
+    return {"matched": matched, "modified": modified, "failed": failed, "results": results}
+
+
+async def close_triggered_trades(db, trades_to_close: List[Dict]) -> Dict:
+    """
+    Close all positions whose stop loss / take profit was triggered in one bulk_write
+
+    Args:
+        db: Database connection
+        trades_to_close: List of {'id', 'reason', 'exit_price'}
+    """
+    closed_at = datetime.now(timezone.utc)
+    updates = [
+        (trade_info['id'], {
+            "status": "CLOSED",
+            "exit_price": trade_info['exit_price'],
+            "closed_at": closed_at,
+            "strategy_signal": trade_info['reason']
+        })
+        for trade_info in trades_to_close
+    ]
+
+    result = await bulk_update_trades(db, updates, only_open=True)
+
+    for trade_info, op_result in zip(trades_to_close, result['results']):
+        if op_result['ok']:
+            logger.info(f"Position auto-closed: {trade_info['reason']}")
+
+    return result
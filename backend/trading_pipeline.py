@@ -0,0 +1,347 @@
+"""
+Trading Pipeline - Event-getriebene Tick → Indikator → Signal → Risiko → Order Kette
+Ersetzt die 10-Sekunden-Schleife der Auto-Trading Engine. Jede Stufe ist ein
+eigener asyncio Task, verbunden über begrenzte Queues: ist eine Stufe
+langsam, blockiert `put` die vorherige Stufe (Backpressure) statt Events
+unbegrenzt aufzustauen.
+
+Ticks kommen aus zwei Quellen:
+- process_commodity_market_data (nach jeder Marktdaten-Aktualisierung,
+  inklusive Historie zum Seeden des RSI)
+- dem Market Scheduler (MetaAPI Live-Preise, adaptive Intervalle pro Commodity)
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import numpy as np
+
+from settings_service import get_settings_service
+from position_book import get_position_book
+from trade_writes import close_triggered_trades
+from market_hours import is_market_open
+from state_backend import get_state_backend, hour_key, take_slot
+from shard_coordinator import owned_commodities
+
+logger = logging.getLogger(__name__)
+
+RSI_PERIOD = 14
+SIGNAL_COOLDOWN_SECONDS = 60  # Max. ein Order-Versuch pro Commodity und Minute
+PUBLISH_INTERVAL_SECONDS = 2.0  # Tick-Marktdaten an andere Worker, gebündelt statt pro Tick
+
+
+class IncrementalRSI:
+    """
+    RSI of the current (forming) bar, updated per tick in O(1)
+
+    Uses the same smoothing as ta.momentum.RSIIndicator (ewm, alpha=1/period,
+    adjust=False). Seeded from the closed bars of the history, a tick is then
+    evaluated as the provisional close of the current bar - identical to
+    replacing the last close of the history and recomputing the indicator.
+    """
+
+    def __init__(self, period: int = RSI_PERIOD):
+        self.period = period
+        self.alpha = 1.0 / period
+        self.prev_close = None
+        self.avg_gain = None
+        self.avg_loss = None
+
+    @property
+    def seeded(self) -> bool:
+        return self.prev_close is not None
+
+    def seed(self, closes):
+        """Seed from the history closes; the last value is the still-forming bar"""
+        closes = np.asarray(closes, dtype=float)
+        closes = closes[~np.isnan(closes)]
+        if len(closes) < self.period + 2:
+            return False
+
+        deltas = np.diff(closes[:-1])
+        gains = np.clip(deltas, 0, None)
+        losses = np.clip(-deltas, 0, None)
+
+        avg_gain, avg_loss = gains[0], losses[0]
+        for gain, loss in zip(gains[1:], losses[1:]):
+            avg_gain += self.alpha * (gain - avg_gain)
+            avg_loss += self.alpha * (loss - avg_loss)
+
+        self.prev_close = float(closes[-2])
+        self.avg_gain = float(avg_gain)
+        self.avg_loss = float(avg_loss)
+        return True
+
+    def value(self, price: float) -> Optional[float]:
+        """RSI with `price` as close of the current bar"""
+        if not self.seeded:
+            return None
+        delta = price - self.prev_close
+        avg_gain = self.avg_gain + self.alpha * (max(delta, 0.0) - self.avg_gain)
+        avg_loss = self.avg_loss + self.alpha * (max(-delta, 0.0) - self.avg_loss)
+        if avg_loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+class TradingPipeline:
+    """Bounded asyncio queues between the tick, indicator, signal/risk and order stages"""
+
+    def __init__(self, db, market_state: Dict, executor, tick_queue_size: int = 1000,
+                 signal_queue_size: int = 100, order_queue_size: int = 20):
+        """
+        Args:
+            db: Database connection
+            market_state: Shared dict commodity -> latest market data (server.latest_market_data)
+            executor: Coroutine function (commodity_id, signal, market_data, settings) placing the order
+        """
+        self.db = db
+        self.market_state = market_state
+        self.executor = executor
+        self.ticks = asyncio.Queue(maxsize=tick_queue_size)
+        self.signals = asyncio.Queue(maxsize=signal_queue_size)
+        self.orders = asyncio.Queue(maxsize=order_queue_size)
+        self.rsi: Dict[str, IncrementalRSI] = {}
+        self.state = get_state_backend(db)  # Cooldowns und Trade-Zähler, geteilt über alle Worker
+        self.last_checked: Dict[str, datetime] = {}  # Lokale Sicht der Cooldowns (Engine.last_checked)
+        self._closing = set()  # Stop-Treffer, deren Schließung noch läuft
+        self._unpublished: Dict[str, Dict] = {}  # Neueste Tick-Marktdaten seit dem letzten Publish
+        self._tasks = []
+        self.stats = {"ticks": 0, "signals": 0, "rejected": 0, "orders": 0, "stops": 0, "last_latency_ms": None}
+
+    # ------------------------------------------------------------------
+    # Inputs
+    # ------------------------------------------------------------------
+    def seed(self, commodity_id: str, closes):
+        """(Re)seed the indicator state of a commodity from its history closes"""
+        rsi = self.rsi.setdefault(commodity_id, IncrementalRSI())
+        rsi.seed(closes)
+
+    async def submit_tick(self, commodity_id: str, price: float):
+        """Feed a new price - waits if the indicator stage is behind (backpressure)"""
+        await self.ticks.put((commodity_id, float(price), time.monotonic()))
+
+    # ------------------------------------------------------------------
+    # Stages
+    # ------------------------------------------------------------------
+    async def _indicator_stage(self):
+        while True:
+            commodity_id, price, received = await self.ticks.get()
+            try:
+                self.stats["ticks"] += 1
+                if price <= 0:
+                    continue
+                settings = await get_settings_service(self.db).get() or {}
+
+                # Per-tick stop monitoring: only the levels crossed by this price are visited
+                if settings.get('use_trailing_stop', False) and (
+                        not settings.get('respect_market_hours', True) or is_market_open(commodity_id)):
+                    await self._check_stops(commodity_id, price)
+
+                current = self.market_state.get(commodity_id)
+                rsi_state = self.rsi.get(commodity_id)
+                if current is None or rsi_state is None or not rsi_state.seeded:
+                    continue
+
+                rsi = rsi_state.value(price)
+                rsi_oversold = settings.get('rsi_oversold_threshold', 30.0)
+                rsi_overbought = settings.get('rsi_overbought_threshold', 70.0)
+
+                # Same signal rule as process_commodity_market_data
+                signal = "HOLD"
+                if rsi > rsi_overbought:
+                    signal = "SELL"
+                elif rsi < rsi_oversold:
+                    signal = "BUY"
+
+                sma_20 = current.get('sma_20') or price
+                market_data = dict(current)
+                market_data.update({
+                    "timestamp": datetime.now(timezone.utc),
+                    "price": price,
+                    "rsi": rsi,
+                    "trend": "UP" if price > sma_20 else "DOWN",
+                    "signal": signal,
+                })
+                self.market_state[commodity_id] = market_data
+                self._unpublished[commodity_id] = market_data
+
+                if signal in ('BUY', 'SELL'):
+                    self.stats["signals"] += 1
+                    await self.signals.put((commodity_id, signal, market_data, received))
+            except Exception as e:
+                logger.error(f"Indicator stage error for {commodity_id}: {e}")
+            finally:
+                self.ticks.task_done()
+
+    async def _publish_stage(self, interval_seconds: float = PUBLISH_INTERVAL_SECONDS):
+        """Write the latest tick market data to the shared table once per interval, not per tick"""
+        try:
+            while True:
+                await asyncio.sleep(interval_seconds)
+                await self._publish()
+        finally:
+            await self._publish()
+
+    async def _publish(self):
+        pending, self._unpublished = self._unpublished, {}
+        for commodity_id, market_data in pending.items():
+            try:
+                await self.state.put("market_data", commodity_id, market_data)
+            except Exception as e:
+                logger.error(f"Error publishing market data for {commodity_id}: {e}")
+
+    async def _check_stops(self, commodity_id: str, price: float):
+        book = await get_position_book(self.db)
+        hits = [(trade_id, reason) for trade_id, reason in book.stop_index.triggered(commodity_id, price)
+                if trade_id not in self._closing]
+        if not hits:
+            return
+
+        trades_to_close = [{'id': trade_id, 'reason': reason, 'exit_price': price} for trade_id, reason in hits]
+        self._closing.update(trade_id for trade_id, _ in hits)
+        self.stats["stops"] += len(hits)
+        logger.info(f"🛑 {commodity_id} @ {price}: {len(hits)} Stop(s) ausgelöst")
+        # Close in the background - the tick stage keeps running
+        asyncio.create_task(self._close(trades_to_close))
+
+    async def _close(self, trades_to_close):
+        try:
+            await close_triggered_trades(self.db, trades_to_close)
+        except Exception as e:
+            logger.error(f"Error closing triggered trades: {e}")
+        finally:
+            self._closing.difference_update(trade['id'] for trade in trades_to_close)
+
+    async def _risk_stage(self, validate):
+        while True:
+            commodity_id, signal, market_data, received = await self.signals.get()
+            try:
+                settings = await get_settings_service(self.db).get()
+                reason = await self._risk_check(commodity_id, signal, market_data, settings, validate)
+                if reason:
+                    self.stats["rejected"] += 1
+                    logger.debug(f"⏭️ {commodity_id} {signal}: {reason}")
+                    continue
+
+                # Reserve the slot now so signals queued behind this one are rejected
+                if not await take_slot(self.state, hour_key("trades_per_hour"),
+                                       settings.get('max_trades_per_hour', 3), ttl_seconds=7200):
+                    self.stats["rejected"] += 1
+                    logger.debug(f"⏭️ {commodity_id} {signal}: max_trades_per_hour erreicht")
+                    continue
+                now = datetime.now(timezone.utc)
+                self.last_checked[commodity_id] = now
+                await self.state.put("engine_cooldown", commodity_id, now)
+                await self.orders.put((commodity_id, signal, market_data, settings, received))
+            except Exception as e:
+                logger.error(f"Risk stage error for {commodity_id}: {e}")
+            finally:
+                self.signals.task_done()
+
+    async def _risk_check(self, commodity_id, signal, market_data, settings, validate) -> Optional[str]:
+        """Reason why the signal must not be traded, or None"""
+        if not settings or not settings.get('auto_trading'):
+            return "Auto-Trading deaktiviert"
+
+        if settings.get('respect_market_hours', True) and not is_market_open(commodity_id):
+            return "Markt geschlossen"
+
+        if not owned_commodities([commodity_id]):
+            return "Nicht im Shard dieses Workers"
+
+        if (await get_position_book(self.db)).has_open(commodity_id):
+            return "Bereits offener Trade vorhanden"
+
+        last_check = await self.state.get("engine_cooldown", commodity_id)
+        if last_check and (datetime.now(timezone.utc) - last_check).total_seconds() < SIGNAL_COOLDOWN_SECONDS:
+            return "Cooldown"
+
+        if not validate(market_data, signal, settings):
+            logger.info(f"⚠️ {commodity_id}: Signal {signal}, aber Bedingungen nicht erfüllt")
+            return "Bedingungen nicht erfüllt"
+
+        return None
+
+    async def _order_stage(self):
+        while True:
+            commodity_id, signal, market_data, settings, received = await self.orders.get()
+            try:
+                latency_ms = round((time.monotonic() - received) * 1000, 1)
+                self.stats["last_latency_ms"] = latency_ms
+                self.stats["orders"] += 1
+                logger.info(f"⚡ {commodity_id} {signal}: Tick → Order in {latency_ms}ms")
+                await self.executor(commodity_id, signal, market_data, settings)
+            except Exception as e:
+                logger.error(f"Order stage error for {commodity_id}: {e}")
+            finally:
+                self.orders.task_done()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self, validate):
+        """Start all stages; validate(market_data, signal, settings) is the final trade condition check"""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._indicator_stage()),
+            asyncio.create_task(self._risk_stage(validate)),
+            asyncio.create_task(self._order_stage()),
+            asyncio.create_task(self._publish_stage()),
+        ]
+        logger.info("⚡ Trading Pipeline gestartet (Tick → Indikator → Signal → Risiko → Order)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def status(self) -> Dict:
+        return {
+            **self.stats,
+            "running": bool(self._tasks),
+            "queues": {"ticks": self.ticks.qsize(), "signals": self.signals.qsize(), "orders": self.orders.qsize()},
+            "seeded": sorted(c for c, rsi in self.rsi.items() if rsi.seeded),
+        }
+
+
+async def fetch_live_tick(commodity_id: str) -> Optional[float]:
+    """Live price of a commodity from the connected MT5 platform (ICMarkets first)"""
+    from commodity_processor import COMMODITIES
+    from multi_platform_connector import multi_platform
+
+    commodity_info = COMMODITIES.get(commodity_id, {})
+    symbol = commodity_info.get('mt5_icmarkets_symbol') or commodity_info.get('mt5_libertex_symbol')
+    if not symbol:
+        return None
+
+    connector = None
+    if 'MT5_ICMARKETS' in multi_platform.platforms:
+        connector = multi_platform.platforms['MT5_ICMARKETS'].get('connector')
+    elif 'MT5_LIBERTEX' in multi_platform.platforms:
+        connector = multi_platform.platforms['MT5_LIBERTEX'].get('connector')
+    if not connector:
+        return None
+
+    tick = await connector.get_symbol_price(symbol)
+    return tick['price'] if tick else None
+
+
+# Global instance
+_trading_pipeline = None
+
+def get_trading_pipeline(db=None, market_state: Dict = None, executor=None) -> Optional[TradingPipeline]:
+    """Get or create the trading pipeline (created by the auto-trading engine)"""
+    global _trading_pipeline
+    if _trading_pipeline is None and db is not None and market_state is not None and executor is not None:
+        _trading_pipeline = TradingPipeline(db, market_state, executor)
+    return _trading_pipeline
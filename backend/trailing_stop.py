@@ -1,152 +1,56 @@
 """
 Trailing Stop Logic for Dynamic Stop Loss Management
+Trailing Stops werden für alle offenen Positionen auf einmal über
+NumPy-Arrays (PositionBook.as_arrays) berechnet. Angewendet und geschrieben
+werden sie im Position Sweep (position_sweep.py), ausgelöste Stops findet
+dort der sortierte Level-Index (PositionBook.stop_index).
 """
 
 import logging
-from typing import Dict, Optional
+from typing import Dict
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 
-async def update_trailing_stops(db, current_prices: Dict[str, float], settings):
-    """
-    Update trailing stops for all open positions
-    
-    Args:
-        db: Database connection
-        current_prices: Dict mapping commodity_id to current price
-        settings: Trading settings with trailing stop configuration
-    """
-    if not settings or not settings.get('use_trailing_stop', False):
-        return
-    
-    trailing_distance = settings.get('trailing_stop_distance', 1.5) / 100  # Convert % to decimal
-    
-    try:
-        # Get all open trades
-        open_trades = await db.trades.find({"status": "OPEN"}).to_list(1000)
-        
-        updated_count = 0
-        for trade in open_trades:
-            commodity = trade.get('commodity', 'WTI_CRUDE')
-            current_price = current_prices.get(commodity)
-            
-            if not current_price:
-                continue
-            
-            trade_type = trade.get('type')
-            entry_price = trade.get('entry_price')
-            current_stop_loss = trade.get('stop_loss')
-            
-            if not entry_price:
-                continue
-            
-            new_stop_loss = None
-            
-            # BUY Trade: Move stop loss UP if price moves UP
-            if trade_type == 'BUY':
-                # Calculate new trailing stop (below current price)
-                potential_stop = current_price * (1 - trailing_distance)
-                
-                # Only update if new stop is higher than current stop (or no stop set)
-                if not current_stop_loss or potential_stop > current_stop_loss:
-                    new_stop_loss = round(potential_stop, 2)
-            
-            # SELL Trade: Move stop loss DOWN if price moves DOWN
-            elif trade_type == 'SELL':
-                # Calculate new trailing stop (above current price)
-                potential_stop = current_price * (1 + trailing_distance)
-                
-                # Only update if new stop is lower than current stop (or no stop set)
-                if not current_stop_loss or potential_stop < current_stop_loss:
-                    new_stop_loss = round(potential_stop, 2)
-            
-            # Update stop loss if changed
-            if new_stop_loss and new_stop_loss != current_stop_loss:
-                await db.trades.update_one(
-                    {"id": trade['id']},
-                    {"$set": {"stop_loss": new_stop_loss}}
-                )
-                updated_count += 1
-                
-                logger.info(
-                    f"Trailing Stop updated for {commodity} {trade_type} trade: "
-                    f"Stop Loss {current_stop_loss or 'N/A'} -> {new_stop_loss} "
-                    f"(Price: {current_price}, Distance: {trailing_distance * 100:.1f}%)"
-                )
-        
-        if updated_count > 0:
-            logger.info(f"Updated {updated_count} trailing stops")
-    
-    except Exception as e:
-        logger.error(f"Error updating trailing stops: {e}")
+def price_vector(arrays: Dict, current_prices: Dict[str, float]) -> np.ndarray:
+    """Current price per open trade (NaN where no price is known)"""
+    by_commodity = np.array(
+        [current_prices.get(commodity) or np.nan for commodity in arrays['commodities']],
+        dtype=float
+    )
+    if len(by_commodity) == 0:
+        return np.empty(0)
+    return by_commodity[arrays['commodity_idx']]
 
 
-async def check_stop_loss_triggers(db, current_prices: Dict[str, float]):
+def compute_trailing_stops(arrays: Dict, prices: np.ndarray, trailing_distance: float):
     """
-    Check if any positions should be closed due to stop loss
-    
-    Args:
-        db: Database connection
-        current_prices: Dict mapping commodity_id to current price
-    
-    Returns:
-        List of trade IDs that should be closed
+    New trailing stop levels for all positions at once
+
+    BUY stops only move up, SELL stops only move down; positions without a
+    stop get one. Returns (indices of changed positions, new levels).
     """
-    try:
-        open_trades = await db.trades.find({"status": "OPEN"}).to_list(1000)
-        
-        trades_to_close = []
-        
-        for trade in open_trades:
-            commodity = trade.get('commodity', 'WTI_CRUDE')
-            current_price = current_prices.get(commodity)
-            
-            if not current_price:
-                continue
-            
-            trade_type = trade.get('type')
-            stop_loss = trade.get('stop_loss')
-            take_profit = trade.get('take_profit')
-            
-            # Check stop loss
-            if stop_loss:
-                if trade_type == 'BUY' and current_price <= stop_loss:
-                    trades_to_close.append({
-                        'id': trade['id'],
-                        'reason': 'STOP_LOSS',
-                        'exit_price': current_price
-                    })
-                    logger.info(f"Stop Loss triggered for {commodity} BUY: {current_price} <= {stop_loss}")
-                
-                elif trade_type == 'SELL' and current_price >= stop_loss:
-                    trades_to_close.append({
-                        'id': trade['id'],
-                        'reason': 'STOP_LOSS',
-                        'exit_price': current_price
-                    })
-                    logger.info(f"Stop Loss triggered for {commodity} SELL: {current_price} >= {stop_loss}")
-            
-            # Check take profit
-            if take_profit:
-                if trade_type == 'BUY' and current_price >= take_profit:
-                    trades_to_close.append({
-                        'id': trade['id'],
-                        'reason': 'TAKE_PROFIT',
-                        'exit_price': current_price
-                    })
-                    logger.info(f"Take Profit triggered for {commodity} BUY: {current_price} >= {take_profit}")
-                
-                elif trade_type == 'SELL' and current_price <= take_profit:
-                    trades_to_close.append({
-                        'id': trade['id'],
-                        'reason': 'TAKE_PROFIT',
-                        'exit_price': current_price
-                    })
-                    logger.info(f"Take Profit triggered for {commodity} SELL: {current_price} <= {take_profit}")
-        
-        return trades_to_close
-    
-    except Exception as e:
-        logger.error(f"Error checking stop loss triggers: {e}")
-        return []
+    is_buy, is_sell = arrays['is_buy'], arrays['is_sell']
+    stop_loss = arrays['stop_loss']
+
+    with np.errstate(invalid='ignore'):
+        potential = np.where(is_buy, prices * (1 - trailing_distance), prices * (1 + trailing_distance))
+        new_stop = np.round(potential, 2)
+
+        has_stop = ~np.isnan(stop_loss)
+        improves = np.where(is_buy, potential > stop_loss, potential < stop_loss)
+
+        changed = (
+            (is_buy | is_sell)
+            & (prices > 0)  # False for NaN
+            & (arrays['entry_price'] > 0)
+            & (~has_stop | improves)
+            & (new_stop != 0)
+            & (new_stop != stop_loss)
+        )
+
+    indices = np.flatnonzero(changed)
+    return indices, new_stop[indices]
+
@@ -21,10 +21,14 @@ async def update_settings():
     # Update settings
     result = await db.trading_settings.update_one(
         {"id": "trading_settings"},
-        {"$set": {
-            "enabled_commodities": ["GOLD", "SILVER", "PLATINUM", "PALLADIUM", "WTI_CRUDE", "BRENT_CRUDE", "NATURAL_GAS", "WHEAT", "CORN", "SOYBEANS", "COFFEE", "SUGAR", "COTTON", "COCOA"],
-            "mode": "MT5"
-        }}
+        {
+            "$set": {
+                "enabled_commodities": ["GOLD", "SILVER", "PLATINUM", "PALLADIUM", "WTI_CRUDE", "BRENT_CRUDE", "NATURAL_GAS", "WHEAT", "CORN", "SOYBEANS", "COFFEE", "SUGAR", "COTTON", "COCOA"],
+                "mode": "MT5"
+            },
+            # Versionszähler erhöhen, damit laufende Server den Settings-Cache neu laden
+            "$inc": {"version": 1}
+        }
     )
     
     print(f"\n✅ Settings aktualisiert!")
@@ -0,0 +1,307 @@
+"""
+Walk-Forward Optimierung - robuste Strategie-Parameter statt Kurvenanpassung
+Für jedes Fenster werden die Parameter auf dem In-Sample-Zeitraum optimiert
+(strategy_optimizer) und die beste Kombination auf dem direkt folgenden
+Out-of-Sample-Zeitraum getestet; danach rollt das Fenster um die
+Out-of-Sample-Länge weiter.
+
+- Die Fenstergrenzen liegen auf festen Vielfachen der Out-of-Sample-Länge
+  (Epoch-basiert). Wandert der Datenzeitraum weiter, bleiben die alten
+  Fenster identisch; nur vollständige Fenster werden ausgewertet
+- Alle offenen Fenster laufen parallel auf einem gemeinsamen Prozess-Pool
+  über denselben memory-mapped Kursdaten
+- Jedes fertige Fenster wird gecacht (Schlüssel: Einstellungen + Prüfsumme der
+  Kerzen im Fenster). Ein erneuter Lauf mit einem zusätzlichen Fenster
+  rechnet nur das neue Fenster
+
+CLI:
+    python walk_forward.py --commodities GOLD SILVER --in-sample-days 180 --out-of-sample-days 30
+    python walk_forward.py --commodities GOLD --apply   # Empfehlung in die Trading Settings übernehmen
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from backtester import STRATEGY_PARAMS, METRICS, SIGNAL_RULES, strategy_params, load_candles
+from strategy_optimizer import (
+    DEFAULT_SPACE, SharedPriceArrays, build_combinations, rank_results, open_pool, evaluate_combinations,
+)
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+DEFAULT_CACHE_DIR = Path(__file__).parent / "cache" / "walk_forward"
+CACHE_VERSION = 1
+
+
+def walk_forward_windows(first: float, last: float, in_sample_days: float, out_of_sample_days: float) -> List[Dict]:
+    """Complete rolling windows between the first and last candle time (epoch seconds)"""
+    step = out_of_sample_days * DAY
+    in_sample = in_sample_days * DAY
+    windows = []
+    k = math.ceil((first + in_sample) / step)
+    while (k + 1) * step <= last:
+        oos_start = k * step
+        windows.append({
+            "in_sample": (oos_start - in_sample, oos_start),
+            "out_of_sample": (oos_start, oos_start + step),
+        })
+        k += 1
+    return windows
+
+
+class WindowCache:
+    """Finished windows as JSON files, one per cache key"""
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or os.environ.get('WALK_FORWARD_CACHE_DIR', DEFAULT_CACHE_DIR))
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Walk-forward cache entry {key} unreadable: {e}")
+            return None
+
+    def put(self, key: str, value: Dict):
+        # Write-then-rename: an interrupted run never leaves a half-written entry
+        tmp = self._path(key).with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp, self._path(key))
+
+
+def _window_key(config: Dict, window: Dict, candles: Dict[str, Dict[str, np.ndarray]]) -> str:
+    """Cache key: run configuration, window bounds and a checksum of the candles inside the window"""
+    digest = hashlib.sha1(json.dumps({**config, "window": window, "v": CACHE_VERSION}, sort_keys=True).encode())
+    start, end = window["in_sample"][0], window["out_of_sample"][1]
+    for commodity_id in sorted(candles):
+        data = candles[commodity_id]
+        i, j = np.searchsorted(data["time"], (start, end), side="left")
+        digest.update(commodity_id.encode())
+        for field in ("time", "open", "high", "low", "close"):
+            digest.update(np.ascontiguousarray(data[field][i:j], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).date().isoformat()
+
+
+def summarize(windows: List[Dict], in_sample_days: float, out_of_sample_days: float) -> Dict:
+    """Compounded out-of-sample result, walk-forward efficiency and the recommended parameters"""
+    evaluated = [w for w in windows if w.get("params")]
+    if not evaluated:
+        return {"windows": len(windows), "evaluated": 0, "recommended": None}
+
+    oos_returns = [w["out_of_sample"]["total_return_pct"] for w in evaluated]
+    is_returns = [w["in_sample"]["total_return_pct"] for w in evaluated]
+    compounded = float(np.prod([1 + r / 100 for r in oos_returns]) - 1) * 100
+
+    # Out-of-sample return per day relative to in-sample return per day
+    is_per_day = statistics.mean(is_returns) / in_sample_days
+    efficiency = (statistics.mean(oos_returns) / out_of_sample_days) / is_per_day if is_per_day > 0 else None
+
+    return {
+        "windows": len(windows),
+        "evaluated": len(evaluated),
+        "out_of_sample_return_pct": round(compounded, 4),
+        "out_of_sample_trades": sum(w["out_of_sample"]["trades"] for w in evaluated),
+        "profitable_windows": sum(1 for r in oos_returns if r > 0),
+        "walk_forward_efficiency": round(efficiency, 4) if efficiency is not None else None,
+        # The latest window's optimum is what would be deployed now; the median shows how stable it is
+        "recommended": evaluated[-1]["params"],
+        "median_params": {key: statistics.median(w["params"][key] for w in evaluated) for key in STRATEGY_PARAMS},
+    }
+
+
+def walk_forward(candles: Dict[str, Dict[str, np.ndarray]], in_sample_days: float = 180, out_of_sample_days: float = 30,
+                 space: Optional[Dict[str, List[float]]] = None, base: Optional[Dict[str, float]] = None,
+                 method: str = "grid", samples: int = 200, metrics: Iterable[str] = ("sharpe", "total_return_pct"),
+                 min_trades: int = 10, rule: str = "rsi", use_trailing: bool = False, workers: Optional[int] = None,
+                 seed: int = 0, cache_dir=None) -> Dict:
+    """Optimize on every in-sample window, test on the following out-of-sample window"""
+    metrics = list(metrics)
+    space = space or DEFAULT_SPACE
+    base = base or strategy_params()
+    combinations = build_combinations(space, base, method, samples, use_trailing, seed)
+    if not combinations:
+        raise ValueError("No valid parameter combinations")
+
+    times = [data["time"] for data in candles.values() if len(data["time"])]
+    windows = walk_forward_windows(min(t[0] for t in times), max(t[-1] for t in times), in_sample_days, out_of_sample_days)
+    if not windows:
+        raise ValueError(f"Not enough history for {in_sample_days} + {out_of_sample_days} days")
+
+    config = {
+        "combinations": combinations, "metrics": metrics, "min_trades": min_trades,
+        "rule": rule, "use_trailing": use_trailing,
+    }
+    cache = WindowCache(cache_dir)
+    keys = [_window_key(config, window, candles) for window in windows]
+    results: List[Optional[Dict]] = [cache.get(key) for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    started = time.monotonic()
+    if pending:
+        with SharedPriceArrays(candles) as arrays, open_pool(arrays, workers) as executor:
+            # All pending windows at once: the pool stays busy across window boundaries
+            in_sample_futures = {
+                i: evaluate_combinations(executor, combinations, rule, use_trailing,
+                                         window=windows[i]["in_sample"], workers=workers)
+                for i in pending
+            }
+            out_of_sample_futures = {}
+            best = {}
+            for i in pending:
+                ranked = rank_results([r for future in in_sample_futures[i] for r in future.result()], metrics, min_trades)
+                if ranked:
+                    best[i] = ranked[0]
+                    out_of_sample_futures[i] = evaluate_combinations(
+                        executor, [ranked[0]["params"]], rule, use_trailing,
+                        window=windows[i]["out_of_sample"], chunk_size=1
+                    )[0]
+
+            for i in pending:
+                window = windows[i]
+                entry = {
+                    "in_sample_window": [_iso(t) for t in window["in_sample"]],
+                    "out_of_sample_window": [_iso(t) for t in window["out_of_sample"]],
+                    "params": None,
+                }
+                if i in best:
+                    out_of_sample = out_of_sample_futures[i].result()[0]
+                    entry.update({
+                        "params": best[i]["params"],
+                        "in_sample": best[i]["portfolio"],
+                        "out_of_sample": out_of_sample["portfolio"],
+                        "out_of_sample_commodities": out_of_sample["commodities"],
+                    })
+                results[i] = entry
+                cache.put(keys[i], entry)
+    duration = round(time.monotonic() - started, 2)
+
+    logger.info(f"📈 Walk-Forward: {len(windows)} Fenster, {len(pending)} neu berechnet, "
+                f"{len(windows) - len(pending)} aus dem Cache ({duration}s)")
+    return {
+        "in_sample_days": in_sample_days,
+        "out_of_sample_days": out_of_sample_days,
+        "method": method,
+        "rule": rule,
+        "use_trailing_stop": use_trailing,
+        "metrics": metrics,
+        "combinations": len(combinations),
+        "computed": len(pending),
+        "cached": len(windows) - len(pending),
+        "duration_seconds": duration,
+        "summary": summarize(results, in_sample_days, out_of_sample_days),
+        "windows": results,
+    }
+
+
+async def run_walk_forward(commodity_ids: List[str], timeframe: str = "1h", period: str = "2y", **kwargs) -> Dict:
+    """Load candles, then run the walk-forward off the event loop"""
+    candles = await load_candles(commodity_ids, timeframe, period)
+    if not candles:
+        raise ValueError("No candles for the requested commodities")
+    result = await asyncio.to_thread(walk_forward, candles, **kwargs)
+    result.update({"timeframe": timeframe, "period": period, "commodities": sorted(candles)})
+    return result
+
+
+async def apply_recommendation(params: Dict[str, float], use_trailing: bool):
+    """Write the recommended parameters into the trading settings"""
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from settings_service import get_settings_service
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    try:
+        db = client[os.environ['DB_NAME']]
+        fields = {key: params[key] for key in STRATEGY_PARAMS if key != "trailing_stop_distance" or use_trailing}
+        await get_settings_service(db).update(fields)
+        logger.info(f"✅ Trading Settings aktualisiert: {fields}")
+    finally:
+        client.close()
+
+
+async def _main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Walk-Forward Optimierung der Strategie-Parameter")
+    parser.add_argument("--commodities", nargs="+", default=["WTI_CRUDE"])
+    parser.add_argument("--timeframe", default="1h")
+    parser.add_argument("--period", default="2y")
+    parser.add_argument("--in-sample-days", type=float, default=180)
+    parser.add_argument("--out-of-sample-days", type=float, default=30)
+    parser.add_argument("--rule", choices=SIGNAL_RULES, default="rsi")
+    parser.add_argument("--trailing", action="store_true", help="Trailing Stop verwenden (und dessen Abstand optimieren)")
+    parser.add_argument("--method", choices=("grid", "random"), default="grid")
+    parser.add_argument("--samples", type=int, default=200, help="Stichproben bei --method random")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--space", type=json.loads, default=None,
+                        help='Suchraum als JSON, z.B. \'{"stop_loss_percent": [1, 2, 3]}\'')
+    parser.add_argument("--metrics", nargs="+", choices=METRICS, default=["sharpe", "total_return_pct"])
+    parser.add_argument("--min-trades", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None, help="Prozesse (Standard: alle Kerne)")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--apply", action="store_true", help="Empfohlene Parameter in die Trading Settings schreiben")
+    args = parser.parse_args()
+
+    result = await run_walk_forward(
+        args.commodities, args.timeframe, args.period,
+        in_sample_days=args.in_sample_days, out_of_sample_days=args.out_of_sample_days,
+        space=args.space, method=args.method, samples=args.samples, metrics=args.metrics,
+        min_trades=args.min_trades, rule=args.rule, use_trailing=args.trailing,
+        workers=args.workers, seed=args.seed, cache_dir=args.cache_dir,
+    )
+
+    print("=" * 80)
+    print(f"WALK-FORWARD: {', '.join(result['commodities'])}, {args.in_sample_days:g}d In-Sample / "
+          f"{args.out_of_sample_days:g}d Out-of-Sample, {result['combinations']} Kombinationen")
+    print(f"{result['computed']} Fenster berechnet, {result['cached']} aus dem Cache ({result['duration_seconds']}s)")
+    print("=" * 80)
+    for window in result["windows"]:
+        oos_start, oos_end = window["out_of_sample_window"]
+        if not window["params"]:
+            print(f"  {oos_start} – {oos_end}: keine Kombination mit min. {args.min_trades} Trades")
+            continue
+        print(f"  {oos_start} – {oos_end}: IS {window['in_sample']['total_return_pct']:>8}%  "
+              f"OOS {window['out_of_sample']['total_return_pct']:>8}% ({window['out_of_sample']['trades']} Trades)")
+
+    summary = result["summary"]
+    if not summary["recommended"]:
+        print("\nKeine Empfehlung möglich.")
+        return
+    print(f"\nOut-of-Sample gesamt: {summary['out_of_sample_return_pct']}% "
+          f"({summary['profitable_windows']}/{summary['evaluated']} Fenster im Plus), "
+          f"Walk-Forward-Effizienz {summary['walk_forward_efficiency']}")
+    print(f"Empfehlung (letztes Fenster): {summary['recommended']}")
+    print(f"Median über alle Fenster:     {summary['median_params']}")
+
+    if args.apply:
+        await apply_recommendation(summary["recommended"], args.trailing)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -17,6 +17,7 @@ import AIChat from '../components/AIChat';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const TRADES_PAGE_SIZE = 100; // Trade Historie: erste Seite sofort, weitere über "Mehr laden"
 
 // Configure axios defaults with timeout
 axios.defaults.timeout = 10000; // 10 second timeout for all requests
@@ -29,7 +30,10 @@ const Dashboard = () => {
   const [historicalData, setHistoricalData] = useState([]);
   const [selectedCommodity, setSelectedCommodity] = useState(null); // For chart modal
   const [chartModalOpen, setChartModalOpen] = useState(false);
-  const [trades, setTrades] = useState([]);
+  const [tradeHistory, setTradeHistory] = useState({ trades: [], nextCursor: null }); // Loaded pages of /trades/list
+  const [loadingMoreTrades, setLoadingMoreTrades] = useState(false);
+  const [mt5Positions, setMt5Positions] = useState([]);
+  const [openTrades, setOpenTrades] = useState([]); // All open positions (DB + MT5) for exposure
   const [stats, setStats] = useState(null);
   const [settings, setSettings] = useState(null);
   const [balance, setBalance] = useState(10000); // Simulated balance
@@ -50,6 +54,8 @@ const Dashboard = () => {
   const [chartPeriod, setChartPeriod] = useState('1d'); // Default to 1 day for live trading
   const [chartModalData, setChartModalData] = useState([]);
 
+  const trades = [...tradeHistory.trades, ...mt5Positions];
+
   useEffect(() => {
     fetchAllData();
     
@@ -268,7 +274,6 @@ const Dashboard = () => {
   
   const calculateTotalExposure = () => {
     // Calculate actual exposure from open trades
-    const openTrades = trades.filter(t => t.status === 'OPEN');
     const exposure = openTrades.reduce((sum, trade) => {
       return sum + (trade.entry_price * trade.quantity);
     }, 0);
@@ -310,11 +315,38 @@ const Dashboard = () => {
     }
   };
 
+  const fetchTradePage = async (params) => {
+    const response = await axios.get(`${API}/trades/list`, {
+      params: { limit: TRADES_PAGE_SIZE, ...params }
+    });
+    return { trades: response.data.trades || [], nextCursor: response.data.next_cursor };
+  };
+
+  const fetchOpenDbTrades = async () => {
+    // Exposure and open positions need all of them - usually a single page
+    const openDbTrades = [];
+    let cursor = null;
+    do {
+      const page = await fetchTradePage({ status: 'OPEN', limit: 1000, ...(cursor ? { cursor } : {}) });
+      openDbTrades.push(...page.trades);
+      cursor = page.nextCursor;
+    } while (cursor);
+    return openDbTrades;
+  };
+
   const fetchTrades = async () => {
     try {
-      // Fetch database trades
-      const response = await axios.get(`${API}/trades/list`);
-      const dbTrades = response.data.trades || [];
+      // Trade Historie: only the first page, older pages on demand (loadMoreTrades)
+      const [firstPage, dbOpenTrades] = await Promise.all([fetchTradePage({}), fetchOpenDbTrades()]);
+      setTradeHistory(prev => {
+        // Keep pages loaded via "Mehr laden" - the refresh only replaces the first page
+        const firstIds = new Set(firstPage.trades.map(t => t.id));
+        const older = prev.trades.slice(TRADES_PAGE_SIZE).filter(t => !firstIds.has(t.id));
+        if (!firstPage.nextCursor || older.length === 0) {
+          return firstPage;
+        }
+        return { trades: [...firstPage.trades, ...older], nextCursor: prev.nextCursor };
+      });
       
       // Fetch MT5 positions from active platforms
       const mt5Positions = [];
@@ -373,13 +405,13 @@ const Dashboard = () => {
         }
       }
       
-      // Combine database trades with MT5 positions
-      const allTrades = [...dbTrades, ...mt5Positions];
-      setTrades(allTrades);
+      // Combine open database trades with MT5 positions
+      setMt5Positions(mt5Positions);
+      const allOpenTrades = [...dbOpenTrades, ...mt5Positions];
+      setOpenTrades(allOpenTrades);
       
       // Calculate exposure after loading trades
-      const openTrades = allTrades.filter(t => t.status === 'OPEN');
-      const exposure = openTrades.reduce((sum, trade) => {
+      const exposure = allOpenTrades.reduce((sum, trade) => {
         return sum + (trade.entry_price * trade.quantity);
       }, 0);
       setTotalExposure(exposure);
@@ -388,6 +420,19 @@ const Dashboard = () => {
     }
   };
 
+  const loadMoreTrades = async () => {
+    if (!tradeHistory.nextCursor || loadingMoreTrades) return;
+    setLoadingMoreTrades(true);
+    try {
+      const page = await fetchTradePage({ cursor: tradeHistory.nextCursor });
+      setTradeHistory(prev => ({ trades: [...prev.trades, ...page.trades], nextCursor: page.nextCursor }));
+    } catch (error) {
+      console.error('Error loading more trades:', error);
+    } finally {
+      setLoadingMoreTrades(false);
+    }
+  };
+
   const fetchStats = async () => {
     try {
       const response = await axios.get(`${API}/trades/stats`);
@@ -1128,6 +1173,19 @@ const Dashboard = () => {
                       })}
                     </tbody>
                   </table>
+                  {tradeHistory.nextCursor && (
+                    <div className="text-center mt-4">
+                      <Button
+                        onClick={loadMoreTrades}
+                        disabled={loadingMoreTrades}
+                        variant="outline"
+                        className="border-slate-600 hover:bg-slate-700"
+                        data-testid="load-more-trades"
+                      >
+                        {loadingMoreTrades ? 'Lädt...' : 'Mehr laden'}
+                      </Button>
+                    </div>
+                  )}
                 </div>
               )}
             </Card>
@@ -1339,7 +1397,7 @@ const Dashboard = () => {
 
               {/* Open Trades for this Asset */}
               {(() => {
-                const assetTrades = trades.filter(trade => 
+                const assetTrades = openTrades.filter(trade => 
                   trade.commodity === selectedCommodity.id && 
                   trade.status === 'OPEN'
                 );
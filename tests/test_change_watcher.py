@@ -0,0 +1,169 @@
+"""
+Change Watcher tests
+Die Replica-Set-Tests brauchen einen lokalen Single-Node Replica Set:
+    mongod --replSet rs0 --dbpath ~/data/db
+    mongosh --eval 'rs.initiate()'
+    CHANGE_WATCHER_TEST_MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0 pytest tests/test_change_watcher.py
+Ohne erreichbaren Replica Set werden sie übersprungen; die Fallback-Tests
+laufen ohne MongoDB.
+"""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from change_watcher import ChangeWatcher
+
+MONGO_URL = os.environ.get("CHANGE_WATCHER_TEST_MONGO_URL", "mongodb://localhost:27017/?replicaSet=rs0")
+
+
+async def _wait_for(condition, timeout: float = 10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not reached in time")
+        await asyncio.sleep(0.05)
+
+
+def _replica_set_available() -> bool:
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    try:
+        client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=1000)
+        try:
+            return "setName" in client.admin.command("hello")
+        finally:
+            client.close()
+    except PyMongoError:
+        return False
+
+
+requires_replica_set = pytest.mark.skipif(not _replica_set_available(), reason="no MongoDB replica set reachable")
+
+
+def _run_with_database(test):
+    """Run test(db, collection_name) against a throwaway database on the replica set"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(MONGO_URL, tz_aware=True)
+        name = f"change_watcher_test_{uuid.uuid4().hex[:8]}"
+        try:
+            db = client[name]
+            await db.create_collection("trades")  # Watching needs an existing collection on older servers
+            await test(db, "trades")
+        finally:
+            await client.drop_database(name)
+            client.close()
+
+    asyncio.run(main())
+
+
+@requires_replica_set
+def test_dispatches_changes_of_other_writers():
+    async def test(db, collection):
+        seen = []
+        watcher = ChangeWatcher(db, retry_delay=0.1)
+        watcher.register(collection, lambda change: seen.append(change["fullDocument"]["id"]))
+        assert await watcher.start()
+        try:
+            await _wait_for(lambda: watcher.active)
+            await asyncio.sleep(0.2)  # Stream open before the write
+            await db[collection].insert_one({"id": "t1"})
+            await _wait_for(lambda: seen == ["t1"])
+        finally:
+            await watcher.stop()
+        assert not watcher.active
+
+    _run_with_database(test)
+
+
+@requires_replica_set
+def test_resumes_after_interruption_without_missing_events():
+    async def test(db, collection):
+        seen = []
+        watcher = ChangeWatcher(db, retry_delay=0.1)
+        watcher.register(collection, lambda change: seen.append(change["fullDocument"]["id"]))
+        assert await watcher.start()
+        await asyncio.sleep(0.2)
+        await db[collection].insert_one({"id": "before"})
+        await _wait_for(lambda: seen == ["before"])
+        assert collection in watcher._resume_tokens
+
+        # Stream down: these writes happen while nobody is watching
+        await watcher.stop()
+        await db[collection].insert_one({"id": "during-1"})
+        await db[collection].update_one({"id": "during-1"}, {"$set": {"status": "CLOSED"}})
+
+        # Restart continues after the stored resume token
+        assert await watcher.start()
+        try:
+            await _wait_for(lambda: len(seen) == 3)
+        finally:
+            await watcher.stop()
+        assert seen == ["before", "during-1", "during-1"]
+
+    _run_with_database(test)
+
+
+class _StandaloneCollection:
+    def watch(self, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+
+class _StandaloneDatabase:
+    def __getitem__(self, name):
+        return _StandaloneCollection()
+
+
+def test_standalone_falls_back_to_polling():
+    statuses = []
+    watcher = ChangeWatcher(_StandaloneDatabase())
+    watcher.register("trades", lambda change: None)
+    watcher.on_status(statuses.append)
+
+    assert asyncio.run(watcher.start()) is False
+    assert watcher.active is False
+    assert watcher._tasks == []
+    assert statuses == []  # Caches keep their short polling intervals
+
+
+class _BrokenStream:
+    async def __aenter__(self):
+        raise OperationFailure("Resume of change stream was not possible", code=286)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _HistoryLostDatabase:
+    def __init__(self):
+        self.resume_after = []
+
+    def __getitem__(self, name):
+        return self
+
+    def watch(self, **kwargs):
+        self.resume_after.append(kwargs.get("resume_after"))
+        return _BrokenStream()
+
+
+def test_lost_history_restarts_without_resume_token():
+    async def main():
+        db = _HistoryLostDatabase()
+        watcher = ChangeWatcher(db, retry_delay=0.01)
+        watcher.register("trades", lambda change: None)
+        watcher._resume_tokens["trades"] = {"_data": "stale"}
+        task = asyncio.create_task(watcher._watch("trades"))
+        await _wait_for(lambda: len(db.resume_after) >= 2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return db.resume_after
+
+    resume_after = asyncio.run(main())
+    assert resume_after[0] == {"_data": "stale"}
+    assert resume_after[1] is None